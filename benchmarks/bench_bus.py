@@ -0,0 +1,121 @@
+"""
+bench_bus.py - End-to-end throughput of RtuMaster on a simulated RS-485 bus:
+transactions per second and bus utilisation at several baudrates, the
+throughput with noise on the line, and the time needed to talk again to a
+slave which stopped answering, with and without a SlaveHealth.
+Everything runs in real time, see modbus.simulator.
+
+Run from the root of the repository, with CPython or MicroPython:
+    python benchmarks/bench_bus.py
+"""
+
+import sys
+
+if "" not in sys.path:
+    sys.path.insert(0, "")
+
+from modbus import defines
+from modbus import modbus_rtu
+from modbus import utils
+from modbus.exceptions import ModbusInvalidResponseError
+from modbus.health import SlaveHealth
+from modbus.simulator import SimulatedBus
+
+REGISTERS = 10
+LATENCY_MS = 1
+DURATION_MS = 1000
+
+
+def make_bus(baudrate, timeout_ms=100):
+    """Returns a bus with the slaves 1 and 2, which have 100 holding registers"""
+    bus = SimulatedBus(baudrate, timeout_ms=timeout_ms, seed=1)
+    for slave_id in (1, 2):
+        slave = bus.add_slave(slave_id, LATENCY_MS)
+        slave.add_block("hr", defines.HOLDING_REGISTERS, 0, 100)
+    return bus
+
+
+def ideal_rate(baudrate):
+    """Transactions per second if the line was never idle longer than needed"""
+    char_us = 1000000 * 11 / baudrate
+    t35_us = 3.5 * utils.calculate_rtu_inter_char(baudrate) * 1000000
+    frame_us = (8 + 5 + 2 * REGISTERS) * char_us + max(LATENCY_MS * 1000, t35_us) + t35_us
+    return 1000000 / frame_us
+
+
+def poll(master, slaves, duration_ms):
+    """Read the slaves in turn for duration_ms. Returns (successes, failures, elapsed us)"""
+    successes = failures = 0
+    start = utils.ticks_us()
+    index = 0
+    while utils.ticks_diff(utils.ticks_us(), start) < duration_ms * 1000:
+        try:
+            master.execute(slaves[index % len(slaves)], defines.READ_HOLDING_REGISTERS, 0, REGISTERS)
+            successes += 1
+        except ModbusInvalidResponseError:
+            failures += 1
+        index += 1
+    return successes, failures, utils.ticks_diff(utils.ticks_us(), start)
+
+
+def bench_throughput():
+    print("{0:>8} {1:>12} {2:>12} {3:>12}".format("baudrate", "trans/s", "ideal/s", "utilisation"))
+    for baudrate in (9600, 19200, 115200):
+        bus = make_bus(baudrate)
+        master = modbus_rtu.RtuMaster(bus, baudrate=baudrate)
+        successes, _, elapsed = poll(master, (1, 2), DURATION_MS)
+        print("{0:>8} {1:>12.1f} {2:>12.1f} {3:>11.1f}%".format(
+            baudrate, successes * 1000000 / elapsed, ideal_rate(baudrate), 100 * bus.busy_us / elapsed))
+
+
+def bench_faults(baudrate=115200):
+    print("{0:>10} {1:>12} {2:>10} {3:>12}".format("noise", "trans/s", "failures", "crc errors"))
+    for noise_rate in (0, 0.0001, 0.001, 0.01):
+        bus = make_bus(baudrate, timeout_ms=20)
+        bus.set_faults(noise_rate=noise_rate)
+        master = modbus_rtu.RtuMaster(bus, baudrate=baudrate)
+        successes, failures, elapsed = poll(master, (1, 2), DURATION_MS)
+        print("{0:>10} {1:>12.1f} {2:>10} {3:>12}".format(
+            noise_rate, successes * 1000000 / elapsed, failures, bus.crc_errors))
+
+
+def bench_recovery(name, health, baudrate=115200, down_ms=1000):
+    """
+    Slave 2 stops answering for down_ms: print the throughput of slave 1
+    meanwhile and the time from the return of slave 2 to its first response
+    """
+    bus = make_bus(baudrate, timeout_ms=100)
+    master = modbus_rtu.RtuMaster(bus, baudrate=baudrate)
+    master.set_health(health)
+    bus.set_responding(2, False)
+    successes, _, elapsed = poll(master, (1, 2), down_ms)
+    bus.set_responding(2, True)
+
+    back = utils.ticks_us()
+    while True:
+        try:
+            master.execute(2, defines.READ_HOLDING_REGISTERS, 0, REGISTERS)
+            break
+        except ModbusInvalidResponseError:
+            pass
+        # keep on polling slave 1 like the other slaves of the bus would be
+        try:
+            master.execute(1, defines.READ_HOLDING_REGISTERS, 0, REGISTERS)
+        except ModbusInvalidResponseError:
+            pass
+    recovery = utils.ticks_diff(utils.ticks_us(), back)
+    print("{0:<24} {1:>12.1f} {2:>12.1f}".format(name, successes * 1000000 / elapsed, recovery / 1000))
+
+
+def main():
+    bench_throughput()
+    print("")
+    bench_faults()
+    print("")
+    print("{0:<24} {1:>12} {2:>12}".format("slave 2 down", "trans/s", "recovery ms"))
+    bench_recovery("UART timeout", None)
+    bench_recovery("SlaveHealth", SlaveHealth(max_timeout_ms=100, probe_interval_ms=250))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+bench_hooks.py - Cost of the hooks for a read transaction of RtuMaster,
+without any hook, with one global or per-master hook and with several hooks.
+The serial line is a stub answering immediately, so only the time spent in
+the master is measured.
+
+Run from the root of the repository, with CPython or MicroPython:
+    python benchmarks/bench_hooks.py
+"""
+
+import sys
+import struct
+
+if "" not in sys.path:
+    sys.path.insert(0, "")
+
+from modbus import crc
+from modbus import defines
+from modbus import hooks
+from modbus import modbus_rtu
+from modbus import utils
+
+MASTER_HOOKS = (
+    "modbus.Master.before_send", "modbus.Master.after_send", "modbus.Master.after_recv",
+    "modbus_rtu.RtuMaster.before_send", "modbus_rtu.RtuMaster.after_recv"
+)
+
+
+class StubSerial(object):
+    """A UART which answers every request with the same response"""
+
+    def __init__(self, response):
+        self._response = response
+        self._pos = len(response)
+
+    def any(self):
+        return len(self._response) - self._pos
+
+    def readinto(self, buf, nbytes):
+        data = self._response[self._pos:self._pos + nbytes]
+        buf[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+    def write(self, request):
+        self._pos = 0
+        return len(request)
+
+
+def make_response(slave, count):
+    """Returns the response to a read of count holding registers"""
+    frame = struct.pack(">BBB", slave, defines.READ_HOLDING_REGISTERS, 2 * count) + bytes(2 * count)
+    return frame + struct.pack("<H", crc.crc16(frame))
+
+
+def nop_hook(args):
+    """A hook which does nothing"""
+    return None
+
+
+def bench(name, master, count):
+    """Execute count transactions and print the time per transaction"""
+    execute = master.execute
+    start = utils.ticks_us()
+    for _ in range(count):
+        execute(1, defines.READ_HOLDING_REGISTERS, 0, 10)
+    elapsed = utils.ticks_diff(utils.ticks_us(), start)
+    print("{0:<28} {1:>10.1f} us/transaction".format(name, elapsed / count))
+
+
+def legacy_call_hooks(name, args):
+    """call_hooks as it was before the hook lists were bound by the modules"""
+    try:
+        for fct in hooks._HOOKS[name]:
+            retval = fct(args)
+            if retval is not None:
+                return retval
+    except KeyError:
+        pass
+    return None
+
+
+def bench_dispatch(count):
+    """Compare the cost of 5 hook points without any hook"""
+    bound = hooks.get_hooks("bench_hooks.empty")
+    local_hooks = {}
+
+    start = utils.ticks_us()
+    for _ in range(count):
+        for _ in range(5):
+            legacy_call_hooks("bench_hooks.missing", (None, ))
+    elapsed = utils.ticks_diff(utils.ticks_us(), start)
+    print("{0:<28} {1:>10.2f} us/transaction".format("legacy call_hooks x5", elapsed / count))
+
+    start = utils.ticks_us()
+    for _ in range(count):
+        for _ in range(5):
+            if bound or local_hooks:
+                hooks.call_hooks("bench_hooks.empty", (None, ), local_hooks)
+    elapsed = utils.ticks_diff(utils.ticks_us(), start)
+    print("{0:<28} {1:>10.2f} us/transaction".format("bound hook lists x5", elapsed / count))
+
+
+def main():
+    count = 2000
+    serial = StubSerial(make_response(1, 10))
+
+    bench("no hook", modbus_rtu.RtuMaster(serial), count)
+
+    hooks.install_hook("modbus.Master.before_send", nop_hook)
+    bench("1 global hook", modbus_rtu.RtuMaster(serial), count)
+    hooks.uninstall_hook("modbus.Master.before_send")
+
+    master = modbus_rtu.RtuMaster(serial, hooks={"modbus.Master.before_send": nop_hook})
+    bench("1 master hook", master, count)
+
+    for name in MASTER_HOOKS:
+        hooks.install_hook(name, nop_hook)
+    bench("5 global hooks", modbus_rtu.RtuMaster(serial), count)
+    for name in MASTER_HOOKS:
+        hooks.uninstall_hook(name)
+
+    master = modbus_rtu.RtuMaster(serial, hooks=dict((name, nop_hook) for name in MASTER_HOOKS))
+    bench("5 master hooks", master, count)
+
+    print("")
+    bench_dispatch(count)
+
+
+if __name__ == "__main__":
+    main()
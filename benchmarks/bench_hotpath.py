@@ -0,0 +1,281 @@
+"""
+bench_hotpath.py - Time and memory allocated per operation on the
+encode/decode path of a master: request building for every function code,
+RtuQuery.build_request and parse_response, the CRC, coil packing and
+unpacking, and whole transactions with and without hooks against a stub
+serial line.
+
+The bytes allocated are measured with gc.mem_alloc on MicroPython, with
+the garbage collector disabled, and with tracemalloc on CPython, which only
+gives the peak of the memory allocated during a call.
+
+The script must be run from the root of the repository benchmarked, which
+is where the modbus package is imported from, with CPython or the
+MicroPython unix port:
+    python benchmarks/bench_hotpath.py [--json] [--compare baseline.json]
+--json prints the results as JSON, to be saved and compared with the
+results of another commit with --compare. To benchmark an older commit,
+run this script from outside its checkout, from the root of the checkout:
+the operations which don't exist there (codecs, CoilBits, per-master
+hooks...) are skipped and listed on stderr. Commits before the const
+fallback of modbus.defines only import on MicroPython.
+"""
+
+import gc
+import json
+import struct
+import sys
+
+if "" not in sys.path:
+    sys.path.insert(0, "")
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from modbus import defines
+from modbus import hooks
+from modbus import modbus_rtu
+from modbus import utils
+
+# the modules and the stub serial line which older commits don't have
+try:
+    from modbus import crc
+except ImportError:
+    crc = None
+try:
+    from modbus.codecs import get_codec
+except ImportError:
+    get_codec = None
+try:
+    from modbus.coils import CoilBits
+except ImportError:
+    CoilBits = None
+try:
+    from bench_hooks import MASTER_HOOKS, StubSerial, nop_hook
+except ImportError:
+    StubSerial = None
+
+COUNT = 1000
+# the time of an operation is the best of REPEAT runs of COUNT calls
+REPEAT = 5
+ALLOC_COUNT = 200
+COILS = 1968
+
+# names of the operations which couldn't be measured
+_SKIPPED = []
+
+# (name, function code, starting_address, quantity_of_x, output_value) of the requests built
+REQUESTS = (
+    ("read coils", defines.READ_COILS, 0, COILS, 0),
+    ("read discrete inputs", defines.READ_DISCRETE_INPUTS, 0, 100, 0),
+    ("read holding registers", defines.READ_HOLDING_REGISTERS, 0, 125, 0),
+    ("read input registers", defines.READ_INPUT_REGISTERS, 0, 10, 0),
+    ("write single coil", defines.WRITE_SINGLE_COIL, 0, 0, 1),
+    ("write single register", defines.WRITE_SINGLE_REGISTER, 0, 0, 1234),
+    ("read exception status", defines.READ_EXCEPTION_STATUS, 0, 0, 0),
+    ("diagnostic", defines.DIAGNOSTIC, 0, 0, [0x12, 0x34]),
+    ("write multiple coils", defines.WRITE_MULTIPLE_COILS, 0, 0, [1, 0, 1] * (COILS // 3)),
+    ("write multiple registers", defines.WRITE_MULTIPLE_REGISTERS, 0, 0, list(range(123))),
+    ("report slave id", defines.REPORT_SLAVE_ID, 0, 0, 0),
+    ("read/write registers", defines.READ_WRITE_MULTIPLE_REGISTERS, 0, 10, list(range(10))),
+    ("read device id", defines.DEVICE_INFO, 0, getattr(defines, "READ_DEVICE_ID_BASIC", 1), 0),
+)
+
+
+def measure_time(fct, count):
+    """Returns the time of a call of fct in microseconds"""
+    fct()
+    best = -1
+    for _ in range(REPEAT):
+        start = utils.ticks_us()
+        for _ in range(count):
+            fct()
+        elapsed = utils.ticks_diff(utils.ticks_us(), start)
+        if best < 0 or elapsed < best:
+            best = elapsed
+    return best / count
+
+
+def measure_alloc(fct, count):
+    """Returns the bytes allocated by a call of fct, -1 if it can't be measured"""
+    fct()
+    if hasattr(gc, "mem_alloc"):
+        gc.collect()
+        gc.disable()
+        try:
+            start = gc.mem_alloc()
+            for _ in range(count):
+                fct()
+            return (gc.mem_alloc() - start) / count
+        finally:
+            gc.enable()
+    if tracemalloc is not None:
+        tracemalloc.start()
+        try:
+            total = 0
+            for _ in range(count):
+                tracemalloc.reset_peak()
+                start = tracemalloc.get_traced_memory()[0]
+                fct()
+                total += tracemalloc.get_traced_memory()[1] - start
+            return total / count
+        finally:
+            tracemalloc.stop()
+    return -1
+
+
+def skip(name, reason):
+    """An operation can't be measured with the modbus package benchmarked"""
+    _SKIPPED.append(name)
+    print("skipped {0}: {1}".format(name, reason), file=sys.stderr)
+
+
+def make_response(slave, count):
+    """Returns the response to a read of count holding registers"""
+    frame = struct.pack(">BBB", slave, defines.READ_HOLDING_REGISTERS, 2 * count) + bytes(2 * count)
+    return frame + struct.pack(">H", utils.calculate_crc(frame))
+
+
+def bench(results, name, fct, count=COUNT):
+    """Measure fct and add its results, unless it fails"""
+    try:
+        fct()
+    except Exception as excpt:
+        skip(name, repr(excpt))
+        return
+    results.append({
+        "name": name,
+        "us_per_op": measure_time(fct, count),
+        "bytes_per_op": measure_alloc(fct, ALLOC_COUNT),
+    })
+
+
+def bench_requests(results):
+    """Building of the request of every function code, with the RTU part"""
+    # the requests are only built
+    master = modbus_rtu.RtuMaster(None)
+    if not hasattr(master, "_build_frame"):
+        skip("build", "no Master._build_frame")
+        return
+    for (name, function_code, starting_address, quantity_of_x, output_value) in REQUESTS:
+        bench(results, "build " + name, lambda: master._build_frame(
+            1, function_code, starting_address, quantity_of_x, output_value, "", -1))
+
+
+def bench_query(results):
+    """RTU part of the requests and responses"""
+    query = modbus_rtu.RtuQuery()
+    pdu = struct.pack(">BHH", defines.READ_HOLDING_REGISTERS, 0, 10)
+    response = make_response(1, 10)
+    bench(results, "RtuQuery.build_request", lambda: query.build_request(pdu, 1))
+    bench(results, "RtuQuery.parse_response", lambda: query.parse_response(response))
+
+
+def bench_crc(results):
+    for size in (8, 256):
+        data = bytes(bytearray((i * 7) & 0xFF for i in range(size)))
+        bench(results, "calculate_crc {0} bytes".format(size), lambda: utils.calculate_crc(data))
+        if crc is not None:
+            bench(results, "check_crc {0} bytes".format(size), lambda: crc.check_crc(data))
+        else:
+            skip("check_crc", "no modbus.crc")
+
+
+def bench_coils(results):
+    """Packing of the coils written and unpacking of the coils read"""
+    if get_codec is None or CoilBits is None:
+        skip("coils", "no modbus.codecs or modbus.coils")
+        return
+    values = [1, 0, 1] * (COILS // 3)
+    bits = CoilBits.from_bools(values)
+    write_codec = get_codec(defines.WRITE_MULTIPLE_COILS)
+    read_codec = get_codec(defines.READ_COILS)
+    pdu = bytes(bytearray([defines.READ_COILS, len(bits.tobytes())])) + bits.tobytes()
+
+    bench(results, "pack {0} coils".format(COILS), lambda: write_codec.build_request(0, 0, values, ""))
+    bench(results, "pack {0} CoilBits".format(COILS), lambda: write_codec.build_request(0, 0, bits, ""))
+    bench(results, "unpack {0} coils".format(COILS), lambda: read_codec.decode_response(pdu, COILS, ""))
+    bench(results, "unpack {0} CoilBits".format(COILS), lambda: read_codec.decode_response(pdu, COILS, CoilBits))
+    bench(results, "CoilBits.from_bools", lambda: CoilBits.from_bools(values))
+    bench(results, "CoilBits.tolist", bits.tolist)
+
+
+def bench_transactions(results):
+    """Read transactions against a stub serial line, with and without hooks"""
+    if StubSerial is None:
+        skip("execute", "bench_hooks can't be imported")
+        return
+    serial = StubSerial(make_response(1, 10))
+
+    def transaction(master):
+        return lambda: master.execute(1, defines.READ_HOLDING_REGISTERS, 0, 10)
+
+    bench(results, "execute, no hook", transaction(modbus_rtu.RtuMaster(serial)))
+
+    try:
+        master = modbus_rtu.RtuMaster(serial, hooks=dict((name, nop_hook) for name in MASTER_HOOKS))
+    except TypeError:
+        skip("execute, 5 master hooks", "no per-master hooks")
+    else:
+        bench(results, "execute, 5 master hooks", transaction(master))
+
+    for name in MASTER_HOOKS:
+        hooks.install_hook(name, nop_hook)
+    try:
+        bench(results, "execute, 5 global hooks", transaction(modbus_rtu.RtuMaster(serial)))
+    finally:
+        for name in MASTER_HOOKS:
+            hooks.uninstall_hook(name)
+
+
+def run():
+    """Returns the results of all the benchmarks"""
+    results = []
+    bench_requests(results)
+    bench_query(results)
+    bench_crc(results)
+    bench_coils(results)
+    bench_transactions(results)
+    return {
+        "implementation": sys.implementation.name,
+        "version": ".".join([str(i) for i in sys.implementation.version[:3]]),
+        "alloc": "gc.mem_alloc" if hasattr(gc, "mem_alloc") else "tracemalloc peak",
+        "results": results,
+        "skipped": _SKIPPED,
+    }
+
+
+def print_results(report, baseline=None):
+    """Print the results, compared with the ones of baseline if any"""
+    previous = {}
+    if baseline is not None:
+        for result in baseline["results"]:
+            previous[result["name"]] = result
+    print("{0} {1}, bytes: {2}".format(report["implementation"], report["version"], report["alloc"]))
+    print("{0:<36} {1:>10} {2:>10} {3:>8} {4:>10}".format("operation", "us/op", "bytes/op", "time", "bytes"))
+    for result in report["results"]:
+        line = "{0:<36} {1:>10.2f} {2:>10.0f}".format(result["name"], result["us_per_op"], result["bytes_per_op"])
+        old = previous.get(result["name"])
+        if old is not None and old["us_per_op"] > 0:
+            line += " {0:>+7.0f}% {1:>+10d}".format(
+                100 * (result["us_per_op"] / old["us_per_op"] - 1),
+                int(round(result["bytes_per_op"] - old["bytes_per_op"])))
+        print(line)
+
+
+def main(args):
+    baseline = None
+    if "--compare" in args:
+        with open(args[args.index("--compare") + 1]) as baseline_file:
+            baseline = json.load(baseline_file)
+    report = run()
+    if "--json" in args:
+        print(json.dumps(report))
+    else:
+        print_results(report, baseline)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -12,10 +12,10 @@ https://creativecommons.org/publicdomain/zero/1.0/
 # import logging
 import machine
 import struct
-import time
 import modbus
 import modbus.defines as cst
 from modbus import modbus_rtu
+from modbus import scheduler
 
 
 # LOGGER = logging.getLogger("main")
@@ -48,6 +48,11 @@ def serial_prep(mode):
         raise ValueError("Given 'mode' does not have a defined action")
 
 
+def print_group(group):
+    for data in group.results:
+        print("{}: {}".format(group.name, data))
+
+
 def main():
     pin_cts.value(0)
 
@@ -57,18 +62,19 @@ def main():
                         stop=1, timeout=1000, timeout_char=50)
 
     # master = modbus_rtu.RtuMaster(uart)
-    master = modbus_rtu.RtuMaster(uart, serial_prep_cb=serial_prep)
+    master = modbus_rtu.RtuMaster(uart, serial_prep_cb=serial_prep, baudrate=19200)
 
     # print("Reading from register 0x00")
     # 'execute' returns a pair of 16-bit words
-    while True:
-        data1 = master.execute(1, cst.READ_HOLDING_REGISTERS, 0x00, 10)
-        print("data1: {}".format(data1))
-
-        # data2 = master.execute(2, cst.READ_HOLDING_REGISTERS, 0x00, 3)
-        # print("data2={}".format(data2))
-
-        time.sleep_ms(500)
+    group1 = scheduler.PollGroup(
+        "slave1", 500, [(1, cst.READ_HOLDING_REGISTERS, 0x00, 10)], callback=print_group)
+    # group2 = scheduler.PollGroup(
+    #     "slave2", 1000, [(2, cst.READ_HOLDING_REGISTERS, 0x00, 3)], callback=print_group)
+
+    polling = scheduler.Scheduler(master)
+    polling.add_group(group1)
+    # polling.add_group(group2)
+    polling.run()
 
     # Re-pack the pair of words into a single byte, then un-pack into a float
     # volts = struct.unpack('<f', struct.pack(
@@ -0,0 +1,164 @@
+"""
+micropython-modbus: Implementation of Modbus protocol for MicroPython
+https://gitlab.com/extel-open-source
+
+Based on "Modbus TestKit": https://github.com/ljean/modbus-tk
+
+Copyright (C) 2009, Luc Jean - luc.jean@gmail.com
+Copyright (C) 2009, Apidev - http://www.apidev.fr
+Copyright (C) 2018, Extel Technologies - https://gitlab.com/extel-open-source
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+import _thread
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+from modbus import defines
+from modbus import utils
+from modbus.exceptions import InvalidArgumentError
+
+# The broadcast address: slaves execute the request and don't answer
+BROADCAST_ADDRESS = 0
+
+# function codes which can be broadcast, and maximum quantity of a request
+_BROADCAST_FUNCTIONS = {
+    defines.WRITE_SINGLE_COIL: 1,
+    defines.WRITE_SINGLE_REGISTER: 1,
+    defines.WRITE_MULTIPLE_COILS: defines.MAX_WRITE_BITS,
+    defines.WRITE_MULTIPLE_REGISTERS: defines.MAX_WRITE_REGISTERS,
+}
+
+
+class BroadcastQueue(object):
+    """
+    Queue of writes sent to every slave at once, one frame per write instead of
+    one transaction per slave. send() sends the queued writes back-to-back:
+    RtuMaster spaces them by the 3.5 character silent interval when it knows
+    its baudrate, and delays the next unicast request by its broadcast
+    turnaround so that the slaves have processed them, see
+    RtuMaster.set_broadcast_turnaround. With an AsyncRtuMaster, use
+    async_send
+    """
+
+    def __init__(self, master, inter_frame_ms=0):
+        """
+        Constructor
+        inter_frame_ms is an additional delay between two broadcasts, for the
+        masters which don't know the silent interval of the bus
+        """
+        self._master = master
+        self._inter_frame_ms = inter_frame_ms
+        self._lock = _thread.allocate_lock()
+        # (function_code, starting_address, output_value) in the order of the calls
+        self._writes = []
+        # number of frames sent
+        self.frames_sent = 0
+
+    def write_coil(self, address, value):
+        """Queue the broadcast of a single coil"""
+        self.add(defines.WRITE_SINGLE_COIL, address, 1 if value else 0)
+
+    def write_register(self, address, value):
+        """Queue the broadcast of a single holding register"""
+        self.add(defines.WRITE_SINGLE_REGISTER, address, value)
+
+    def write_coils(self, address, values):
+        """Queue the broadcast of consecutive coils"""
+        self.add(defines.WRITE_MULTIPLE_COILS, address, values)
+
+    def write_registers(self, address, values):
+        """Queue the broadcast of consecutive holding registers"""
+        self.add(defines.WRITE_MULTIPLE_REGISTERS, address, values)
+
+    def add(self, function_code, starting_address, output_value):
+        """Queue a broadcast write. Only the write functions 5, 6, 15 and 16 can be broadcast"""
+        if function_code not in _BROADCAST_FUNCTIONS:
+            raise InvalidArgumentError("Function {0} can't be broadcast".format(function_code))
+        max_quantity = _BROADCAST_FUNCTIONS[function_code]
+        if max_quantity > 1:
+            output_value = list(output_value)
+            if not 0 < len(output_value) <= max_quantity:
+                raise InvalidArgumentError(
+                    "Broadcast of {0} values, 1 to {1} allowed".format(len(output_value), max_quantity))
+        with self._lock:
+            self._writes.append((function_code, starting_address, output_value))
+
+    def clear(self):
+        """Drop the queued writes"""
+        with self._lock:
+            del self._writes[:]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._writes)
+
+    def _next(self):
+        """Returns the first queued write, None if there isn't any"""
+        with self._lock:
+            return self._writes[0] if self._writes else None
+
+    def _sent(self, write):
+        """Remove a write which has been sent, unless clear dropped it meanwhile"""
+        with self._lock:
+            for index in range(len(self._writes)):
+                if self._writes[index] is write:
+                    del self._writes[index]
+                    break
+        self.frames_sent += 1
+
+    def send(self):
+        """
+        Send the queued writes in order and returns the number of frames sent
+        If a write fails, it and the following ones stay queued. See
+        async_send for the asynchronous masters
+        """
+        execute = self._master.execute
+        sent = 0
+        while True:
+            write = self._next()
+            if write is None:
+                break
+            if sent and self._inter_frame_ms:
+                utils.sleep_ms(self._inter_frame_ms)
+            (function_code, starting_address, output_value) = write
+            result = execute(BROADCAST_ADDRESS, function_code, starting_address, output_value=output_value)
+            if hasattr(result, "close"):
+                # a coroutine: a TcpMaster returns the response to unit id 0
+                # but a broadcast doesn't return anything else
+                result.close()
+                raise InvalidArgumentError("The master is asynchronous, use async_send")
+            self._sent(write)
+            sent += 1
+        return sent
+
+    async def async_send(self):
+        """Same as send, with an asynchronous master like AsyncRtuMaster"""
+        execute = self._master.execute
+        sent = 0
+        while True:
+            write = self._next()
+            if write is None:
+                break
+            if sent and self._inter_frame_ms:
+                await asyncio.sleep(self._inter_frame_ms / 1000)
+            (function_code, starting_address, output_value) = write
+            await execute(BROADCAST_ADDRESS, function_code, starting_address, output_value=output_value)
+            self._sent(write)
+            sent += 1
+        return sent
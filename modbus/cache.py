@@ -0,0 +1,289 @@
+"""
+micropython-modbus: Implementation of Modbus protocol for MicroPython
+https://gitlab.com/extel-open-source
+
+Based on "Modbus TestKit": https://github.com/ljean/modbus-tk
+
+Copyright (C) 2009, Luc Jean - luc.jean@gmail.com
+Copyright (C) 2009, Apidev - http://www.apidev.fr
+Copyright (C) 2018, Extel Technologies - https://gitlab.com/extel-open-source
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+import _thread
+
+from modbus import defines
+from modbus import utils
+from modbus.codecs import get_codec, get_format
+from modbus.coils import CoilBits
+
+DEFAULT_TTL_MS = 1000
+DEFAULT_MAX_ENTRIES = 32
+
+# The block type read by every function code cached, and the one written by
+# every write function code
+_READ_FUNCTIONS = (
+    defines.READ_COILS, defines.READ_DISCRETE_INPUTS, defines.READ_HOLDING_REGISTERS, defines.READ_INPUT_REGISTERS
+)
+_WRITE_FUNCTIONS = {
+    defines.WRITE_SINGLE_COIL: defines.READ_COILS,
+    defines.WRITE_MULTIPLE_COILS: defines.READ_COILS,
+    defines.WRITE_SINGLE_REGISTER: defines.READ_HOLDING_REGISTERS,
+    defines.WRITE_MULTIPLE_REGISTERS: defines.READ_HOLDING_REGISTERS,
+    defines.READ_WRITE_MULTIPLE_REGISTERS: defines.READ_HOLDING_REGISTERS,
+}
+
+
+class _RawFormat(object):
+    """data_format returning the bytes of a response"""
+
+    def unpack(self, data):
+        return bytes(data)
+
+
+_RAW = _RawFormat()
+
+
+class _Flight(object):
+    """A read in progress, which the identical requests wait for"""
+
+    def __init__(self):
+        self.lock = _thread.allocate_lock()
+        self.lock.acquire()
+        self.data = None
+        self.error = None
+
+
+class CachingMaster(object):
+    """
+    Read-through cache in front of Master.execute
+
+    The reads of coils, discrete inputs and registers are kept for a time to
+    live, and a read of a range included in a cached read is served from the
+    cache. Identical reads done at the same time from several threads are
+    collapsed into one transaction, and the writes done through the
+    CachingMaster invalidate the cached values they overlap. The calls to the
+    master are serialized, so it can be shared by several threads
+    """
+
+    def __init__(self, master, default_ttl_ms=DEFAULT_TTL_MS, max_entries=DEFAULT_MAX_ENTRIES):
+        """Constructor"""
+        self.master = master
+        self.default_ttl_ms = default_ttl_ms
+        self.max_entries = max_entries
+        # (slave, function code) -> list of (start, end, data, expiry ticks_ms)
+        # sorted by start
+        self._entries = {}
+        self._nb_of_entries = 0
+        self._ttl_rules = []
+        self._flights = {}
+        # bumped by every invalidation: a read started before isn't cached
+        self._generation = 0
+        self._lock = _thread.allocate_lock()
+        self._bus_lock = _thread.allocate_lock()
+        self.hits = 0
+        self.misses = 0
+        self.collapsed = 0
+
+    def set_ttl(self, slave, function_code, starting_address, quantity_of_x, ttl_ms):
+        """
+        Set the time to live of the reads of a range. slave None matches all
+        the slaves. When several ranges overlap a read, the shortest time is
+        used. 0 disables the cache for the range
+        """
+        with self._lock:
+            self._ttl_rules.append(
+                (slave, function_code, starting_address, starting_address + quantity_of_x, ttl_ms))
+
+    def _get_ttl(self, slave, function_code, start, end):
+        """Returns the time to live of a read"""
+        ttl_ms = None
+        for (rule_slave, rule_function, rule_start, rule_end, rule_ttl) in self._ttl_rules:
+            if ((rule_slave is None or rule_slave == slave) and rule_function == function_code
+                    and rule_start < end and start < rule_end):
+                if ttl_ms is None or rule_ttl < ttl_ms:
+                    ttl_ms = rule_ttl
+        return self.default_ttl_ms if ttl_ms is None else ttl_ms
+
+    def _lookup(self, slave, function_code, start, end, now):
+        """Returns the cached entry holding a range, None if there isn't any"""
+        entries = self._entries.get((slave, function_code))
+        if not entries:
+            return None
+        for entry in entries:
+            if entry[0] > start:
+                break
+            if entry[1] >= end and utils.ticks_diff(entry[3], now) > 0:
+                return entry
+        return None
+
+    def _store(self, slave, function_code, start, end, data, now):
+        """Cache the data of a read"""
+        ttl_ms = self._get_ttl(slave, function_code, start, end)
+        if ttl_ms <= 0:
+            return
+        key = (slave, function_code)
+        entries = self._entries.get(key, ())
+        # the entries expired or included in the new one are useless
+        kept = [entry for entry in entries
+                if utils.ticks_diff(entry[3], now) > 0 and not (start <= entry[0] and entry[1] <= end)]
+        self._nb_of_entries -= len(entries) - len(kept)
+        # _evict works on the lists of _entries
+        self._entries[key] = kept
+        while self._nb_of_entries >= self.max_entries:
+            self._evict()
+        index = 0
+        while index < len(kept) and kept[index][0] <= start:
+            index += 1
+        kept.insert(index, (start, end, data, utils.ticks_add(now, ttl_ms)))
+        self._entries[key] = kept
+        self._nb_of_entries += 1
+
+    def _evict(self):
+        """Remove the entry which expires first"""
+        oldest_key = None
+        oldest = None
+        for (key, entries) in self._entries.items():
+            for entry in entries:
+                if oldest is None or utils.ticks_diff(entry[3], oldest[3]) < 0:
+                    oldest_key = key
+                    oldest = entry
+        if oldest is None:
+            self._nb_of_entries = 0
+            return
+        entries = self._entries[oldest_key]
+        entries.remove(oldest)
+        self._nb_of_entries -= 1
+        if not entries:
+            del self._entries[oldest_key]
+
+    def invalidate(self, slave=None, function_code=None, starting_address=0, quantity_of_x=None):
+        """
+        Forget the cached reads overlapping a range. None matches all the
+        slaves, all the function codes or the whole address space
+        """
+        end = 0x10000 if quantity_of_x is None else starting_address + quantity_of_x
+        with self._lock:
+            self._generation += 1
+            for (key, entries) in list(self._entries.items()):
+                if (slave is None or key[0] == slave) and (function_code is None or key[1] == function_code):
+                    kept = [entry for entry in entries if not (entry[0] < end and starting_address < entry[1])]
+                    self._nb_of_entries -= len(entries) - len(kept)
+                    if kept:
+                        entries[:] = kept
+                    else:
+                        del self._entries[key]
+
+    def clear(self):
+        """Forget all the cached reads"""
+        self.invalidate()
+
+    def _decode(self, function_code, entry_start, data, start, quantity_of_x, data_format):
+        """Returns the result of a read from the cached data starting at entry_start"""
+        if function_code in (defines.READ_COILS, defines.READ_DISCRETE_INPUTS):
+            bits = CoilBits(8 * len(data), data)
+            data = bits[start - entry_start:start - entry_start + quantity_of_x].tobytes()
+            if not data_format and self.master.get_coil_bits():
+                data_format = CoilBits
+        else:
+            offset = 2 * (start - entry_start)
+            data = data[offset:offset + 2 * quantity_of_x]
+        pdu = bytearray(2 + len(data))
+        pdu[0] = function_code
+        pdu[1] = len(data)
+        pdu[2:] = data
+        return get_codec(function_code).decode_response(pdu, quantity_of_x, data_format)
+
+    def _read(self, slave, function_code, starting_address, quantity_of_x, data_format):
+        """Read through the cache"""
+        end = starting_address + quantity_of_x
+        key = (slave, function_code, starting_address, quantity_of_x)
+        leader = False
+        with self._lock:
+            entry = self._lookup(slave, function_code, starting_address, end, utils.ticks_ms())
+            if entry is not None:
+                self.hits += 1
+            else:
+                flight = self._flights.get(key)
+                if flight is None:
+                    leader = True
+                    flight = self._flights[key] = _Flight()
+                    generation = self._generation
+                    self.misses += 1
+                else:
+                    self.collapsed += 1
+        if entry is not None:
+            return self._decode(function_code, entry[0], entry[2], starting_address, quantity_of_x, data_format)
+
+        if leader:
+            try:
+                bits = function_code in (defines.READ_COILS, defines.READ_DISCRETE_INPUTS)
+                with self._bus_lock:
+                    result = self.master.execute(
+                        slave, function_code, starting_address, quantity_of_x, data_format=CoilBits if bits else _RAW)
+                flight.data = result.tobytes() if bits else result
+            except Exception as excpt:
+                flight.error = excpt
+                raise
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                    if flight.error is None and generation == self._generation:
+                        self._store(slave, function_code, starting_address, end, flight.data, utils.ticks_ms())
+                flight.lock.release()
+        else:
+            # wait for the end of the identical read
+            flight.lock.acquire()
+            flight.lock.release()
+            if flight.error is not None:
+                raise flight.error
+        return self._decode(function_code, starting_address, flight.data, starting_address, quantity_of_x, data_format)
+
+    def _get_write_range(self, function_code, starting_address, output_value, data_format, write_starting_address):
+        """Returns the (start, quantity) written by a request, quantity None if unknown"""
+        if function_code in (defines.WRITE_SINGLE_COIL, defines.WRITE_SINGLE_REGISTER):
+            return starting_address, 1
+        if function_code == defines.WRITE_MULTIPLE_COILS:
+            return starting_address, len(output_value)
+        if function_code == defines.WRITE_MULTIPLE_REGISTERS:
+            if output_value and data_format:
+                if isinstance(data_format, str):
+                    data_format = get_format(data_format)
+                return starting_address, data_format.size // 2
+            return starting_address, len(output_value)
+        if function_code == defines.READ_WRITE_MULTIPLE_REGISTERS:
+            return write_starting_address, len(output_value)
+        return 0, None
+
+    def execute(
+            self, slave, function_code, starting_address, quantity_of_x=0, output_value=0, data_format="", expected_length=-1,
+            write_starting_address_fc23=0):
+        """Same as Master.execute, through the cache"""
+        if function_code in _READ_FUNCTIONS and slave != 0 and expected_length < 0:
+            return self._read(slave, function_code, starting_address, quantity_of_x, data_format)
+
+        block_function = _WRITE_FUNCTIONS.get(function_code)
+        try:
+            with self._bus_lock:
+                return self.master.execute(
+                    slave, function_code, starting_address, quantity_of_x, output_value, data_format, expected_length,
+                    write_starting_address_fc23)
+        finally:
+            if block_function is not None:
+                # even a failed write may have been done by the slave
+                (start, quantity) = self._get_write_range(
+                    function_code, starting_address, output_value, data_format, write_starting_address_fc23)
+                self.invalidate(None if slave == 0 else slave, block_function, start, quantity)
@@ -0,0 +1,154 @@
+"""
+micropython-modbus: Implementation of Modbus protocol for MicroPython
+https://gitlab.com/extel-open-source
+
+Based on "Modbus TestKit": https://github.com/ljean/modbus-tk
+
+Copyright (C) 2009, Luc Jean - luc.jean@gmail.com
+Copyright (C) 2009, Apidev - http://www.apidev.fr
+Copyright (C) 2018, Extel Technologies - https://gitlab.com/extel-open-source
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+from modbus.exceptions import MissingKeyError, ModbusInvalidResponseError
+
+
+class _BlockImage(object):
+    """
+    Last image of the registers of a plan. It is the data_format of the
+    requests of the plan: it compares the response with the image, byte per
+    byte, and returns True if anything changed
+    """
+
+    def __init__(self, plan):
+        """Constructor"""
+        self.size = plan.size
+        self.image = bytearray(plan.size)
+        self._view = memoryview(self.image)
+        # byte offset and length of every tag of the plan
+        self._spans = tuple((2 * (tag.address - plan.starting_address), 2 * tag.count) for tag in plan.tags)
+        # 1 for the tags whose bytes have changed
+        self.changed = bytearray(len(plan.tags))
+        self.valid = False
+
+    def unpack(self, data):
+        """Update the image. Returns True if the data has changed"""
+        if len(data) != self.size:
+            raise ModbusInvalidResponseError(
+                "The block image expects {0} bytes and got {1}".format(self.size, len(data)))
+        image = self.image
+        changed = self.changed
+        if not self.valid:
+            for i in range(len(changed)):
+                changed[i] = 1
+        elif image == bytes(data):
+            # data is a memoryview, which MicroPython doesn't reliably
+            # compare with a bytearray
+            return False
+        else:
+            for (i, (offset, length)) in enumerate(self._spans):
+                changed[i] = 0
+                for j in range(offset, offset + length):
+                    if image[j] != data[j]:
+                        changed[i] = 1
+                        break
+        self._view[:] = data
+        self.valid = True
+        return True
+
+
+class ChangeDetector(object):
+    """
+    Report by exception: reads the tags of a RegisterMap and returns only the
+    ones which have changed since they were last reported
+
+    The last response of every block is kept as bytes: an unchanged block is
+    detected with a single comparison and isn't decoded, and only the tags
+    whose bytes have changed are compared with their last reported value.
+    The analog tags can have a deadband: they are only reported when they
+    have moved by more than it
+    """
+
+    def __init__(self, regmap):
+        """Constructor"""
+        self._regmap = regmap
+        self._plans = regmap._make_plans()
+        self._deadbands = {}
+        # slave -> images of the plans, values last reported
+        self._images = {}
+        self._reported = {}
+        # changes found by the last poll, reused by every poll
+        self.changes = {}
+
+    def set_deadband(self, name, deadband):
+        """A change of the tag is only reported when larger than deadband. 0 removes the deadband"""
+        self._regmap.index(name)
+        if deadband:
+            self._deadbands[name] = deadband
+        else:
+            self._deadbands.pop(name, None)
+
+    def reset(self, slave=None):
+        """Forget the images and values of a slave, or of all of them: every tag is reported again"""
+        if slave is None:
+            self._images.clear()
+            self._reported.clear()
+        else:
+            self._images.pop(slave, None)
+            self._reported.pop(slave, None)
+
+    def get_value(self, slave, name):
+        """Returns the last value reported for a tag"""
+        try:
+            return self._reported[slave][name]
+        except KeyError:
+            raise MissingKeyError("No value reported for the tag {0} of slave {1}".format(name, slave))
+
+    def poll(self, master, slave):
+        """
+        Read all the tags of slave. Returns a dictionary {name: value} of the
+        tags which have changed. It is reused by the next poll
+        """
+        changes = self.changes
+        changes.clear()
+        images = self._images.get(slave)
+        if images is None:
+            images = self._images[slave] = [_BlockImage(plan) for plan in self._plans]
+            self._reported[slave] = {}
+        reported = self._reported[slave]
+        deadbands = self._deadbands
+
+        for (plan, image) in zip(self._plans, images):
+            if not master.execute(slave, plan.function_code, plan.starting_address, plan.quantity, data_format=image):
+                continue
+            values = plan.unpack(image.image)
+            changed = image.changed
+            for (i, tag) in enumerate(plan.tags):
+                if not changed[i]:
+                    continue
+                name = tag.name
+                value = values[i]
+                last = reported.get(name)
+                if last is not None:
+                    deadband = deadbands.get(name)
+                    if deadband:
+                        if abs(value - last) <= deadband:
+                            continue
+                    elif value == last:
+                        continue
+                reported[name] = value
+                changes[name] = value
+        return changes
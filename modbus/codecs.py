@@ -0,0 +1,434 @@
+"""
+micropython-modbus: Implementation of Modbus protocol for MicroPython
+https://gitlab.com/extel-open-source
+
+Based on "Modbus TestKit": https://github.com/ljean/modbus-tk
+
+Copyright (C) 2009, Luc Jean - luc.jean@gmail.com
+Copyright (C) 2009, Apidev - http://www.apidev.fr
+Copyright (C) 2018, Extel Technologies - https://gitlab.com/extel-open-source
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+import struct
+
+from modbus import defines
+from modbus.coils import CoilBits
+from modbus.exceptions import (
+    DuplicatedKeyError, ModbusFunctionNotSupportedError, ModbusInvalidResponseError
+)
+
+try:
+    _Struct = struct.Struct
+except AttributeError:
+    # MicroPython
+    _Struct = None
+
+# Maximum number of formats kept by get_format
+MAX_CACHED_FORMATS = 64
+
+
+class Format(object):
+    """
+    A compiled struct format: pack, unpack and size, like struct.Struct which
+    doesn't exist on MicroPython. It can be passed as the data_format of
+    Master.execute
+    """
+
+    def __init__(self, fmt):
+        """Constructor"""
+        self.format = fmt
+        self.size = struct.calcsize(fmt)
+        if _Struct is not None:
+            compiled = _Struct(fmt)
+            self.pack = compiled.pack
+            self.pack_into = compiled.pack_into
+            self.unpack = compiled.unpack
+            self.unpack_from = compiled.unpack_from
+
+    def pack(self, *values):
+        return struct.pack(self.format, *values)
+
+    def pack_into(self, buffer, offset, *values):
+        struct.pack_into(self.format, buffer, offset, *values)
+
+    def unpack(self, data):
+        return struct.unpack(self.format, data)
+
+    def unpack_from(self, data, offset=0):
+        return struct.unpack_from(self.format, data, offset)
+
+
+_FORMATS = {}
+_REGISTER_FORMATS = {}
+
+
+def get_format(fmt):
+    """Returns the Format of a struct format string, from a cache"""
+    try:
+        return _FORMATS[fmt]
+    except KeyError:
+        if len(_FORMATS) >= MAX_CACHED_FORMATS:
+            _FORMATS.clear()
+        compiled = _FORMATS[fmt] = Format(fmt)
+        return compiled
+
+
+def registers_format(count):
+    """Returns the Format of count big endian unsigned registers"""
+    try:
+        return _REGISTER_FORMATS[count]
+    except KeyError:
+        compiled = Format(">" + count * "H")
+        if count <= defines.MAX_READ_REGISTERS:
+            _REGISTER_FORMATS[count] = compiled
+        return compiled
+
+
+def unpack(data_format, data):
+    """Unpack data with a struct format string or an object with an unpack method"""
+    if isinstance(data_format, str):
+        return get_format(data_format).unpack(data)
+    return data_format.unpack(data)
+
+
+_REQUEST_HEADER = Format(">BHH")
+_MULTIPLE_WRITE_HEADER = Format(">BHHB")
+_WRITE_RESPONSE = Format(">HH")
+_SIGNED_REGISTER = Format(">h")
+_UNSIGNED_REGISTER = Format(">H")
+
+
+def _pack_registers(pdu, offset, values):
+    """Write the registers values, signed or not, to the pdu"""
+    for value in values:
+        if value >= 0:
+            _UNSIGNED_REGISTER.pack_into(pdu, offset, value)
+        else:
+            _SIGNED_REGISTER.pack_into(pdu, offset, value)
+        offset += 2
+
+
+def _get_read_data(response_pdu):
+    """Returns the data of a response which starts with a byte count"""
+    byte_count = response_pdu[1]
+    data = response_pdu[2:]
+    if byte_count != len(data):
+        # the byte count in the pdu is invalid
+        raise ModbusInvalidResponseError(
+            "Byte count is {0} while actual number of bytes is {1}. ".format(byte_count, len(data)))
+    return data
+
+
+class Codec(object):
+    """
+    Builds the request pdu of a function code and decodes its response pdu
+
+    Subclass it and install it with register_codec to support other function
+    codes, vendor specific ones for example
+    """
+
+    def __init__(self, function_code):
+        """Constructor"""
+        self.function_code = function_code
+
+    def build_request(self, starting_address, quantity_of_x, output_value, data_format):
+        """Returns the request pdu for the arguments of Master.execute"""
+        raise NotImplementedError()
+
+    def get_response_length(self, quantity_of_x, output_value):
+        """Returns the length of the response pdu, -1 if it isn't known in advance"""
+        return -1
+
+    def decode_response(self, response_pdu, quantity_of_x, data_format):
+        """Returns the data of a response pdu which isn't an exception"""
+        raise NotImplementedError()
+
+
+class ReadBitsCodec(Codec):
+    """READ_COILS and READ_DISCRETE_INPUTS"""
+
+    def build_request(self, starting_address, quantity_of_x, output_value, data_format):
+        return _REQUEST_HEADER.pack(self.function_code, starting_address, quantity_of_x)
+
+    def get_response_length(self, quantity_of_x, output_value):
+        return 2 + ((quantity_of_x + 7) >> 3)
+
+    def decode_response(self, response_pdu, quantity_of_x, data_format):
+        data = _get_read_data(response_pdu)
+        if data_format is CoilBits:
+            return CoilBits(quantity_of_x, data)
+        if not data_format:
+            if len(data) < (quantity_of_x + 7) >> 3:
+                raise ModbusInvalidResponseError(
+                    "{0} bytes can't hold {1} bits".format(len(data), quantity_of_x))
+            return tuple((data[i >> 3] >> (i & 7)) & 1 for i in range(quantity_of_x))
+        # a user defined format: the bits of every value it unpacks
+        digits = []
+        for byte_val in unpack(data_format, data):
+            for i in range(8):
+                if len(digits) >= quantity_of_x:
+                    break
+                digits.append(byte_val % 2)
+                byte_val = byte_val >> 1
+        return tuple(digits)
+
+
+class ReadRegistersCodec(Codec):
+    """READ_HOLDING_REGISTERS and READ_INPUT_REGISTERS"""
+
+    def build_request(self, starting_address, quantity_of_x, output_value, data_format):
+        return _REQUEST_HEADER.pack(self.function_code, starting_address, quantity_of_x)
+
+    def get_response_length(self, quantity_of_x, output_value):
+        return 2 + 2 * quantity_of_x
+
+    def decode_response(self, response_pdu, quantity_of_x, data_format):
+        data = _get_read_data(response_pdu)
+        if not data_format:
+            return registers_format(quantity_of_x).unpack(data)
+        return unpack(data_format, data)
+
+
+class WriteSingleCoilCodec(Codec):
+    """WRITE_SINGLE_COIL"""
+
+    def build_request(self, starting_address, quantity_of_x, output_value, data_format):
+        return _REQUEST_HEADER.pack(self.function_code, starting_address, 0xff00 if output_value != 0 else 0)
+
+    def get_response_length(self, quantity_of_x, output_value):
+        return 5
+
+    def decode_response(self, response_pdu, quantity_of_x, data_format):
+        return unpack(data_format or _WRITE_RESPONSE, response_pdu[1:])
+
+
+class WriteSingleRegisterCodec(WriteSingleCoilCodec):
+    """WRITE_SINGLE_REGISTER"""
+
+    def build_request(self, starting_address, quantity_of_x, output_value, data_format):
+        pdu = bytearray(5)
+        _REQUEST_HEADER.pack_into(pdu, 0, self.function_code, starting_address, 0)
+        _pack_registers(pdu, 3, (output_value, ))
+        return pdu
+
+
+class ReadExceptionStatusCodec(Codec):
+    """READ_EXCEPTION_STATUS"""
+
+    _RESPONSE = Format(">B")
+
+    def build_request(self, starting_address, quantity_of_x, output_value, data_format):
+        return bytes((self.function_code, ))
+
+    def get_response_length(self, quantity_of_x, output_value):
+        return 2
+
+    def decode_response(self, response_pdu, quantity_of_x, data_format):
+        return self._RESPONSE.unpack(response_pdu[1:])
+
+
+class DiagnosticCodec(Codec):
+    """
+    DIAGNOSTIC: the sub-function code is passed as starting_address and its
+    data bytes as output_value. Returns the data bytes of the response
+    """
+
+    def build_request(self, starting_address, quantity_of_x, output_value, data_format):
+        return struct.pack(">BH", self.function_code, starting_address) + bytes(bytearray(output_value))
+
+    def get_response_length(self, quantity_of_x, output_value):
+        return 3 + len(output_value)
+
+    def decode_response(self, response_pdu, quantity_of_x, data_format):
+        # the sub-function code is echoed before the data
+        data = response_pdu[3:]
+        if not data_format:
+            return tuple(data)
+        return unpack(data_format, data)
+
+
+class WriteMultipleCoilsCodec(Codec):
+    """WRITE_MULTIPLE_COILS: output_value is a CoilBits or a sequence of bools"""
+
+    def build_request(self, starting_address, quantity_of_x, output_value, data_format):
+        if not isinstance(output_value, CoilBits):
+            output_value = CoilBits.from_bools(output_value)
+        coils = output_value.tobytes()
+        return _MULTIPLE_WRITE_HEADER.pack(
+            self.function_code, starting_address, len(output_value), len(coils)) + coils
+
+    def get_response_length(self, quantity_of_x, output_value):
+        return 5
+
+    def decode_response(self, response_pdu, quantity_of_x, data_format):
+        return unpack(data_format or _WRITE_RESPONSE, response_pdu[1:])
+
+
+class WriteMultipleRegistersCodec(Codec):
+    """
+    WRITE_MULTIPLE_REGISTERS: the values of output_value are packed with
+    data_format if given
+    """
+
+    def build_request(self, starting_address, quantity_of_x, output_value, data_format):
+        if output_value and data_format:
+            if isinstance(data_format, str):
+                data_format = get_format(data_format)
+            byte_count = data_format.size
+        else:
+            byte_count = 2 * len(output_value)
+        pdu = bytearray(6 + byte_count)
+        _MULTIPLE_WRITE_HEADER.pack_into(pdu, 0, self.function_code, starting_address, byte_count // 2, byte_count)
+        if output_value and data_format:
+            data_format.pack_into(pdu, 6, *output_value)
+        else:
+            _pack_registers(pdu, 6, output_value)
+        return pdu
+
+    def get_response_length(self, quantity_of_x, output_value):
+        return 5
+
+    def decode_response(self, response_pdu, quantity_of_x, data_format):
+        # the response is always 2 registers: the data address of the first
+        # register and the number of registers written
+        return _WRITE_RESPONSE.unpack(response_pdu[1:])
+
+
+class ReportSlaveIdCodec(Codec):
+    """
+    REPORT_SLAVE_ID: returns the bytes of the response (slave id, run
+    indicator status and additional data, which are device specific) or the
+    values unpacked with data_format
+    """
+
+    def build_request(self, starting_address, quantity_of_x, output_value, data_format):
+        return bytes((self.function_code, ))
+
+    def decode_response(self, response_pdu, quantity_of_x, data_format):
+        data = _get_read_data(response_pdu)
+        if not data_format:
+            return bytes(data)
+        return unpack(data_format, data)
+
+
+class ReadWriteMultipleRegistersCodec(Codec):
+    """
+    READ_WRITE_MULTIPLE_REGISTERS: the values of output_value are written
+    from write_starting_address, then quantity_of_x registers are read from
+    starting_address. Master passes write_starting_address as an extra
+    argument of build_request
+    """
+
+    _HEADER = Format(">BHHHHB")
+
+    def build_request(self, starting_address, quantity_of_x, output_value, data_format, write_starting_address=0):
+        pdu = bytearray(10 + 2 * len(output_value))
+        self._HEADER.pack_into(
+            pdu, 0, self.function_code, starting_address, quantity_of_x, write_starting_address,
+            len(output_value), 2 * len(output_value))
+        _pack_registers(pdu, 10, output_value)
+        return pdu
+
+    def get_response_length(self, quantity_of_x, output_value):
+        return 2 + 2 * quantity_of_x
+
+    def decode_response(self, response_pdu, quantity_of_x, data_format):
+        data = _get_read_data(response_pdu)
+        if not data_format:
+            return registers_format(quantity_of_x).unpack(data)
+        return unpack(data_format, data)
+
+
+class ReadDeviceIdentificationCodec(Codec):
+    """
+    DEVICE_INFO with the Read Device Identification MEI type: the first
+    object id is passed as starting_address and the read device id code as
+    quantity_of_x (READ_DEVICE_ID_BASIC if 0)
+
+    Returns a tuple (conformity level, more follows, next object id, objects)
+    where objects is a dictionary {object id: bytes}. See
+    Master.read_device_identification to read all the objects
+    """
+
+    _HEADER = Format(">BBBBBBB")
+
+    def build_request(self, starting_address, quantity_of_x, output_value, data_format):
+        return struct.pack(
+            ">BBBB", self.function_code, defines.MEI_READ_DEVICE_ID,
+            quantity_of_x or defines.READ_DEVICE_ID_BASIC, starting_address)
+
+    def decode_response(self, response_pdu, quantity_of_x, data_format):
+        if len(response_pdu) < 7:
+            raise ModbusInvalidResponseError("Response pdu length is invalid {0}".format(len(response_pdu)))
+        (function_code, mei_type, read_code, conformity_level, more_follows, next_object_id,
+         number_of_objects) = self._HEADER.unpack_from(response_pdu)
+        if mei_type != defines.MEI_READ_DEVICE_ID:
+            raise ModbusInvalidResponseError("Invalid MEI type {0}".format(mei_type))
+        objects = {}
+        offset = 7
+        for _ in range(number_of_objects):
+            if offset + 2 > len(response_pdu) or offset + 2 + response_pdu[offset + 1] > len(response_pdu):
+                raise ModbusInvalidResponseError("Device identification object {0} is truncated".format(
+                    len(objects)))
+            length = response_pdu[offset + 1]
+            objects[response_pdu[offset]] = bytes(response_pdu[offset + 2:offset + 2 + length])
+            offset += 2 + length
+        return conformity_level, more_follows, next_object_id, objects
+
+
+_CODECS = {}
+
+
+def register_codec(codec, replace=False):
+    """
+    Install the codec of its function code. Raises DuplicatedKeyError if the
+    function code already has a codec, unless replace is True
+    """
+    if codec.function_code in _CODECS and not replace:
+        raise DuplicatedKeyError("The function code {0} already has a codec".format(codec.function_code))
+    _CODECS[codec.function_code] = codec
+
+
+def unregister_codec(function_code):
+    """Remove the codec of a function code"""
+    _CODECS.pop(function_code, None)
+
+
+def get_codec(function_code):
+    """Returns the codec of a function code"""
+    try:
+        return _CODECS[function_code]
+    except KeyError:
+        raise ModbusFunctionNotSupportedError(
+            "The {0} function code is not supported. ".format(function_code))
+
+
+for _codec in (
+        ReadBitsCodec(defines.READ_COILS),
+        ReadBitsCodec(defines.READ_DISCRETE_INPUTS),
+        ReadRegistersCodec(defines.READ_HOLDING_REGISTERS),
+        ReadRegistersCodec(defines.READ_INPUT_REGISTERS),
+        WriteSingleCoilCodec(defines.WRITE_SINGLE_COIL),
+        WriteSingleRegisterCodec(defines.WRITE_SINGLE_REGISTER),
+        ReadExceptionStatusCodec(defines.READ_EXCEPTION_STATUS),
+        DiagnosticCodec(defines.DIAGNOSTIC),
+        WriteMultipleCoilsCodec(defines.WRITE_MULTIPLE_COILS),
+        WriteMultipleRegistersCodec(defines.WRITE_MULTIPLE_REGISTERS),
+        ReportSlaveIdCodec(defines.REPORT_SLAVE_ID),
+        ReadWriteMultipleRegistersCodec(defines.READ_WRITE_MULTIPLE_REGISTERS),
+        ReadDeviceIdentificationCodec(defines.DEVICE_INFO)):
+    register_codec(_codec)
@@ -0,0 +1,167 @@
+"""
+micropython-modbus: Implementation of Modbus protocol for MicroPython
+https://gitlab.com/extel-open-source
+
+Based on "Modbus TestKit": https://github.com/ljean/modbus-tk
+
+Copyright (C) 2009, Luc Jean - luc.jean@gmail.com
+Copyright (C) 2009, Apidev - http://www.apidev.fr
+Copyright (C) 2018, Extel Technologies - https://gitlab.com/extel-open-source
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+from modbus.exceptions import InvalidArgumentError
+
+
+class CoilBits(object):
+    """
+    Sequence of coils or discrete inputs stored as packed bits, in the order
+    of the Modbus frames: bit 0 of byte 0 is the first coil
+
+    Master.execute returns the result of READ_COILS and READ_DISCRETE_INPUTS
+    as a CoilBits when enabled with Master.set_coil_bits, and accepts one as
+    the output_value of WRITE_MULTIPLE_COILS
+    """
+
+    def __init__(self, count, data=None):
+        """
+        Constructor: count coils, all off, or the first count bits of the
+        packed bytes data, which are copied
+        """
+        byte_count = (count + 7) >> 3
+        if data is None:
+            self._data = bytearray(byte_count)
+        else:
+            if len(data) < byte_count:
+                raise InvalidArgumentError(
+                    "{0} bytes can't hold {1} coils".format(len(data), count))
+            self._data = bytearray(data[:byte_count])
+            if count & 7:
+                # the unused bits of the last byte must be 0
+                self._data[byte_count - 1] &= (1 << (count & 7)) - 1
+        self._count = count
+
+    @classmethod
+    def from_bools(cls, values):
+        """Returns the CoilBits of a sequence of values, set when true"""
+        bits = cls(len(values))
+        data = bits._data
+        index = 0
+        byte_value = 0
+        for value in values:
+            if value:
+                byte_value |= 1 << (index & 7)
+            index += 1
+            if not index & 7:
+                data[(index >> 3) - 1] = byte_value
+                byte_value = 0
+        if index & 7:
+            data[index >> 3] = byte_value
+        return bits
+
+    def tobytes(self):
+        """Returns the packed bits, as sent in a Modbus frame"""
+        return bytes(self._data)
+
+    def tolist(self):
+        """Returns the coils as a list of bools"""
+        values = []
+        append = values.append
+        count = self._count
+        index = 0
+        for byte_value in self._data:
+            for bit in range(8 if count - index >= 8 else count - index):
+                append(bool((byte_value >> bit) & 1))
+            index += 8
+        return values
+
+    def _index(self, item):
+        """Returns the index of the coil item, negative indexes count from the end"""
+        if item < 0:
+            item += self._count
+        if item < 0 or item >= self._count:
+            raise IndexError("coil index out of range")
+        return item
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            if item.step not in (None, 1):
+                raise InvalidArgumentError("Slices with a step are not supported")
+            count = self._count
+            start = 0 if item.start is None else item.start
+            stop = count if item.stop is None else item.stop
+            if start < 0:
+                start += count
+            if stop < 0:
+                stop += count
+            start = min(max(start, 0), count)
+            stop = min(max(stop, start), count)
+            return self._slice(start, stop)
+        item = self._index(item)
+        return bool((self._data[item >> 3] >> (item & 7)) & 1)
+
+    def __setitem__(self, item, value):
+        item = self._index(item)
+        if value:
+            self._data[item >> 3] |= 1 << (item & 7)
+        else:
+            self._data[item >> 3] &= ~(1 << (item & 7)) & 0xFF
+
+    def _slice(self, start, stop):
+        """Returns the coils from start to stop as a new CoilBits"""
+        count = stop - start
+        shift = start & 7
+        first = start >> 3
+        if not shift:
+            return CoilBits(count, self._data[first:first + ((count + 7) >> 3)])
+        bits = CoilBits(count)
+        data = self._data
+        out = bits._data
+        last = len(data) - 1
+        for i in range(len(out)):
+            index = first + i
+            value = data[index] >> shift
+            if index < last:
+                value |= (data[index + 1] << (8 - shift)) & 0xFF
+            out[i] = value
+        if count & 7:
+            out[-1] &= (1 << (count & 7)) - 1
+        return bits
+
+    def __iter__(self):
+        count = self._count
+        index = 0
+        for byte_value in self._data:
+            for bit in range(8 if count - index >= 8 else count - index):
+                yield bool((byte_value >> bit) & 1)
+            index += 8
+
+    def __eq__(self, other):
+        if isinstance(other, CoilBits):
+            return self._count == other._count and self._data == other._data
+        try:
+            return self._count == len(other) and self.tolist() == [bool(value) for value in other]
+        except TypeError:
+            return False
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return "CoilBits({0}, {1})".format(self._count, bytes(self._data))
@@ -0,0 +1,142 @@
+"""
+micropython-modbus: Implementation of Modbus protocol for MicroPython
+https://gitlab.com/extel-open-source
+
+Based on "Modbus TestKit": https://github.com/ljean/modbus-tk
+
+Copyright (C) 2009, Luc Jean - luc.jean@gmail.com
+Copyright (C) 2009, Apidev - http://www.apidev.fr
+Copyright (C) 2018, Extel Technologies - https://gitlab.com/extel-open-source
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+try:
+    from array import array
+except ImportError:
+    from uarray import array
+
+# Initial value of the Modbus CRC16
+CRC16_INIT = 0xFFFF
+
+
+def _make_tables():
+    """
+    Build the lookup tables of the reflected 0xA001 polynomial.
+    The first one steps the crc by one byte, the second one is used with
+    the first to step the crc by two bytes at once
+    """
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc >>= 1
+        table.append(crc)
+    table2 = [(table[i] >> 8) ^ table[table[i] & 0xFF] for i in range(256)]
+    return tuple(table), tuple(table2)
+
+
+_TABLE, _TABLE2 = _make_tables()
+
+
+def crc16_bytewise(data, crc=CRC16_INIT):
+    """
+    Fold data into crc one byte at a time
+    The result is in the wire order: the low byte is sent first
+    """
+    table = _TABLE
+    for c in data:
+        crc = (crc >> 8) ^ table[(c ^ crc) & 0xFF]
+    return crc
+
+
+def crc16_pairs(data, crc=CRC16_INIT):
+    """
+    Fold data into crc two bytes at a time
+    Same result as crc16_bytewise with half the loop iterations
+    """
+    table = _TABLE
+    table2 = _TABLE2
+    it = iter(data)
+    for low, high in zip(it, it):
+        x = crc ^ low ^ (high << 8)
+        crc = table2[x & 0xFF] ^ table[x >> 8]
+    if len(data) & 1:
+        crc = (crc >> 8) ^ table[(crc ^ data[-1]) & 0xFF]
+    return crc
+
+
+try:
+    # Native code is much faster than bytecode but the viper emitter is not
+    # available on every port, hence the separate module
+    from modbus.crc_viper import crc16_update as _crc16_native
+
+    # viper reads the table through a raw pointer so it needs a buffer
+    _TABLE_ARRAY = array("H", _TABLE)
+
+    def crc16_native(data, crc=CRC16_INIT):
+        """Fold data into crc with the viper implementation"""
+        return _crc16_native(data, len(data), crc, _TABLE_ARRAY)
+
+    crc16 = crc16_native
+except (ImportError, SyntaxError):
+    crc16_native = None
+    crc16 = crc16_bytewise
+
+
+def calculate_crc(data):
+    """
+    Calculate the CRC16 of a datagram
+    The result is byte swapped, so that packing it with ">H" gives the wire order
+    """
+    crc = crc16(data)
+    return ((crc & 0xFF) << 8) | (crc >> 8)
+
+
+def check_crc(frame):
+    """
+    Returns True if the frame ends with a valid CRC16
+    The CRC16 computed over a frame including its own CRC is 0, so the frame
+    doesn't need to be sliced
+    """
+    return len(frame) > 2 and crc16(frame) == 0
+
+
+class Crc16(object):
+    """Incremental CRC16, to fold the bytes of a frame in as they arrive"""
+
+    def __init__(self):
+        """Constructor"""
+        self.crc = CRC16_INIT
+
+    def reset(self):
+        """Start a new frame"""
+        self.crc = CRC16_INIT
+
+    def update(self, data):
+        """Fold data into the crc"""
+        self.crc = crc16(data, self.crc)
+
+    def value(self):
+        """Returns the crc of the data folded so far, like calculate_crc"""
+        crc = self.crc
+        return ((crc & 0xFF) << 8) | (crc >> 8)
+
+    def is_valid(self):
+        """Returns True if the data folded so far is a frame ending with its crc"""
+        return self.crc == 0
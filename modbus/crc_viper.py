@@ -0,0 +1,42 @@
+"""
+micropython-modbus: Implementation of Modbus protocol for MicroPython
+https://gitlab.com/extel-open-source
+
+Based on "Modbus TestKit": https://github.com/ljean/modbus-tk
+
+Copyright (C) 2009, Luc Jean - luc.jean@gmail.com
+Copyright (C) 2009, Apidev - http://www.apidev.fr
+Copyright (C) 2018, Extel Technologies - https://gitlab.com/extel-open-source
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+# Viper implementation of the CRC16 used by modbus.crc
+# This module can only be imported by a MicroPython port with the viper
+# emitter enabled. Don't import it directly, use modbus.crc instead
+
+import micropython
+
+
+@micropython.viper
+def crc16_update(data, length: int, crc: int, table) -> int:
+    """Fold length bytes of data into crc using the 256 entries table"""
+    buf = ptr8(data)
+    tbl = ptr16(table)
+    i = 0
+    while i < length:
+        crc = (crc >> 8) ^ tbl[(crc ^ buf[i]) & 0xFF]
+        i += 1
+    return crc
@@ -23,6 +23,12 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 """
 
+try:
+    from micropython import const
+except ImportError:
+    def const(value):
+        return value
+
 #modbus exception codes
 ILLEGAL_FUNCTION = const(1)
 ILLEGAL_DATA_ADDRESS = const(2)
@@ -47,8 +53,23 @@ WRITE_MULTIPLE_REGISTERS = const(16)
 READ_WRITE_MULTIPLE_REGISTERS = const(23)
 DEVICE_INFO = const(43)
 
+#MEI type and read device id codes of DEVICE_INFO
+MEI_READ_DEVICE_ID = const(0x0E)
+READ_DEVICE_ID_BASIC = const(1)
+READ_DEVICE_ID_REGULAR = const(2)
+READ_DEVICE_ID_EXTENDED = const(3)
+READ_DEVICE_ID_SPECIFIC = const(4)
+
 #supported block types
 COILS = const(1)
 DISCRETE_INPUTS = const(2)
 HOLDING_REGISTERS = const(3)
 ANALOG_INPUTS = const(4)
+
+#maximum quantity of items read by a single request
+MAX_READ_BITS = const(2000)
+MAX_READ_REGISTERS = const(125)
+
+#maximum quantity of items written by a single request
+MAX_WRITE_BITS = const(1968)
+MAX_WRITE_REGISTERS = const(123)
@@ -94,6 +94,19 @@ class ModbusInvalidResponseError(Exception):
     pass
 
 
+class ModbusTimeoutError(ModbusInvalidResponseError):
+    """Exception raised when the slave doesn't answer"""
+    pass
+
+
+class ModbusSlaveOfflineError(ModbusTimeoutError):
+    """
+    Exception raised without sending the request when the slave stopped
+    answering and isn't probed yet, see modbus.health
+    """
+    pass
+
+
 class ModbusInvalidRequestError(Exception):
     """
     Exception raised when the request by the master doesn't fit
@@ -0,0 +1,182 @@
+"""
+micropython-modbus: Implementation of Modbus protocol for MicroPython
+https://gitlab.com/extel-open-source
+
+Based on "Modbus TestKit": https://github.com/ljean/modbus-tk
+
+Copyright (C) 2009, Luc Jean - luc.jean@gmail.com
+Copyright (C) 2009, Apidev - http://www.apidev.fr
+Copyright (C) 2018, Extel Technologies - https://gitlab.com/extel-open-source
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+try:
+    from micropython import const
+except ImportError:
+    def const(value):
+        return value
+
+from modbus import defines
+from modbus import utils
+from modbus.exceptions import InvalidArgumentError, ModbusSlaveOfflineError
+
+# State of a slave
+SLAVE_ONLINE = const(0)
+SLAVE_OFFLINE = const(1)   # skipped, apart from a probe every probe_interval_ms
+
+DEFAULT_MIN_TIMEOUT_MS = const(20)
+DEFAULT_MAX_TIMEOUT_MS = const(1000)
+# consecutive timeouts putting a slave offline
+DEFAULT_OFFLINE_AFTER = const(3)
+DEFAULT_PROBE_INTERVAL_MS = const(5000)
+
+# Retries of an exception response: exception code -> (retries, delay in
+# ms before the first retry, doubled for the next ones)
+DEFAULT_RETRIES = {
+    defines.SLAVE_DEVICE_BUSY: (3, 50),
+}
+
+
+class _SlaveState(object):
+    """Response time estimate and failures of a slave"""
+
+    def __init__(self, timeout_us):
+        self.srtt_us = -1
+        self.rttvar_us = 0
+        self.timeout_us = timeout_us
+        self.timeouts = 0
+        self.state = SLAVE_ONLINE
+        self.next_probe_ms = 0
+
+
+class SlaveHealth(object):
+    """
+    Response timeout, retries and offline state of every slave of a master
+
+    The timeout of a request is derived from the smoothed time to the first
+    byte of the responses of its slave and from its variance, like the TCP
+    retransmission timeout (RFC 6298), between min_timeout_ms and
+    max_timeout_ms. It is doubled after every timeout. A slave which
+    doesn't answer offline_after requests in a row is offline: its requests
+    raise ModbusSlaveOfflineError without being sent, except a probe every
+    probe_interval_ms, and it is online again once it answers.
+
+    Timeouts and invalid responses are retried timeout_retries times, and
+    exception responses according to the retries of their exception code,
+    see set_retries. Install it with RtuMaster.set_health
+    """
+
+    def __init__(
+            self, min_timeout_ms=DEFAULT_MIN_TIMEOUT_MS, max_timeout_ms=DEFAULT_MAX_TIMEOUT_MS,
+            offline_after=DEFAULT_OFFLINE_AFTER, probe_interval_ms=DEFAULT_PROBE_INTERVAL_MS, timeout_retries=0):
+        """Constructor"""
+        if not 0 < min_timeout_ms <= max_timeout_ms or offline_after <= 0:
+            raise InvalidArgumentError("Invalid health settings")
+        self.min_timeout_us = min_timeout_ms * 1000
+        self.max_timeout_us = max_timeout_ms * 1000
+        self.offline_after = offline_after
+        self.probe_interval_ms = probe_interval_ms
+        self.timeout_retries = timeout_retries
+        self._retries = dict(DEFAULT_RETRIES)
+        self._slaves = {}
+
+    def set_retries(self, exception_code, retries, delay_ms=0):
+        """Retry retries times the requests answered with exception_code, 0 doesn't retry them"""
+        if retries > 0:
+            self._retries[exception_code] = (retries, delay_ms)
+        elif exception_code in self._retries:
+            del self._retries[exception_code]
+
+    def _get_state(self, slave):
+        """Returns the state of a slave, created on its first request"""
+        state = self._slaves.get(slave)
+        if state is None:
+            state = self._slaves[slave] = _SlaveState(self.max_timeout_us)
+        return state
+
+    def get_state(self, slave):
+        """Returns SLAVE_ONLINE or SLAVE_OFFLINE"""
+        return self._get_state(slave).state
+
+    def get_timeout_ms(self, slave):
+        """Returns the response timeout of the next request to slave"""
+        return self._get_state(slave).timeout_us // 1000
+
+    def get_srtt_ms(self, slave):
+        """Returns the smoothed time to the first byte of the responses of slave, -1 before any response"""
+        srtt_us = self._get_state(slave).srtt_us
+        return srtt_us / 1000 if srtt_us >= 0 else -1
+
+    def reset(self, slave=None):
+        """Forget the estimates and the failures of a slave, of all of them if None"""
+        if slave is None:
+            self._slaves.clear()
+        elif slave in self._slaves:
+            del self._slaves[slave]
+
+    def begin(self, slave):
+        """
+        Called before a request to slave. Returns the timeout of its response
+        in microseconds, raises ModbusSlaveOfflineError if it is offline and
+        not due for a probe
+        """
+        state = self._get_state(slave)
+        if state.state == SLAVE_OFFLINE:
+            now = utils.ticks_ms()
+            if utils.ticks_diff(now, state.next_probe_ms) < 0:
+                raise ModbusSlaveOfflineError("Slave {0} is offline".format(slave))
+            state.next_probe_ms = utils.ticks_add(now, self.probe_interval_ms)
+        return state.timeout_us
+
+    def on_response(self, slave, rtt_us):
+        """A response has been received rtt_us after the request, -1 if unknown"""
+        state = self._get_state(slave)
+        state.timeouts = 0
+        state.state = SLAVE_ONLINE
+        if rtt_us < 0:
+            return
+        if state.srtt_us < 0:
+            state.srtt_us = rtt_us
+            state.rttvar_us = rtt_us >> 1
+        else:
+            delta = state.srtt_us - rtt_us
+            state.rttvar_us += ((delta if delta >= 0 else -delta) - state.rttvar_us) >> 2
+            state.srtt_us += (rtt_us - state.srtt_us) >> 3
+        state.timeout_us = min(max(state.srtt_us + 4 * state.rttvar_us, self.min_timeout_us), self.max_timeout_us)
+
+    def on_timeout(self, slave):
+        """
+        The slave hasn't answered. Returns True if the request can be
+        retried, False if the slave has been put offline
+        """
+        state = self._get_state(slave)
+        state.timeouts += 1
+        state.timeout_us = min(2 * state.timeout_us, self.max_timeout_us)
+        if state.state == SLAVE_OFFLINE or state.timeouts >= self.offline_after:
+            state.state = SLAVE_OFFLINE
+            state.next_probe_ms = utils.ticks_add(utils.ticks_ms(), self.probe_interval_ms)
+            return False
+        return True
+
+    def get_retry_delay_ms(self, exception_code, attempt):
+        """
+        Returns the delay before retrying a request answered with
+        exception_code for the attempt-th time (0 for the first retry), -1
+        if it mustn't be retried
+        """
+        retry = self._retries.get(exception_code)
+        if retry is None or attempt >= retry[0]:
+            return -1
+        return retry[1] << attempt
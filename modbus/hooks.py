@@ -30,11 +30,17 @@ def install_hook(name, fct):
     """
     Install one of the following hook
 
+    The master hooks can also be installed on a single master with
+    Master.install_hook or the hooks argument of its constructor
+
     modbus_rtu.RtuMaster.before_open((master,))
     modbus_rtu.RtuMaster.after_close((master,)
     modbus_rtu.RtuMaster.before_send((master, request)) returns modified request or None
     modbus_rtu.RtuMaster.after_recv((master, response)) returns modified response or None
 
+    modbus_rtu_async.AsyncRtuMaster.before_send((master, request)) returns modified request or None
+    modbus_rtu_async.AsyncRtuMaster.after_recv((master, response)) returns modified response or None
+
     modbus_rtu.RtuServer.before_close((server, ))
     modbus_rtu.RtuServer.after_close((server, ))
     modbus_rtu.RtuServer.before_open((server, ))
@@ -49,7 +55,7 @@ def install_hook(name, fct):
     modbus_tcp.TcpMaster.before_close((master, ))
     modbus_tcp.TcpMaster.after_close((master, ))
     modbus_tcp.TcpMaster.before_send((master, request))
-    modbus_tcp.TcpServer.after_send((master, request))
+    modbus_tcp.TcpMaster.after_send((master, request))
     modbus_tcp.TcpMaster.after_recv((master, response))
 
 
@@ -72,6 +78,7 @@ def install_hook(name, fct):
     modbus.Slave.handle_read_holding_registers_request((slave, request_pdu)) returns modified response or None
     modbus.Slave.handle_read_discrete_inputs_request((slave, request_pdu)) returns modified response or None
     modbus.Slave.handle_read_coils_request((slave, request_pdu)) returns modified response or None
+    modbus.Slave.handle_read_write_multiple_registers_request((slave, request_pdu)) returns modified response or None
 
     modbus.Slave.on_handle_broadcast((slave, response_pdu)) returns modified response or None
     modbus.Slave.on_exception((slave, function_code, excpt))
@@ -84,10 +91,7 @@ def install_hook(name, fct):
     modbus.Server.before_handle_request((server, request)) returns modified request or None
     modbus.Server.after_handle_request((server, response)) returns modified response or None
     """
-    try:
-        _HOOKS[name].append(fct)
-    except KeyError:
-        _HOOKS[name] = [fct]
+    get_hooks(name).append(fct)
 
 
 def uninstall_hook(name, fct=None):
@@ -98,14 +102,43 @@ def uninstall_hook(name, fct=None):
         del _HOOKS[name][:]
 
 
-def call_hooks(name, args):
-    """call the function associated with the hook and pass the given args"""
+def get_hooks(name):
+    """
+    returns the list of the functions installed for the hook
+
+    The list is created once and then only modified in place, so a module can
+    bind it at import time and test it before paying for a call to call_hooks
+    """
     try:
-        for fct in _HOOKS[name]:
-            retval = fct(args)
-            if retval is not None:
-                return retval
+        return _HOOKS[name]
     except KeyError:
-        pass
+        hooks = _HOOKS[name] = []
+        return hooks
+
+
+def _call(hooks, args):
+    """call the functions until one of them returns something"""
+    for fct in hooks:
+        retval = fct(args)
+        if retval is not None:
+            return retval
     return None
 
+
+def call_hooks(name, args, local_hooks=None):
+    """
+    call the function associated with the hook and pass the given args
+
+    local_hooks is an optional dictionary of the hooks installed on an
+    instance: they are called before the global ones
+    """
+    if local_hooks:
+        hooks = local_hooks.get(name)
+        if hooks:
+            retval = _call(hooks, args)
+            if retval is not None:
+                return retval
+    hooks = _HOOKS.get(name)
+    if hooks:
+        return _call(hooks, args)
+    return None
@@ -0,0 +1,270 @@
+"""
+micropython-modbus: Implementation of Modbus protocol for MicroPython
+https://gitlab.com/extel-open-source
+
+Based on "Modbus TestKit": https://github.com/ljean/modbus-tk
+
+Copyright (C) 2009, Luc Jean - luc.jean@gmail.com
+Copyright (C) 2009, Apidev - http://www.apidev.fr
+Copyright (C) 2018, Extel Technologies - https://gitlab.com/extel-open-source
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+from array import array
+
+try:
+    from micropython import const
+except ImportError:
+    def const(value):
+        return value
+
+from modbus.exceptions import (
+    ModbusError, ModbusInvalidResponseError, ModbusTimeoutError, InvalidArgumentError
+)
+from modbus import utils
+
+# Steps of a transaction whose duration is measured
+PHASE_BUILD = const(0)      # frame built and hooks called
+PHASE_TRANSMIT = const(1)   # request written to the MAC layer
+PHASE_TTFB = const(2)       # from the end of the request to the first byte of the response
+PHASE_RECEIVE = const(3)    # from the first byte to the end of the response
+PHASE_PARSE = const(4)      # response checked and decoded
+PHASE_NAMES = ("build", "transmit", "ttfb", "receive", "parse")
+_PHASES = const(5)
+
+# Counters of every slave and function
+COUNT_REQUESTS = const(0)
+COUNT_TIMEOUTS = const(1)
+COUNT_INVALID_RESPONSES = const(2)  # bad CRC, address or format
+COUNT_EXCEPTIONS = const(3)         # exception responses
+COUNT_ERRORS = const(4)             # any other error: socket, invalid argument...
+COUNTER_NAMES = ("requests", "timeouts", "invalid_responses", "exceptions", "errors")
+_COUNTERS = const(5)
+
+# Exception codes above this one are counted as 0
+_MAX_EXCEPTION_CODE = const(15)
+
+# Upper bounds of the latency buckets in microseconds. The last bucket of a
+# histogram counts the longer durations
+DEFAULT_BUCKETS_US = (100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000, 200000, 500000, 1000000)
+
+
+class Metrics(object):
+    """
+    Counters and latency histograms of the transactions of a master, for
+    every (slave, function code), and the utilisation of the bus
+
+    All the counters are allocated by the constructor: recording a
+    transaction only increments them. Up to max_entries (slave, function)
+    pairs are tracked, the transactions of the other ones are counted
+    together under the key (None, None). Install it with Master.set_metrics
+    """
+
+    def __init__(self, max_entries=32, buckets_us=DEFAULT_BUCKETS_US):
+        """Constructor"""
+        if max_entries <= 0 or not buckets_us:
+            raise InvalidArgumentError("Invalid metrics size")
+        self.max_entries = max_entries
+        self.buckets_us = tuple(buckets_us)
+        self._nb_buckets = len(self.buckets_us) + 1
+        slots = max_entries + 1
+        self._slots = {}
+        self._slot_keys = array("H", [0] * slots)
+        self._counters = array("L", [0] * (slots * _COUNTERS))
+        self._exception_codes = array("L", [0] * (slots * (_MAX_EXCEPTION_CODE + 1)))
+        self._histograms = array("L", [0] * (slots * _PHASES * self._nb_buckets))
+        self.reset()
+
+    def reset(self):
+        """Set all the counters to 0 and restart the measure of the bus utilisation"""
+        for values in (self._counters, self._exception_codes, self._histograms):
+            for i in range(len(values)):
+                values[i] = 0
+        self._slots.clear()
+        # the busy time is split to stay a small int on MicroPython
+        self._busy_s = 0
+        self._busy_us = 0
+        # time elapsed since the reset, accumulated on every transaction so
+        # that it survives the wrap around of the ticks
+        self._elapsed_s = 0
+        self._elapsed_ms = 0
+        self._last_ms = utils.ticks_ms()
+
+    def _slot(self, slave, function_code):
+        """Returns the index of the counters of slave and function_code"""
+        key = (slave << 8) | function_code
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = len(self._slots)
+            if slot >= self.max_entries:
+                return self.max_entries
+            self._slots[key] = slot
+            self._slot_keys[slot] = key
+        return slot
+
+    def _add_sample(self, slot, phase, duration_us):
+        """Count a duration in the histogram of a phase"""
+        buckets = self.buckets_us
+        bucket = 0
+        while bucket < len(buckets) and duration_us > buckets[bucket]:
+            bucket += 1
+        self._histograms[(slot * _PHASES + phase) * self._nb_buckets + bucket] += 1
+
+    def _add_busy(self, duration_us):
+        """Add to the time the bus was busy"""
+        busy_us = self._busy_us + duration_us
+        while busy_us >= 1000000:
+            busy_us -= 1000000
+            self._busy_s += 1
+        self._busy_us = busy_us
+
+    def _add_elapsed(self):
+        """Add the time elapsed since the last call to the time measured"""
+        now = utils.ticks_ms()
+        elapsed_ms = utils.ticks_diff(now, self._last_ms)
+        self._last_ms = now
+        if elapsed_ms <= 0:
+            return
+        elapsed_ms += self._elapsed_ms
+        while elapsed_ms >= 1000:
+            elapsed_ms -= 1000
+            self._elapsed_s += 1
+        self._elapsed_ms = elapsed_ms
+
+    def record(self, slave, function_code, start_us, built_us, sent_us, first_byte_us, received_us, end_us, excpt=None):
+        """
+        Record a transaction from the ticks_us timestamps of its steps. A step
+        which wasn't reached is -1, as well as first_byte_us when the MAC layer
+        doesn't report it. excpt is the exception which ended the transaction
+        """
+        self._add_elapsed()
+        slot = self._slot(slave, function_code)
+        counters = self._counters
+        counters[slot * _COUNTERS + COUNT_REQUESTS] += 1
+
+        if excpt is not None:
+            if isinstance(excpt, ModbusError):
+                counters[slot * _COUNTERS + COUNT_EXCEPTIONS] += 1
+                code = excpt.get_exception_code()
+                if code > _MAX_EXCEPTION_CODE:
+                    code = 0
+                self._exception_codes[slot * (_MAX_EXCEPTION_CODE + 1) + code] += 1
+            elif isinstance(excpt, ModbusTimeoutError):
+                counters[slot * _COUNTERS + COUNT_TIMEOUTS] += 1
+            elif isinstance(excpt, ModbusInvalidResponseError):
+                counters[slot * _COUNTERS + COUNT_INVALID_RESPONSES] += 1
+            else:
+                counters[slot * _COUNTERS + COUNT_ERRORS] += 1
+
+        if received_us < 0:
+            # the transaction failed before the end of the response
+            if built_us >= 0:
+                self._add_busy(utils.ticks_diff(end_us, built_us))
+            return
+
+        if first_byte_us < 0:
+            first_byte_us = received_us
+        add_sample = self._add_sample
+        add_sample(slot, PHASE_BUILD, utils.ticks_diff(built_us, start_us))
+        add_sample(slot, PHASE_TRANSMIT, utils.ticks_diff(sent_us, built_us))
+        add_sample(slot, PHASE_TTFB, utils.ticks_diff(first_byte_us, sent_us))
+        add_sample(slot, PHASE_RECEIVE, utils.ticks_diff(received_us, first_byte_us))
+        add_sample(slot, PHASE_PARSE, utils.ticks_diff(end_us, received_us))
+        self._add_busy(utils.ticks_diff(received_us, built_us))
+
+    def keys(self):
+        """Returns the (slave, function code) pairs which have been recorded"""
+        keys = [(key >> 8, key & 0xFF) for key in self._slot_keys[:len(self._slots)]]
+        if self._counters[self.max_entries * _COUNTERS + COUNT_REQUESTS]:
+            keys.append((None, None))
+        return keys
+
+    def get(self, slave, function_code):
+        """
+        Returns the metrics of slave and function_code as a dictionary: the
+        counters of COUNTER_NAMES, "exception_codes" {code: count} and
+        "latency" {phase name: histogram}. A histogram is a tuple of counts,
+        one per bucket of buckets_us and one for the longer durations
+        """
+        if slave is None:
+            slot = self.max_entries
+        else:
+            slot = self._slots.get((slave << 8) | function_code)
+            if slot is None:
+                return None
+        metrics = {}
+        for (index, name) in enumerate(COUNTER_NAMES):
+            metrics[name] = self._counters[slot * _COUNTERS + index]
+        codes = {}
+        for code in range(_MAX_EXCEPTION_CODE + 1):
+            count = self._exception_codes[slot * (_MAX_EXCEPTION_CODE + 1) + code]
+            if count:
+                codes[code] = count
+        metrics["exception_codes"] = codes
+        latency = {}
+        for (phase, name) in enumerate(PHASE_NAMES):
+            start = (slot * _PHASES + phase) * self._nb_buckets
+            latency[name] = tuple(self._histograms[start:start + self._nb_buckets])
+        metrics["latency"] = latency
+        return metrics
+
+    def percentile(self, slave, function_code, phase, fraction):
+        """
+        Returns the upper bound in microseconds of the bucket holding the given
+        fraction (0.5, 0.99...) of the durations of a phase, None if the
+        duration is longer than the last bucket or nothing was recorded
+        """
+        metrics = self.get(slave, function_code)
+        if metrics is None:
+            return None
+        histogram = metrics["latency"][PHASE_NAMES[phase]]
+        total = sum(histogram)
+        if not total:
+            return None
+        count = 0
+        for (bucket, bucket_count) in enumerate(histogram):
+            count += bucket_count
+            if count >= fraction * total:
+                return self.buckets_us[bucket] if bucket < len(self.buckets_us) else None
+        return None
+
+    def utilisation(self):
+        """
+        Returns the fraction of the time the bus has been busy since the last
+        reset. The time is measured between the transactions and the calls to
+        utilisation, which must be less than half the ticks_ms period apart
+        """
+        self._add_elapsed()
+        elapsed_ms = self._elapsed_s * 1000 + self._elapsed_ms
+        if elapsed_ms <= 0:
+            return 0.0
+        return min(1.0, (self._busy_s * 1000 + self._busy_us / 1000) / elapsed_ms)
+
+    def dump(self, write=print):
+        """Format the metrics, one line per (slave, function code) passed to write"""
+        write("bus utilisation {0:.1f}%".format(100 * self.utilisation()))
+        for (slave, function_code) in self.keys():
+            metrics = self.get(slave, function_code)
+            line = "slave={0} fc={1}".format(slave, function_code)
+            for name in COUNTER_NAMES:
+                line += " {0}={1}".format(name, metrics[name])
+            if metrics["exception_codes"]:
+                line += " codes={0}".format(metrics["exception_codes"])
+            for phase in range(_PHASES):
+                # median, None when longer than the last bucket
+                line += " {0}_p50={1}".format(
+                    PHASE_NAMES[phase], self.percentile(slave, function_code, phase, 0.5))
+            write(line)
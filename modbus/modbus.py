@@ -25,19 +25,50 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import struct
 
+try:
+    from collections import OrderedDict
+except ImportError:
+    from ucollections import OrderedDict
+
 # from modbus import LOGGER
 from modbus import defines
 from modbus.exceptions import(
     ModbusError, ModbusFunctionNotSupportedError, DuplicatedKeyError, MissingKeyError, InvalidModbusBlockError,
     InvalidArgumentError, OverlapModbusBlockError, OutOfModbusBlockError, ModbusInvalidResponseError,
-    ModbusInvalidRequestError
+    ModbusInvalidRequestError, ModbusTimeoutError
 )
-from modbus.hooks import call_hooks
+from modbus.hooks import call_hooks, get_hooks
+from modbus import utils
 from modbus.utils import get_log_buffer
+from modbus.trace import TRACE_TX, TRACE_RX
+from modbus.coils import CoilBits
+from modbus.codecs import get_codec
 
 # modbus is using the python logging mechanism
 # you can define this logger in your app in order to see its prints logs
 
+# Default number of request frames kept by Master for repeated read requests
+DEFAULT_FRAME_CACHE_SIZE = 32
+
+# Functions returning a CoilBits when Master.set_coil_bits is enabled
+_BIT_READ_FUNCTIONS = (defines.READ_COILS, defines.READ_DISCRETE_INPUTS)
+
+# Functions whose request only depends on (slave, function, address, quantity)
+_CACHEABLE_FUNCTIONS = (
+    defines.READ_COILS, defines.READ_DISCRETE_INPUTS, defines.READ_HOLDING_REGISTERS,
+    defines.READ_INPUT_REGISTERS, defines.READ_EXCEPTION_STATUS
+)
+
+# The hook lists are only modified in place: testing them before calling
+# call_hooks makes a hook point without any function almost free
+_MASTER_BEFORE_SEND = get_hooks("modbus.Master.before_send")
+_MASTER_AFTER_SEND = get_hooks("modbus.Master.after_send")
+_MASTER_AFTER_RECV = get_hooks("modbus.Master.after_recv")
+_BLOCK_SETITEM = get_hooks("modbus.ModbusBlock.setitem")
+_SLAVE_HANDLE_REQUEST = get_hooks("modbus.Slave.handle_request")
+_SERVER_BEFORE_HANDLE_REQUEST = get_hooks("modbus.Server.before_handle_request")
+_SERVER_AFTER_HANDLE_REQUEST = get_hooks("modbus.Server.after_handle_request")
+
 
 class Query(object):
     """
@@ -81,21 +112,139 @@ class Query(object):
         raise NotImplementedError()
 
 
+class FrameCache(object):
+    """
+    Bounded cache of prebuilt request frames. The least recently used frame
+    is dropped when the cache is full
+    """
+
+    def __init__(self, size):
+        """Constructor: size is the maximum number of frames kept"""
+        self._size = size
+        self._frames = OrderedDict()
+
+    def get(self, key):
+        """Returns the frame stored for key or None if there is none"""
+        frames = self._frames
+        try:
+            frame = frames.pop(key)
+        except KeyError:
+            return None
+        # re-insert it to mark it as the most recently used
+        frames[key] = frame
+        return frame
+
+    def put(self, key, frame):
+        """Store a frame, evicting the least recently used one if needed"""
+        frames = self._frames
+        if key in frames:
+            del frames[key]
+        elif len(frames) >= self._size:
+            del frames[next(iter(frames))]
+        frames[key] = frame
+
+    def clear(self):
+        """Remove all the frames"""
+        self._frames.clear()
+
+    def __len__(self):
+        return len(self._frames)
+
+
 class Master(object):
     """
     This class implements the Modbus Application protocol for a master
     To be subclassed with a class implementing the MAC layer
     """
 
+    # position of the slave id in the frames of the MAC layer, see set_trace
+    _slave_offset = 0
+
+    # slave 0 is the broadcast address, whose requests get no response
+    _has_broadcast = True
+
     def __init__(self, hooks=None):
-        """Constructor"""
+        """
+        Constructor
+        hooks is an optional dictionary {hook name: function or list of functions}
+        of hooks called for this master only, see install_hook
+        """
         self._verbose = False
         self._is_opened = False
+        self._frame_cache = FrameCache(DEFAULT_FRAME_CACHE_SIZE)
+        self._trace = None
+        self._metrics = None
+        self._coil_bits = False
+        # ticks_us of the first byte of the last response, -1 if unknown
+        self._first_byte_us = -1
+        self._hooks = {}
+        if hooks:
+            for (name, fcts) in hooks.items():
+                if callable(fcts):
+                    fcts = (fcts, )
+                for fct in fcts:
+                    self.install_hook(name, fct)
+
+    def install_hook(self, name, fct):
+        """
+        Install a hook for this master only. It is called before the functions
+        installed with modbus.hooks.install_hook for the same hook
+        """
+        try:
+            self._hooks[name].append(fct)
+        except KeyError:
+            self._hooks[name] = [fct]
+
+    def uninstall_hook(self, name, fct=None):
+        """remove the function from the hooks of this master"""
+        if fct:
+            self._hooks[name].remove(fct)
+        else:
+            del self._hooks[name][:]
+        if not self._hooks[name]:
+            # keeps self._hooks empty when no hook is installed on the master
+            del self._hooks[name]
 
     def set_verbose(self, verbose):
         """print some more log prints for debug purpose"""
         self._verbose = verbose
 
+    def set_trace(self, trace):
+        """
+        Record the frames sent and received in trace, a modbus.trace.TraceBuffer
+        None stops the recording
+        """
+        self._trace = trace
+
+    def get_trace(self):
+        """Returns the TraceBuffer recording the frames, None if there isn't any"""
+        return self._trace
+
+    def set_coil_bits(self, enabled):
+        """
+        Return the coils and discrete inputs read as a CoilBits rather than a
+        tuple of ints, which avoids an object per bit
+        """
+        self._coil_bits = enabled
+        if self._frame_cache is not None:
+            # the cached frames of the bit reads hold the data format
+            self._frame_cache.clear()
+
+    def get_coil_bits(self):
+        """Returns True if the coils and discrete inputs are read as a CoilBits"""
+        return self._coil_bits
+
+    def set_metrics(self, metrics):
+        """
+        Measure the transactions in metrics, a modbus.metrics.Metrics
+        None stops the measures
+        """
+        self._metrics = metrics
+
+    def get_metrics(self):
+        """Returns the Metrics of the master, None if there isn't any"""
+        return self._metrics
+
     def _send(self, buf):
         """Send data to a slave on the MAC layer"""
         raise NotImplementedError()
@@ -105,6 +254,7 @@ class Master(object):
         Receive data from a slave on the MAC layer
         if expected_length is >=0 then consider that the response is done when this
         number of bytes is received
+        Set _first_byte_us if the time of the first byte is known
         """
         raise NotImplementedError()
 
@@ -115,151 +265,34 @@ class Master(object):
         """
         raise NotImplementedError()
 
-    def execute(
-            self, slave, function_code, starting_address, quantity_of_x=0, output_value=0, data_format="", expected_length=-1):
+    def set_frame_cache_size(self, size):
         """
-        Execute a modbus query and returns the data part of the answer as a tuple
-        The returned tuple depends on the query function code. see modbus protocol
-        specification for details
-        data_format makes possible to extract the data like defined in the
-        struct python module documentation
-        """
-
-        pdu = ""
-        is_read_function = False
-        nb_of_digits = 0
-
-        # Build the modbus pdu and the format of the expected data.
-        # It depends of function code. see modbus specifications for details.
-        if function_code == defines.READ_COILS or function_code == defines.READ_DISCRETE_INPUTS:
-            is_read_function = True
-            pdu = struct.pack(">BHH", function_code,
-                              starting_address, quantity_of_x)
-            byte_count = quantity_of_x // 8
-            if (quantity_of_x % 8) > 0:
-                byte_count += 1
-            nb_of_digits = quantity_of_x
-            if not data_format:
-                data_format = ">" + (byte_count * "B")
-            if expected_length < 0:
-                # No length was specified and calculated length can be used:
-                # slave + func + bytcodeLen + bytecode + crc1 + crc2
-                expected_length = byte_count + 5
-
-        elif function_code == defines.READ_INPUT_REGISTERS or function_code == defines.READ_HOLDING_REGISTERS:
-            is_read_function = True
-            pdu = struct.pack(">BHH", function_code,
-                              starting_address, quantity_of_x)
-            if not data_format:
-                data_format = ">" + (quantity_of_x * "H")
-            if expected_length < 0:
-                # No length was specified and calculated length can be used:
-                # slave + func + bytcodeLen + bytecode x 2 + crc1 + crc2
-                expected_length = 2 * quantity_of_x + 5
-
-        elif (function_code == defines.WRITE_SINGLE_COIL) or (function_code == defines.WRITE_SINGLE_REGISTER):
-            if function_code == defines.WRITE_SINGLE_COIL:
-                if output_value != 0:
-                    output_value = 0xff00
-                fmt = ">BHH"
-            else:
-                fmt = ">BH"+("H" if output_value >= 0 else "h")
-            pdu = struct.pack(fmt, function_code,
-                              starting_address, output_value)
-            if not data_format:
-                data_format = ">HH"
-            if expected_length < 0:
-                # No length was specified and calculated length can be used:
-                # slave + func + adress1 + adress2 + value1+value2 + crc1 + crc2
-                expected_length = 8
-
-        elif function_code == defines.WRITE_MULTIPLE_COILS:
-            byte_count = len(output_value) // 8
-            if (len(output_value) % 8) > 0:
-                byte_count += 1
-            pdu = struct.pack(">BHHB", function_code,
-                              starting_address, len(output_value), byte_count)
-            i, byte_value = 0, 0
-            for j in output_value:
-                if j > 0:
-                    byte_value += pow(2, i)
-                if i == 7:
-                    pdu += struct.pack(">B", byte_value)
-                    i, byte_value = 0, 0
-                else:
-                    i += 1
-            if i > 0:
-                pdu += struct.pack(">B", byte_value)
-            if not data_format:
-                data_format = ">HH"
-            if expected_length < 0:
-                # No length was specified and calculated length can be used:
-                # slave + func + adress1 + adress2 + outputQuant1 + outputQuant2 + crc1 + crc2
-                expected_length = 8
-
-        elif function_code == defines.WRITE_MULTIPLE_REGISTERS:
-            if output_value and data_format:
-                byte_count = struct.calcsize(data_format)
-            else:
-                byte_count = 2 * len(output_value)
-            pdu = struct.pack(">BHHB", function_code,
-                              starting_address, byte_count // 2, byte_count)
-            if output_value and data_format:
-                pdu += struct.pack(data_format, *output_value)
-            else:
-                for j in output_value:
-                    fmt = "H" if j >= 0 else "h"
-                    pdu += struct.pack(">" + fmt, j)
-            # data_format is now used to process response which is always 2 registers:
-            #   1) data address of first register, 2) number of registers written
-            data_format = ">HH"
-            if expected_length < 0:
-                # No length was specified and calculated length can be used:
-                # slave + func + adress1 + adress2 + outputQuant1 + outputQuant2 + crc1 + crc2
-                expected_length = 8
-
-        elif function_code == defines.READ_EXCEPTION_STATUS:
-            pdu = struct.pack(">B", function_code)
-            data_format = ">B"
-            if expected_length < 0:
-                # No length was specified and calculated length can be used:
-                expected_length = 5
-
-        elif function_code == defines.DIAGNOSTIC:
-            # SubFuncCode  are in starting_address
-            pdu = struct.pack(">BH", function_code, starting_address)
-            if len(output_value) > 0:
-                for j in output_value:
-                    # copy data in pdu
-                    pdu += struct.pack(">B", j)
-                if not data_format:
-                    data_format = ">" + (len(output_value) * "B")
-                if expected_length < 0:
-                    # No length was specified and calculated length can be used:
-                    # slave + func + SubFunc1 + SubFunc2 + Data + crc1 + crc2
-                    expected_length = len(output_value) + 6
-
-        elif function_code == defines.READ_WRITE_MULTIPLE_REGISTERS:
-            is_read_function = True
-            byte_count = 2 * len(output_value)
-            pdu = struct.pack(
-                ">BHHHHB",
-                function_code, starting_address, quantity_of_x, defines.READ_WRITE_MULTIPLE_REGISTERS,
-                len(output_value), byte_count
-            )
-            for j in output_value:
-                fmt = "H" if j >= 0 else "h"
-                # copy data in pdu
-                pdu += struct.pack(">"+fmt, j)
-            if not data_format:
-                data_format = ">" + (quantity_of_x * "H")
-            if expected_length < 0:
-                # No lenght was specified and calculated length can be used:
-                # slave + func + bytcodeLen + bytecode x 2 + crc1 + crc2
-                expected_length = 2 * quantity_of_x + 5
+        Set the maximum number of prebuilt request frames kept for repeated
+        read requests. 0 disables the cache
+        """
+        if size > 0:
+            self._frame_cache = FrameCache(size)
+        else:
+            self._frame_cache = None
+
+    def _build_frame(
+            self, slave, function_code, starting_address, quantity_of_x, output_value, data_format, expected_length,
+            write_starting_address=0):
+        """
+        Build the request for a modbus query with the codec of the function code
+        Returns a tuple (query, request, expected_length, codec, quantity_of_x, data_format)
+        """
+        codec = get_codec(function_code)
+        if function_code == defines.READ_WRITE_MULTIPLE_REGISTERS:
+            pdu = codec.build_request(starting_address, quantity_of_x, output_value, data_format, write_starting_address)
         else:
-            raise ModbusFunctionNotSupportedError(
-                "The {0} function code is not supported. ".format(function_code))
+            pdu = codec.build_request(starting_address, quantity_of_x, output_value, data_format)
+        if expected_length < 0:
+            # No length was specified and calculated length can be used:
+            # slave + pdu + crc1 + crc2
+            pdu_length = codec.get_response_length(quantity_of_x, output_value)
+            if pdu_length >= 0:
+                expected_length = pdu_length + 3
 
         # instantiate a query which implements the MAC (TCP or RTU) part of the protocol
         query = self._make_query()
@@ -267,81 +300,194 @@ class Master(object):
         # add the mac part of the protocol to the request
         request = query.build_request(pdu, slave)
 
-        # send the request to the slave
-        retval = call_hooks("modbus.Master.before_send", (self, request))
-        if retval is not None:
-            request = retval
+        return query, request, expected_length, codec, quantity_of_x, data_format
+
+    def _get_frame(
+            self, slave, function_code, starting_address, quantity_of_x, output_value, data_format, expected_length,
+            write_starting_address=0):
+        """
+        Returns the frame of a modbus query, from the frame cache if possible
+        See _build_frame
+        """
+
+        # Read requests are fully defined by their address and quantity, so the
+        # frame built for them can be reused as long as the caller doesn't
+        # override the data format or the expected length
+        frame = None
+        cache_key = None
+        if (self._frame_cache is not None and expected_length < 0 and not data_format
+                and function_code in _CACHEABLE_FUNCTIONS):
+            cache_key = (slave, function_code, starting_address, quantity_of_x)
+            frame = self._frame_cache.get(cache_key)
+
+        if frame is None:
+            if self._coil_bits and not data_format and function_code in _BIT_READ_FUNCTIONS:
+                data_format = CoilBits
+            frame = self._build_frame(
+                slave, function_code, starting_address, quantity_of_x, output_value, data_format, expected_length,
+                write_starting_address)
+            if cache_key is not None:
+                self._frame_cache.put(cache_key, frame)
+
+        return frame
+
+    def _prepare_request(self, request):
+        """Returns the request to send, as modified by the hooks"""
+        if _MASTER_BEFORE_SEND or self._hooks:
+            retval = call_hooks("modbus.Master.before_send", (self, request), self._hooks)
+            if retval is not None:
+                request = retval
+        if self._trace is not None:
+            self._trace.record(TRACE_TX, request, self._slave_offset)
         if self._verbose:
             print(get_log_buffer("-> ", request))
-        self._send(request)
-
-        call_hooks("modbus.Master.after_send", (self, ))
+        return request
 
-        if slave != 0:
-            # receive the data from the slave
-            response = self._recv(expected_length)
-            # print("response: " + "".join("%02x " % i for i in response))
+    def _after_send(self):
+        """Call the after_send hooks"""
+        if _MASTER_AFTER_SEND or self._hooks:
+            call_hooks("modbus.Master.after_send", (self, ), self._hooks)
 
-            # response = response1[:]
-            # print("response=" + "".join("%02x " % i for i in response))
+    def _parse_response(self, frame, response):
+        """Returns the data of the response to the query of frame, see execute"""
+        (query, request, expected_length, codec, quantity_of_x, data_format) = frame
 
-            retval = call_hooks("modbus.Master.after_recv", (self, response))
+        if _MASTER_AFTER_RECV or self._hooks:
+            retval = call_hooks("modbus.Master.after_recv", (self, response), self._hooks)
             if retval is not None:
                 response = retval
 
-            if self._verbose:
-                print(get_log_buffer("<- ", response))
+        if self._trace is not None:
+            self._trace.record(TRACE_RX, response, self._slave_offset)
+        if self._verbose:
+            print(get_log_buffer("<- ", response))
 
-            # extract the pdu part of the response
-            response_pdu = query.parse_response(response)
+        if not len(response):
+            raise ModbusTimeoutError("No response from slave")
 
-            # analyze the received data
-            (return_code, byte_2) = struct.unpack(">BB", response_pdu[0:2])
+        # extract the pdu part of the response
+        response_pdu = self._extract_pdu(query, response)
 
-            if return_code > 0x80:
-                # the slave has returned an error
-                exception_code = byte_2
-                raise ModbusError(exception_code)
-            else:
-                if is_read_function:
-                    # get the values returned by the reading function
-                    byte_count = byte_2
-                    data = response_pdu[2:]
-                    if byte_count != len(data):
-                        # the byte count in the pdu is invalid
-                        raise ModbusInvalidResponseError(
-                            "Byte count is {0} while actual number of bytes is {1}. ".format(
-                                byte_count, len(data))
-                        )
-                else:
-                    # returns what is returned by the slave after a writing function
-                    data = response_pdu[1:]
-
-                # returns the data as a tuple according to the data_format
-                # (calculated based on the function or user-defined)
-                result = struct.unpack(data_format, data)
-                if nb_of_digits > 0:
-                    digits = []
-                    for byte_val in result:
-                        for i in range(8):
-                            if len(digits) >= nb_of_digits:
-                                break
-                            digits.append(byte_val % 2)
-                            byte_val = byte_val >> 1
-                    result = tuple(digits)
-                return result
+        # analyze the received data
+        if len(response_pdu) < 2:
+            raise ModbusInvalidResponseError(
+                "Response pdu length is invalid {0}".format(len(response_pdu)))
+        if response_pdu[0] > 0x80:
+            # the slave has returned an error
+            raise ModbusError(response_pdu[1])
+
+        # returns the data according to the codec of the function and the
+        # data_format (calculated based on the function or user-defined)
+        return codec.decode_response(response_pdu, quantity_of_x, data_format)
+
+    def _extract_pdu(self, query, response):
+        """Returns the pdu of the response, see Query.parse_response"""
+        return query.parse_response(response)
+
+    def execute(
+            self, slave, function_code, starting_address, quantity_of_x=0, output_value=0, data_format="", expected_length=-1,
+            write_starting_address_fc23=0):
+        """
+        Execute a modbus query and returns the data part of the answer as a tuple
+        The returned tuple depends on the query function code. see modbus protocol
+        specification for details
+        data_format makes possible to extract the data like defined in the
+        struct python module documentation, or with any object with an unpack
+        method like modbus.codecs.Format. The function codes are handled by
+        the codecs of modbus.codecs, see register_codec
+        write_starting_address_fc23 is the address of the registers written
+        by READ_WRITE_MULTIPLE_REGISTERS
+        """
+        if self._metrics is not None:
+            return self._execute_measured(
+                slave, function_code, starting_address, quantity_of_x, output_value, data_format, expected_length,
+                write_starting_address_fc23)
+
+        frame = self._get_frame(
+            slave, function_code, starting_address, quantity_of_x, output_value, data_format, expected_length,
+            write_starting_address_fc23)
+
+        # send the request to the slave
+        request = self._prepare_request(frame[1])
+        self._send(request)
+
+        self._after_send()
+
+        if slave != 0 or not self._has_broadcast:
+            # receive the data from the slave
+            response = self._recv(frame[2])
+            return self._parse_response(frame, response)
+
+    def read_device_identification(self, slave, read_code=defines.READ_DEVICE_ID_BASIC, object_id=0):
+        """
+        Read the device identification objects of a slave, with as many
+        DEVICE_INFO requests as needed
+        Returns a dictionary {object id: bytes}
+        """
+        objects = {}
+        while True:
+            (conformity_level, more_follows, next_object_id, received) = self.execute(
+                slave, defines.DEVICE_INFO, object_id, read_code)
+            objects.update(received)
+            if more_follows != 0xFF or not received:
+                return objects
+            object_id = next_object_id
+
+    def _execute_measured(
+            self, slave, function_code, starting_address, quantity_of_x, output_value, data_format, expected_length,
+            write_starting_address_fc23):
+        """Same as execute, recording the duration of every step in the metrics"""
+        metrics = self._metrics
+        start_us = utils.ticks_us()
+        built_us = sent_us = received_us = -1
+        self._first_byte_us = -1
+        try:
+            frame = self._get_frame(
+                slave, function_code, starting_address, quantity_of_x, output_value, data_format, expected_length,
+                write_starting_address_fc23)
+            request = self._prepare_request(frame[1])
+            built_us = utils.ticks_us()
+            self._send(request)
+            self._after_send()
+            sent_us = received_us = utils.ticks_us()
+            result = None
+            if slave != 0 or not self._has_broadcast:
+                response = self._recv(frame[2])
+                received_us = utils.ticks_us()
+                result = self._parse_response(frame, response)
+        except Exception as excpt:
+            if not isinstance(excpt, ModbusError):
+                # only an exception response is a complete transaction
+                received_us = -1
+            metrics.record(
+                slave, function_code, start_us, built_us, sent_us, self._first_byte_us, received_us,
+                utils.ticks_us(), excpt)
+            raise
+        metrics.record(
+            slave, function_code, start_us, built_us, sent_us, self._first_byte_us, received_us, utils.ticks_us())
+        return result
 
 
 class ModbusBlock(object):
-    """This class represents the values for a range of addresses"""
+    """
+    This class represents the values of a range of registers
+    The values are stored as big endian words, like on the wire, so that a
+    range can be copied from a request or to a response in a single step
+    """
 
     def __init__(self, starting_address, size, name=''):
         """
         Contructor: defines the address range and creates the array of values
         """
         self.starting_address = starting_address
-        self._data = [0] * size
-        self.size = len(self._data)
+        self.size = size
+        self.name = name
+        self._data = self._make_data(size)
+        self._view = memoryview(self._data)
+
+    def _make_data(self, size):
+        """Returns the buffer holding size values"""
+        return bytearray(2 * size)
 
     def is_in(self, starting_address, size):
         """
@@ -354,11 +500,596 @@ class ModbusBlock(object):
             return (starting_address + size) > self.starting_address
         return True
 
+    def _get(self, offset):
+        """Returns the value at offset"""
+        return (self._data[2 * offset] << 8) | self._data[2 * offset + 1]
+
+    def _set(self, offset, value):
+        """Set the value at offset"""
+        self._data[2 * offset] = (value >> 8) & 0xFF
+        self._data[2 * offset + 1] = value & 0xFF
+
+    def _check_range(self, offset, count):
+        """Raise OutOfModbusBlockError if the range is not in the block"""
+        if offset < 0 or count < 0 or offset + count > self.size:
+            raise OutOfModbusBlockError(
+                "offset {0} count {1} is out of block of size {2}".format(offset, count, self.size))
+
+    def _slice_range(self, item):
+        """Returns the (offset, count) of a slice of the block"""
+        if item.step not in (None, 1):
+            raise InvalidArgumentError("Slices with a step are not supported")
+        start = 0 if item.start is None else item.start
+        stop = self.size if item.stop is None else item.stop
+        if start < 0:
+            start += self.size
+        if stop < 0:
+            stop += self.size
+        start = min(max(start, 0), self.size)
+        stop = min(max(stop, start), self.size)
+        return start, stop - start
+
+    def _index(self, item):
+        """Returns the offset of an index of the block"""
+        if item < 0:
+            item += self.size
+        if item < 0 or item >= self.size:
+            raise IndexError("block index out of range")
+        return item
+
+    def get_values(self, offset, count):
+        """Returns a tuple of count values starting at offset"""
+        self._check_range(offset, count)
+        return struct.unpack_from(">" + count * "H", self._data, 2 * offset)
+
+    def set_values(self, offset, values):
+        """Set the values starting at offset"""
+        self._check_range(offset, len(values))
+        if _BLOCK_SETITEM:
+            call_hooks("modbus.ModbusBlock.setitem", (self, slice(offset, offset + len(values)), values))
+        data = self._data
+        index = 2 * offset
+        for value in values:
+            data[index] = (value >> 8) & 0xFF
+            data[index + 1] = value & 0xFF
+            index += 2
+
+    def read_into(self, out, out_offset, offset, count):
+        """
+        Copy count values starting at offset to out, in the wire format
+        Returns the number of bytes written
+        """
+        self._check_range(offset, count)
+        out[out_offset:out_offset + 2 * count] = self._view[2 * offset:2 * (offset + count)]
+        return 2 * count
+
+    def write_from(self, data, data_offset, offset, count):
+        """Set count values starting at offset from data, in the wire format"""
+        self._check_range(offset, count)
+        if _BLOCK_SETITEM:
+            call_hooks("modbus.ModbusBlock.setitem", (
+                self, slice(offset, offset + count), struct.unpack_from(">" + count * "H", data, data_offset)))
+        self._view[2 * offset:2 * (offset + count)] = data[data_offset:data_offset + 2 * count]
+
+    def __len__(self):
+        return self.size
+
     def __getitem__(self, item):
         """"""
-        return self._data.__getitem__(item)
+        if isinstance(item, slice):
+            (offset, count) = self._slice_range(item)
+            return self.get_values(offset, count)
+        return self._get(self._index(item))
 
     def __setitem__(self, item, value):
         """"""
-        call_hooks("modbus.ModbusBlock.setitem", (self, item, value))
-        return self._data.__setitem__(item, value)
+        if isinstance(item, slice):
+            (offset, count) = self._slice_range(item)
+            if len(value) != count:
+                raise InvalidArgumentError("The size of a block can't be changed")
+            return self.set_values(offset, value)
+        offset = self._index(item)
+        if _BLOCK_SETITEM:
+            call_hooks("modbus.ModbusBlock.setitem", (self, item, value))
+        self._set(offset, value)
+
+
+class ModbusBitBlock(ModbusBlock):
+    """
+    This class represents the values of a range of coils or discrete inputs
+    The values are packed 8 per byte, the first one in the lowest bit, like on
+    the wire
+    """
+
+    def _make_data(self, size):
+        """Returns the buffer holding size values"""
+        return bytearray((size + 7) // 8)
+
+    def _get(self, offset):
+        """Returns the value at offset"""
+        return (self._data[offset >> 3] >> (offset & 7)) & 1
+
+    def _set(self, offset, value):
+        """Set the value at offset"""
+        if value:
+            self._data[offset >> 3] |= 1 << (offset & 7)
+        else:
+            self._data[offset >> 3] &= ~(1 << (offset & 7)) & 0xFF
+
+    def get_values(self, offset, count):
+        """Returns a tuple of count values starting at offset"""
+        self._check_range(offset, count)
+        get = self._get
+        return tuple(get(i) for i in range(offset, offset + count))
+
+    def set_values(self, offset, values):
+        """Set the values starting at offset"""
+        self._check_range(offset, len(values))
+        if _BLOCK_SETITEM:
+            call_hooks("modbus.ModbusBlock.setitem", (self, slice(offset, offset + len(values)), values))
+        set_bit = self._set
+        for value in values:
+            set_bit(offset, value)
+            offset += 1
+
+    def read_into(self, out, out_offset, offset, count):
+        """
+        Copy count values starting at offset to out, in the wire format
+        Returns the number of bytes written
+        """
+        self._check_range(offset, count)
+        data = self._data
+        byte_count = (count + 7) >> 3
+        first = offset >> 3
+        shift = offset & 7
+        if shift == 0:
+            out[out_offset:out_offset + byte_count] = self._view[first:first + byte_count]
+        else:
+            last = len(data) - 1
+            for i in range(byte_count):
+                index = first + i
+                value = data[index] >> shift
+                if index < last:
+                    value |= (data[index + 1] << (8 - shift)) & 0xFF
+                out[out_offset + i] = value
+        if count & 7:
+            # the unused bits of the last byte must be 0
+            out[out_offset + byte_count - 1] &= (1 << (count & 7)) - 1
+        return byte_count
+
+    def write_from(self, data, data_offset, offset, count):
+        """Set count values starting at offset from data, in the wire format"""
+        self._check_range(offset, count)
+        if _BLOCK_SETITEM:
+            call_hooks("modbus.ModbusBlock.setitem", (self, slice(offset, offset + count), tuple(
+                (data[data_offset + (i >> 3)] >> (i & 7)) & 1 for i in range(count))))
+        full_bytes = count >> 3
+        if offset & 7 == 0 and full_bytes:
+            first = offset >> 3
+            self._view[first:first + full_bytes] = data[data_offset:data_offset + full_bytes]
+            done = full_bytes << 3
+        else:
+            done = 0
+        set_bit = self._set
+        for i in range(done, count):
+            set_bit(offset + i, (data[data_offset + (i >> 3)] >> (i & 7)) & 1)
+
+
+class BlockIndex(object):
+    """
+    Blocks of a slave sorted by starting address, to find the block holding
+    a range of addresses with a binary search
+    """
+
+    def __init__(self):
+        """Constructor"""
+        self._starts = []
+        self._blocks = []
+
+    def _bisect(self, address):
+        """Returns the number of blocks starting at or before address"""
+        starts = self._starts
+        low = 0
+        high = len(starts)
+        while low < high:
+            middle = (low + high) // 2
+            if address < starts[middle]:
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def add(self, block):
+        """Add a block, raise OverlapModbusBlockError if it overlaps another one"""
+        index = self._bisect(block.starting_address)
+        for neighbour in self._blocks[max(index - 1, 0):index + 1]:
+            if neighbour.is_in(block.starting_address, block.size):
+                raise OverlapModbusBlockError(
+                    "Overlap block at {0} size {1}".format(neighbour.starting_address, neighbour.size))
+        self._starts.insert(index, block.starting_address)
+        self._blocks.insert(index, block)
+
+    def remove(self, block):
+        """Remove a block"""
+        index = self._blocks.index(block)
+        del self._starts[index]
+        del self._blocks[index]
+
+    def clear(self):
+        """Remove all the blocks"""
+        del self._starts[:]
+        del self._blocks[:]
+
+    def find(self, starting_address, size):
+        """Returns the block holding the range of addresses, None if there is none"""
+        index = self._bisect(starting_address)
+        if index:
+            block = self._blocks[index - 1]
+            if starting_address + size <= block.starting_address + block.size:
+                return block
+        return None
+
+    def __iter__(self):
+        return iter(self._blocks)
+
+    def __len__(self):
+        return len(self._blocks)
+
+
+class Slave(object):
+    """
+    This class define a modbus slave which is in charge of making the action
+    asked by a modbus query
+    """
+
+    def __init__(self, slave_id):
+        """Constructor"""
+        self._id = slave_id
+        # name -> (block_type, block)
+        self._blocks = {}
+        # block_type -> blocks sorted by address
+        self._memory = {
+            defines.COILS: BlockIndex(),
+            defines.DISCRETE_INPUTS: BlockIndex(),
+            defines.HOLDING_REGISTERS: BlockIndex(),
+            defines.ANALOG_INPUTS: BlockIndex(),
+        }
+        # function code -> (handler, hook name)
+        self._fn_code_map = {
+            defines.READ_COILS: (self._read_coils, "modbus.Slave.handle_read_coils_request"),
+            defines.READ_DISCRETE_INPUTS: (
+                self._read_discrete_inputs, "modbus.Slave.handle_read_discrete_inputs_request"),
+            defines.READ_HOLDING_REGISTERS: (
+                self._read_holding_registers, "modbus.Slave.handle_read_holding_registers_request"),
+            defines.READ_INPUT_REGISTERS: (
+                self._read_input_registers, "modbus.Slave.handle_read_input_registers_request"),
+            defines.WRITE_SINGLE_COIL: (
+                self._write_single_coil, "modbus.Slave.handle_write_single_coil_request"),
+            defines.WRITE_SINGLE_REGISTER: (
+                self._write_single_register, "modbus.Slave.handle_write_single_register_request"),
+            defines.WRITE_MULTIPLE_COILS: (
+                self._write_multiple_coils, "modbus.Slave.handle_write_multiple_coils_request"),
+            defines.WRITE_MULTIPLE_REGISTERS: (
+                self._write_multiple_registers, "modbus.Slave.handle_write_multiple_registers_request"),
+            defines.READ_WRITE_MULTIPLE_REGISTERS: (
+                self._read_write_multiple_registers, "modbus.Slave.handle_read_write_multiple_registers_request"),
+        }
+        # bind the hook list of every function
+        for (function_code, (handler, hook_name)) in list(self._fn_code_map.items()):
+            self._fn_code_map[function_code] = (handler, hook_name, get_hooks(hook_name))
+
+    def get_id(self):
+        """Returns the id of the slave"""
+        return self._id
+
+    def _get_block(self, block_type, starting_address, quantity_of_x):
+        """Returns the block holding the given range of addresses"""
+        block = self._memory[block_type].find(starting_address, quantity_of_x)
+        if block is None:
+            raise ModbusError(defines.ILLEGAL_DATA_ADDRESS)
+        return block
+
+    def _read_digital(self, block_type, request_pdu, out):
+        """Read the value of coils or discrete inputs"""
+        (starting_address, quantity_of_x) = struct.unpack_from(">HH", request_pdu, 1)
+        if quantity_of_x <= 0 or quantity_of_x > defines.MAX_READ_BITS:
+            raise ModbusError(defines.ILLEGAL_DATA_VALUE)
+        block = self._get_block(block_type, starting_address, quantity_of_x)
+        offset = starting_address - block.starting_address
+
+        byte_count = block.read_into(out, 2, offset, quantity_of_x)
+        out[1] = byte_count
+        return 2 + byte_count
+
+    def _read_coils(self, request_pdu, out):
+        """handle read coils modbus function"""
+        return self._read_digital(defines.COILS, request_pdu, out)
+
+    def _read_discrete_inputs(self, request_pdu, out):
+        """handle read discrete inputs modbus function"""
+        return self._read_digital(defines.DISCRETE_INPUTS, request_pdu, out)
+
+    def _read_registers(self, block_type, starting_address, quantity_of_x, out):
+        """Write the values of registers in the response"""
+        if quantity_of_x <= 0 or quantity_of_x > defines.MAX_READ_REGISTERS:
+            raise ModbusError(defines.ILLEGAL_DATA_VALUE)
+        block = self._get_block(block_type, starting_address, quantity_of_x)
+        offset = starting_address - block.starting_address
+
+        byte_count = block.read_into(out, 2, offset, quantity_of_x)
+        out[1] = byte_count
+        return 2 + byte_count
+
+    def _read_holding_registers(self, request_pdu, out):
+        """handle read holding registers modbus function"""
+        (starting_address, quantity_of_x) = struct.unpack_from(">HH", request_pdu, 1)
+        return self._read_registers(defines.HOLDING_REGISTERS, starting_address, quantity_of_x, out)
+
+    def _read_input_registers(self, request_pdu, out):
+        """handle read input registers modbus function"""
+        (starting_address, quantity_of_x) = struct.unpack_from(">HH", request_pdu, 1)
+        return self._read_registers(defines.ANALOG_INPUTS, starting_address, quantity_of_x, out)
+
+    def _write_single_coil(self, request_pdu, out):
+        """execute modbus function 5"""
+        (data_address, value) = struct.unpack_from(">HH", request_pdu, 1)
+        if value not in (0, 0xFF00):
+            raise ModbusError(defines.ILLEGAL_DATA_VALUE)
+        block = self._get_block(defines.COILS, data_address, 1)
+        block[data_address - block.starting_address] = 1 if value else 0
+        # the response echoes the request
+        out[1:5] = request_pdu[1:5]
+        return 5
+
+    def _write_single_register(self, request_pdu, out):
+        """execute modbus function 6"""
+        (data_address, value) = struct.unpack_from(">HH", request_pdu, 1)
+        block = self._get_block(defines.HOLDING_REGISTERS, data_address, 1)
+        block[data_address - block.starting_address] = value
+        # the response echoes the request
+        out[1:5] = request_pdu[1:5]
+        return 5
+
+    def _write_multiple_coils(self, request_pdu, out):
+        """execute modbus function 15"""
+        (starting_address, quantity_of_x, byte_count) = struct.unpack_from(">HHB", request_pdu, 1)
+        if (quantity_of_x <= 0 or quantity_of_x > defines.MAX_WRITE_BITS
+                or byte_count != (quantity_of_x + 7) // 8 or len(request_pdu) < 6 + byte_count):
+            raise ModbusError(defines.ILLEGAL_DATA_VALUE)
+        block = self._get_block(defines.COILS, starting_address, quantity_of_x)
+        offset = starting_address - block.starting_address
+
+        block.write_from(request_pdu, 6, offset, quantity_of_x)
+        out[1:5] = request_pdu[1:5]
+        return 5
+
+    def _write_registers(self, starting_address, quantity_of_x, byte_count, request_pdu, data_offset):
+        """Write the values of a request in the holding registers"""
+        if (quantity_of_x <= 0 or quantity_of_x > defines.MAX_WRITE_REGISTERS
+                or byte_count != 2 * quantity_of_x or len(request_pdu) < data_offset + byte_count):
+            raise ModbusError(defines.ILLEGAL_DATA_VALUE)
+        block = self._get_block(defines.HOLDING_REGISTERS, starting_address, quantity_of_x)
+        offset = starting_address - block.starting_address
+        block.write_from(request_pdu, data_offset, offset, quantity_of_x)
+
+    def _write_multiple_registers(self, request_pdu, out):
+        """execute modbus function 16"""
+        (starting_address, quantity_of_x, byte_count) = struct.unpack_from(">HHB", request_pdu, 1)
+        self._write_registers(starting_address, quantity_of_x, byte_count, request_pdu, 6)
+        out[1:5] = request_pdu[1:5]
+        return 5
+
+    def _read_write_multiple_registers(self, request_pdu, out):
+        """execute modbus function 23"""
+        (read_address, read_quantity, write_address, write_quantity, byte_count) = struct.unpack_from(
+            ">HHHHB", request_pdu, 1)
+        # the write is done before the read
+        self._write_registers(write_address, write_quantity, byte_count, request_pdu, 10)
+        return self._read_registers(defines.HOLDING_REGISTERS, read_address, read_quantity, out)
+
+    def handle_request(self, request_pdu, out, broadcast=False):
+        """
+        Parse the request pdu, make the corresponding action and write the
+        response pdu in the out buffer
+        Returns the length of the response pdu
+        """
+        function_code = request_pdu[0]
+        out[0] = function_code
+        try:
+            retval = None
+            if _SLAVE_HANDLE_REQUEST:
+                retval = call_hooks("modbus.Slave.handle_request", (self, request_pdu))
+            if retval is None:
+                try:
+                    (handler, hook_name, hooks) = self._fn_code_map[function_code]
+                except KeyError:
+                    raise ModbusError(defines.ILLEGAL_FUNCTION)
+                if hooks:
+                    retval = call_hooks(hook_name, (self, request_pdu))
+                if retval is None:
+                    length = handler(request_pdu, out)
+            if retval is not None:
+                length = len(retval)
+                out[:length] = retval
+
+            if broadcast:
+                call_hooks("modbus.Slave.on_handle_broadcast", (self, out[:length]))
+            return length
+
+        except ModbusError as excpt:
+            call_hooks("modbus.Slave.on_exception", (self, function_code, excpt))
+            out[0] = function_code | 0x80
+            out[1] = excpt.get_exception_code()
+            return 2
+
+        except struct.error as excpt:
+            # the request is too short for its function
+            call_hooks("modbus.Slave.on_exception", (self, function_code, excpt))
+            out[0] = function_code | 0x80
+            out[1] = defines.ILLEGAL_DATA_VALUE
+            return 2
+
+    def add_block(self, block_name, block_type, starting_address, size):
+        """Add a new block identified by its name"""
+        if block_name in self._blocks:
+            raise DuplicatedKeyError("Block {0} already exists. ".format(block_name))
+        if block_type not in self._memory:
+            raise InvalidModbusBlockError("Invalid block type {0}".format(block_type))
+        if starting_address < 0 or size <= 0 or starting_address + size > 0x10000:
+            raise InvalidArgumentError(
+                "Invalid block: starting address {0}, size {1}".format(starting_address, size))
+
+        if block_type in (defines.COILS, defines.DISCRETE_INPUTS):
+            block = ModbusBitBlock(starting_address, size, block_name)
+        else:
+            block = ModbusBlock(starting_address, size, block_name)
+        # raise an error if the new block overlaps an existing block of the same type
+        self._memory[block_type].add(block)
+        self._blocks[block_name] = (block_type, block)
+        return block
+
+    def remove_block(self, block_name):
+        """Remove the block with the given name"""
+        try:
+            (block_type, block) = self._blocks.pop(block_name)
+        except KeyError:
+            raise MissingKeyError("block {0} not found".format(block_name))
+        self._memory[block_type].remove(block)
+
+    def remove_all_blocks(self):
+        """Remove all the blocks"""
+        self._blocks.clear()
+        for blocks in self._memory.values():
+            blocks.clear()
+
+    def _get_block_by_name(self, block_name):
+        """Returns the block with the given name"""
+        try:
+            return self._blocks[block_name][1]
+        except KeyError:
+            raise MissingKeyError("block {0} not found".format(block_name))
+
+    def set_values(self, block_name, address, values):
+        """
+        Set the values of the items at the given address
+        values is a single value or a list of values
+        """
+        block = self._get_block_by_name(block_name)
+        if not isinstance(values, (list, tuple)):
+            values = (values, )
+        block.set_values(address - block.starting_address, values)
+
+    def get_values(self, block_name, address, size=1):
+        """Returns a tuple of the values of the items at the given address"""
+        block = self._get_block_by_name(block_name)
+        return block.get_values(address - block.starting_address, size)
+
+
+class Databank(object):
+    """A databank is a shared place containing the data of all the slaves"""
+
+    def __init__(self):
+        """Constructor"""
+        self._slaves = {}
+
+    def add_slave(self, slave_id):
+        """Add a new slave with the given id"""
+        if (slave_id <= 0) or (slave_id > 255):
+            raise InvalidArgumentError("Invalid slave id {0}".format(slave_id))
+        if slave_id in self._slaves:
+            raise DuplicatedKeyError("Slave {0} already exists".format(slave_id))
+        slave = Slave(slave_id)
+        self._slaves[slave_id] = slave
+        return slave
+
+    def get_slave(self, slave_id):
+        """Get the slave with the given id"""
+        try:
+            return self._slaves[slave_id]
+        except KeyError:
+            raise MissingKeyError("Slave {0} doesn't exist".format(slave_id))
+
+    def remove_slave(self, slave_id):
+        """Remove the slave with the given id"""
+        try:
+            del self._slaves[slave_id]
+        except KeyError:
+            raise MissingKeyError("Slave {0} doesn't exist".format(slave_id))
+
+    def remove_all_slaves(self):
+        """clean the list of slaves"""
+        self._slaves.clear()
+
+    def handle_request(self, slave_id, request_pdu, out):
+        """
+        Let the slave(s) addressed by the request handle it and write the
+        response pdu in the out buffer
+        Returns the length of the response pdu, 0 if there is no response:
+        broadcast or slave served by another device
+        """
+        try:
+            if slave_id == 0:
+                # broadcast: all the slaves handle the request but none answers
+                for slave in self._slaves.values():
+                    slave.handle_request(request_pdu, out, broadcast=True)
+                return 0
+            try:
+                slave = self._slaves[slave_id]
+            except KeyError:
+                return 0
+            return slave.handle_request(request_pdu, out)
+        except Exception as excpt:
+            call_hooks("modbus.Databank.on_error", (self, excpt, request_pdu))
+            out[0] = request_pdu[0] | 0x80
+            out[1] = defines.SLAVE_DEVICE_FAILURE
+            return 2
+
+
+class Server(object):
+    """
+    This class owns the databank of the slaves served by a device
+    To be subclassed with a class implementing the MAC layer
+    """
+
+    def __init__(self, databank=None):
+        """Constructor"""
+        self._databank = databank if databank is not None else Databank()
+        self._verbose = False
+
+    def set_verbose(self, verbose):
+        """print some more log prints for debug purpose"""
+        self._verbose = verbose
+
+    def get_db(self):
+        """returns the databank"""
+        return self._databank
+
+    def add_slave(self, slave_id):
+        """add a slave to the server"""
+        return self._databank.add_slave(slave_id)
+
+    def get_slave(self, slave_id):
+        """get the slave with the given id"""
+        return self._databank.get_slave(slave_id)
+
+    def remove_slave(self, slave_id):
+        """remove the slave with the given id"""
+        self._databank.remove_slave(slave_id)
+
+    def remove_all_slaves(self):
+        """remove all the slaves"""
+        self._databank.remove_all_slaves()
+
+    def _handle(self, slave_id, request_pdu, out):
+        """Returns the length of the response pdu written in out"""
+        if _SERVER_BEFORE_HANDLE_REQUEST:
+            retval = call_hooks("modbus.Server.before_handle_request", (self, request_pdu))
+            if retval is not None:
+                request_pdu = retval
+        length = self._databank.handle_request(slave_id, request_pdu, out)
+        if length and _SERVER_AFTER_HANDLE_REQUEST:
+            retval = call_hooks("modbus.Server.after_handle_request", (self, out[:length]))
+            if retval is not None:
+                length = len(retval)
+                out[:length] = retval
+        return length
@@ -25,11 +25,20 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import struct
 
+try:
+    from micropython import const
+except ImportError:
+    def const(value):
+        return value
+
 # from modbus import LOGGER
-from modbus.modbus import (Query, Master,
+from modbus.modbus import (Query, Master, Server,
                            InvalidArgumentError, ModbusInvalidResponseError, ModbusInvalidRequestError
                            )
-from modbus.hooks import call_hooks
+from modbus.exceptions import ModbusError, ModbusTimeoutError
+from modbus.hooks import call_hooks, get_hooks
+from modbus import crc
+from modbus import defines
 from modbus import utils
 
 # Some values used in the serial_prep callback
@@ -38,6 +47,38 @@ serial_cb_tx_end = const(0x02)
 serial_cb_rx_begin = const(0x03)
 serial_cb_rx_end = const(0x04)
 
+# Hook lists tested before calling call_hooks, see modbus.modbus
+_MASTER_BEFORE_SEND = get_hooks("modbus_rtu.RtuMaster.before_send")
+_MASTER_AFTER_RECV = get_hooks("modbus_rtu.RtuMaster.after_recv")
+_SERVER_AFTER_READ = get_hooks("modbus_rtu.RtuServer.after_read")
+_SERVER_BEFORE_WRITE = get_hooks("modbus_rtu.RtuServer.before_write")
+_SERVER_AFTER_WRITE = get_hooks("modbus_rtu.RtuServer.after_write")
+
+# Maximum size of a Modbus RTU ADU: slave + pdu (253 bytes) + crc
+MAX_ADU_SIZE = const(256)
+
+# Smallest RTU response, an exception: slave + func + exception code + crc
+MIN_RESPONSE_SIZE = const(5)
+
+# Delay after a broadcast before the next unicast request, in milliseconds,
+# which lets the slaves process the broadcast (100 to 200 ms in the spec)
+DEFAULT_BROADCAST_TURNAROUND_MS = const(100)
+
+# Functions whose response is: slave + func + byte count + data + crc
+_BYTE_COUNT_FUNCTIONS = (
+    defines.READ_COILS, defines.READ_DISCRETE_INPUTS, defines.READ_HOLDING_REGISTERS,
+    defines.READ_INPUT_REGISTERS, defines.REPORT_SLAVE_ID, defines.READ_WRITE_MULTIPLE_REGISTERS
+)
+
+# Length of the responses which don't depend on the request
+_FIXED_RESPONSE_LENGTHS = {
+    defines.WRITE_SINGLE_COIL: 8,
+    defines.WRITE_SINGLE_REGISTER: 8,
+    defines.READ_EXCEPTION_STATUS: 5,
+    defines.WRITE_MULTIPLE_COILS: 8,
+    defines.WRITE_MULTIPLE_REGISTERS: 8,
+}
+
 
 class RtuQuery(Query):
     """Subclass of a Query. Adds the Modbus RTU specific part of the protocol"""
@@ -55,16 +96,19 @@ class RtuQuery(Query):
             raise InvalidArgumentError(
                 "Invalid address {0}".format(self._request_address))
         data = struct.pack(">B", self._request_address) + pdu
-        crc = struct.pack(">H", utils.calculate_crc(data))
-        return data + crc
-
-    def parse_response(self, response):
-        """Extract the pdu from the Modbus RTU response"""
+        return data + struct.pack("<H", crc.crc16(data))
+
+    def parse_response(self, response, crc_valid=None):
+        """
+        Extract the pdu from the Modbus RTU response
+        crc_valid is the result of the CRC check of the response when it has
+        already been done while receiving it, see modbus.crc.Crc16
+        """
         if len(response) < 3:
             raise ModbusInvalidResponseError(
                 "Response length is invalid {0}".format(len(response)))
 
-        (self._response_address, ) = struct.unpack(">B", response[0:1])
+        self._response_address = response[0]
 
         if self._request_address != self._response_address:
             raise ModbusInvalidResponseError(
@@ -73,12 +117,12 @@ class RtuQuery(Query):
                 )
             )
 
-        (crc, ) = struct.unpack(">H", response[-2:])
-
-        if crc != utils.calculate_crc(response[:-2]):
+        if crc_valid is None:
+            crc_valid = crc.check_crc(response)
+        if not crc_valid:
             raise ModbusInvalidResponseError("Invalid CRC in response")
 
-        return response[1:-2]
+        return response[1:len(response) - 2]
 
     def parse_request(self, request):
         """Extract the pdu from the Modbus RTU request"""
@@ -88,8 +132,7 @@ class RtuQuery(Query):
 
         (self._request_address, ) = struct.unpack(">B", request[0:1])
 
-        (crc, ) = struct.unpack(">H", request[-2:])
-        if crc != utils.calculate_crc(request[:-2]):
+        if not crc.check_crc(request):
             raise ModbusInvalidRequestError("Invalid CRC in request")
 
         return self._request_address, request[1:-2]
@@ -98,41 +141,270 @@ class RtuQuery(Query):
         """Build the response"""
         self._response_address = self._request_address
         data = struct.pack(">B", self._response_address) + response_pdu
-        crc = struct.pack(">H", utils.calculate_crc(data))
-        return data + crc
+        return data + struct.pack("<H", crc.crc16(data))
+
+
+# Length of the requests: (index of the byte count or -1, length without the data)
+_REQUEST_LENGTHS = {
+    defines.READ_COILS: (-1, 8),
+    defines.READ_DISCRETE_INPUTS: (-1, 8),
+    defines.READ_HOLDING_REGISTERS: (-1, 8),
+    defines.READ_INPUT_REGISTERS: (-1, 8),
+    defines.WRITE_SINGLE_COIL: (-1, 8),
+    defines.WRITE_SINGLE_REGISTER: (-1, 8),
+    defines.READ_EXCEPTION_STATUS: (-1, 4),
+    defines.DIAGNOSTIC: (-1, 8),
+    defines.REPORT_SLAVE_ID: (-1, 4),
+    defines.WRITE_MULTIPLE_COILS: (6, 9),
+    defines.WRITE_MULTIPLE_REGISTERS: (6, 9),
+    defines.READ_WRITE_MULTIPLE_REGISTERS: (10, 13),
+    defines.DEVICE_INFO: (-1, 7),
+}
+
+
+class RtuFrameDecoder(object):
+    """
+    Learns the length of a Modbus RTU response from its header while it is
+    being received, so that the reception can end as soon as the frame is
+    complete rather than on a timeout
+    """
+
+    def __init__(self):
+        """Constructor"""
+        self.frame_length = -1
+        self._default_length = -1
+        self._request_length = -1
+
+    def reset(self, default_length=-1, request_length=-1):
+        """
+        Start a new frame
+        default_length is used for the functions which don't tell the length
+        of their response. request_length is the length of the request, which
+        is echoed by the diagnostic function
+        """
+        self.frame_length = -1
+        self._default_length = default_length
+        self._request_length = request_length
+
+    def get_frame_length(self, frame):
+        """
+        Returns the length of the frame given its first MIN_RESPONSE_SIZE bytes
+        or -1 if it can't be known from them
+        """
+        function_code = frame[1]
+        if function_code & 0x80:
+            return MIN_RESPONSE_SIZE
+        if function_code in _BYTE_COUNT_FUNCTIONS:
+            return frame[2] + 5
+        try:
+            return _FIXED_RESPONSE_LENGTHS[function_code]
+        except KeyError:
+            pass
+        if function_code == defines.DIAGNOSTIC and self._default_length < 0:
+            return self._request_length
+        return self._default_length
+
+    def _device_info_remaining(self, frame, size):
+        """
+        Returns the number of bytes missing from a read device identification
+        response: its length is only known after its last object header
+        """
+        # slave + func + MEI type + read code + conformity + more follows +
+        # next object id + number of objects, then id + length + value per object
+        offset = 8
+        if size < offset:
+            return offset - size
+        for _ in range(frame[7]):
+            if size < offset + 2:
+                return offset + 2 - size
+            offset += 2 + frame[offset + 1]
+        # crc
+        length = self.frame_length = offset + 2
+        if size >= length:
+            return 0
+        return length - size
+
+    def remaining(self, frame, size):
+        """
+        Returns the number of bytes missing from a frame of which size bytes
+        have been received: 0 when the frame is complete, -1 when its length
+        is unknown and the end of frame must be detected by timeout
+        """
+        length = self.frame_length
+        if length < 0:
+            if size < MIN_RESPONSE_SIZE:
+                return MIN_RESPONSE_SIZE - size
+            if frame[1] == defines.DEVICE_INFO and self._default_length < 0:
+                return self._device_info_remaining(frame, size)
+            length = self.frame_length = self.get_frame_length(frame)
+            if length < 0:
+                return -1
+        if size >= length:
+            return 0
+        return length - size
+
+
+class RtuRequestDecoder(object):
+    """
+    Learns the length of a Modbus RTU request from its header while it is
+    being received, so that a server can answer without waiting for the
+    silent interval which ends the frame
+    """
+
+    def remaining(self, frame, size):
+        """
+        Returns the number of bytes missing from a frame of which size bytes
+        have been received: 0 when the frame is complete, -1 when its length
+        is unknown and the end of frame must be detected by the silent interval
+        """
+        if size < 2:
+            return 2 - size
+        try:
+            (byte_count_index, length) = _REQUEST_LENGTHS[frame[1]]
+        except KeyError:
+            return -1
+        if byte_count_index >= 0:
+            if size <= byte_count_index:
+                return byte_count_index + 1 - size
+            length += frame[byte_count_index]
+        if size >= length:
+            return 0
+        return length - size
 
 
 class RtuMaster(Master):
     """Subclass of Master. Implements the Modbus RTU MAC layer"""
 
-    def __init__(self, serial, serial_prep_cb=None):
-        """Constructor. Pass the machine.UART object"""
+    def __init__(self, serial, serial_prep_cb=None, baudrate=0, hooks=None):
+        """
+        Constructor. Pass the machine.UART object
+        If the baudrate of the UART is given, the 3.5 character silent interval
+        is used to delimit frames: see set_baudrate
+        hooks are the hooks of this master only, see Master
+        """
         self._serial = serial
         self._serial_prep = serial_prep_cb
-        super(RtuMaster, self).__init__()
+        super(RtuMaster, self).__init__(hooks)
+
+        # Responses are read into this buffer, so that a poll doesn't allocate
+        # a new bytes object for every chunk read from the UART
+        self._rx_buffer = bytearray(MAX_ADU_SIZE)
+        self._rx_view = memoryview(self._rx_buffer)
+        self._decoder = RtuFrameDecoder()
+        self._request_length = -1
+        # CRC of the response, folded in chunk by chunk while it is received,
+        # and the response it was computed over
+        self._rx_crc = crc.Crc16()
+        self._rx_response = None
+
+        # Silent interval framing: duration of a character and of the 3.5
+        # characters interval, in microseconds. 0 when disabled
+        self._char_us = 0
+        self._t35_us = 0
+        # end of the last frame seen on the bus
+        self._last_frame_us = utils.ticks_us()
+        self.set_baudrate(baudrate)
+
+        # Broadcast turnaround: the next unicast request is not sent before
+        # _turnaround_end_us while _turnaround_pending is set
+        self._turnaround_us = DEFAULT_BROADCAST_TURNAROUND_MS * 1000
+        self._turnaround_end_us = 0
+        self._turnaround_pending = False
+
+        # Adaptive response timeouts, see set_health. While
+        # _response_timeout_us is set, _recv waits at most this long for the
+        # first byte of the response, from _response_start_us
+        self._health = None
+        self._response_timeout_us = 0
+        self._response_start_us = 0
 
         # For some RS-485 adapters, the sent data(echo data) appears before modbus response.
         # So read echo data and discard it.
         self.handle_local_echo = False
 
+    def set_baudrate(self, baudrate):
+        """
+        Enable the silent interval framing for the given baudrate, 0 disables it
+        A request is not sent before the bus has been silent for 3.5 characters,
+        and a response whose length can't be known from its header ends after
+        3.5 characters without any byte rather than on the UART timeout
+        """
+        if baudrate > 0:
+            char_delay = utils.calculate_rtu_inter_char(baudrate)
+            self._char_us = int(1000000 * 11 / baudrate)
+            self._t35_us = int(3.5 * char_delay * 1000000)
+        else:
+            self._char_us = 0
+            self._t35_us = 0
+
+    def set_health(self, health):
+        """
+        Use the response timeouts, retries and offline states of health, a
+        modbus.health.SlaveHealth. The first byte of a response is then
+        waited for no longer than the timeout of its slave, whatever the
+        timeout of the UART. None restores the UART timeout
+        """
+        self._health = health
+
+    def get_health(self):
+        """Returns the SlaveHealth of the master, None if there isn't any"""
+        return self._health
+
+    def set_broadcast_turnaround(self, turnaround_ms):
+        """
+        Set the delay between the end of a broadcast and the next unicast
+        request, 0 disables it. Broadcasts are not delayed by it, so that a
+        batch of them is sent back-to-back: see modbus.broadcast
+        """
+        self._turnaround_us = int(turnaround_ms * 1000)
+        if not self._turnaround_us:
+            self._turnaround_pending = False
+
+    def _wait_turnaround(self):
+        """Wait until the turnaround delay of the last broadcast has elapsed"""
+        wait_us = utils.ticks_diff(self._turnaround_end_us, utils.ticks_us())
+        if wait_us > 0:
+            utils.sleep_us(wait_us)
+        self._turnaround_pending = False
+
+    def _wait_silent_interval(self):
+        """Wait until the bus has been silent for 3.5 characters since the last frame"""
+        while utils.ticks_diff(utils.ticks_us(), self._last_frame_us) < self._t35_us:
+            pass
+
     def _send(self, request):
         """Send request to the slave"""
-        retval = call_hooks(
-            "modbus_rtu.RtuMaster.before_send", (self, request))
-        if retval is not None:
-            request = retval
+        if _MASTER_BEFORE_SEND or self._hooks:
+            retval = call_hooks("modbus_rtu.RtuMaster.before_send", (self, request), self._hooks)
+            if retval is not None:
+                request = retval
+
+        if self._turnaround_pending and request[0] != 0:
+            self._wait_turnaround()
+        if self._t35_us:
+            self._wait_silent_interval()
 
         # Check if there are any bytes waiting
-        while self._serial.any() > 0:
+        pending = self._serial.any()
+        while pending > 0:
             # Throw away any waiting bytes, to clear the buffer
-            self._serial.read(1)
+            self._serial.readinto(self._rx_buffer, min(pending, MAX_ADU_SIZE))
+            pending = self._serial.any()
 
         # Call the "serial prepare callback" before writing
         if self._serial_prep:
             self._serial_prep(serial_cb_tx_begin)
 
         self._serial.write(request)
-        print("request: " + "".join("%02x " % i for i in request))
+        self._request_length = len(request)
+        if self._t35_us:
+            # write returns once the bytes are queued: estimate when the last
+            # one leaves the UART, this matters for broadcasts
+            self._last_frame_us = utils.ticks_add(utils.ticks_us(), len(request) * self._char_us)
+        if request[0] == 0 and self._turnaround_us:
+            end_us = self._last_frame_us if self._t35_us else utils.ticks_us()
+            self._turnaround_end_us = utils.ticks_add(end_us, self._turnaround_us)
+            self._turnaround_pending = True
 
         if self._serial_prep:
             self._serial_prep(serial_cb_tx_end)
@@ -142,42 +414,308 @@ class RtuMaster(Master):
             # print("handle_local_echo")
             if self._serial_prep:
                 self._serial_prep(serial_cb_rx_begin)
-            self._serial.read(len(request))
+            self._serial.readinto(self._rx_buffer, min(len(request), MAX_ADU_SIZE))
             if self._serial_prep:
                 self._serial_prep(serial_cb_rx_end)
 
     def _recv(self, expected_length=-1):
-        """Receive the response from the slave"""
-        response = utils.to_data("")
+        """
+        Receive the response from the slave
+        Returns a memoryview on the receive buffer of the master: it is only
+        valid until the next request
+        """
+        buf = self._rx_buffer
+        view = self._rx_view
+        size = 0
         # print("start read {} bytes".format(expected_length))
 
         if self._serial_prep:
             self._serial_prep(serial_cb_rx_begin)
 
-        while True:
-            read_bytes = self._serial.read(
-                expected_length if expected_length > 0 else 1)
-
-            if not read_bytes:
+        limit = MAX_ADU_SIZE
+        if self._response_timeout_us and not self._wait_response(self._response_timeout_us):
+            limit = 0
+
+        # The decoder tells how many bytes are still needed once it has seen
+        # the header, so exception responses don't wait for the timeout
+        decoder = self._decoder
+        decoder.reset(expected_length, self._request_length)
+        rx_crc = self._rx_crc
+        rx_crc.reset()
+        serial = self._serial
+        t35_us = self._t35_us
+        last_rx_us = 0
+        while size < limit:
+            to_read = decoder.remaining(buf, size)
+            if to_read == 0:
                 break
-
-            response += read_bytes
-            if expected_length >= 0 and len(response) >= expected_length:
-                # if the expected number of byte is received consider that the response is done
-                # improve performance by avoiding end-of-response detection by timeout
+            if to_read < 0:
+                if t35_us:
+                    # Unknown length: the frame ends after a silent interval
+                    # of 3.5 characters, so only read the bytes already there
+                    pending = serial.any()
+                    if not pending:
+                        if utils.ticks_diff(utils.ticks_us(), last_rx_us) >= t35_us:
+                            break
+                        continue
+                    to_read = pending
+                else:
+                    # Unknown length: read byte per byte until the timeout
+                    to_read = 1
+            to_read = min(to_read, MAX_ADU_SIZE - size)
+            if size:
+                read_count = serial.readinto(view[size:], to_read)
+            else:
+                read_count = serial.readinto(buf, to_read)
+
+            if not read_count:
                 break
+            rx_crc.update(view[size:size + read_count])
+
+            last_rx_us = utils.ticks_us()
+            if not size:
+                # the bytes read have been received one character apart
+                self._first_byte_us = utils.ticks_add(last_rx_us, -read_count * self._char_us)
+            size += read_count
+
+        if size:
+            self._last_frame_us = last_rx_us
+        else:
+            self._last_frame_us = utils.ticks_us()
 
         if self._serial_prep:
             self._serial_prep(serial_cb_rx_end)
         # print("read finished")
-        # print("response: " + "".join("%02x " % i for i in response))
 
-        retval = call_hooks(
-            "modbus_rtu.RtuMaster.after_recv", (self, response))
-        if retval is not None:
-            return retval
+        response = view[:size]
+        self._rx_response = response
+        if _MASTER_AFTER_RECV or self._hooks:
+            retval = call_hooks("modbus_rtu.RtuMaster.after_recv", (self, response), self._hooks)
+            if retval is not None:
+                return retval
         return response
 
+    def _extract_pdu(self, query, response):
+        """See Master._extract_pdu. The CRC of a response unchanged by the hooks is already checked"""
+        if response is self._rx_response:
+            return query.parse_response(response, self._rx_crc.is_valid())
+        return query.parse_response(response)
+
+    def _wait_response(self, timeout_us):
+        """Wait for the first byte of the response, returns False on timeout"""
+        # the request may still be leaving the UART
+        start_us = self._last_frame_us if self._t35_us else utils.ticks_us()
+        self._response_start_us = start_us
+        serial = self._serial
+        while not serial.any():
+            remaining_us = timeout_us - utils.ticks_diff(utils.ticks_us(), start_us)
+            if remaining_us <= 0:
+                return False
+            # sleep_ms lets the other threads and the network stack run, where
+            # sleep_us may spin. The first byte time is corrected by _recv
+            # from the number of bytes found, when the baudrate is known
+            if remaining_us >= 1000:
+                utils.sleep_ms(1)
+            else:
+                utils.sleep_us(remaining_us)
+        return True
+
     def _make_query(self):
         """Returns an instance of a Query subclass implementing the modbus RTU protocol"""
         return RtuQuery()
+
+    def execute(
+            self, slave, function_code, starting_address, quantity_of_x=0, output_value=0, data_format="", expected_length=-1,
+            write_starting_address_fc23=0):
+        """
+        Execute a modbus query, see Master.execute
+        With a SlaveHealth, the response timeout depends on the slave, failed
+        requests are retried and the requests to an offline slave raise
+        ModbusSlaveOfflineError, see set_health
+        """
+        health = self._health
+        if health is None or slave == 0:
+            return Master.execute(
+                self, slave, function_code, starting_address, quantity_of_x, output_value, data_format,
+                expected_length, write_starting_address_fc23)
+
+        failures = 0
+        busy = 0
+        while True:
+            self._response_timeout_us = health.begin(slave)
+            self._first_byte_us = -1
+            try:
+                result = Master.execute(
+                    self, slave, function_code, starting_address, quantity_of_x, output_value, data_format,
+                    expected_length, write_starting_address_fc23)
+            except ModbusTimeoutError:
+                if not health.on_timeout(slave) or failures >= health.timeout_retries:
+                    raise
+                failures += 1
+                continue
+            except ModbusError as excpt:
+                health.on_response(slave, -1)
+                delay_ms = health.get_retry_delay_ms(excpt.get_exception_code(), busy)
+                if delay_ms < 0:
+                    raise
+                busy += 1
+                utils.sleep_ms(delay_ms)
+                continue
+            except ModbusInvalidResponseError:
+                # something answered, but garbled
+                health.on_response(slave, -1)
+                if failures >= health.timeout_retries:
+                    raise
+                failures += 1
+                continue
+            finally:
+                self._response_timeout_us = 0
+
+            # the response time of a retry may be the one of an earlier attempt
+            rtt_us = -1
+            if not failures and self._first_byte_us != -1:
+                rtt_us = max(utils.ticks_diff(self._first_byte_us, self._response_start_us), 0)
+            health.on_response(slave, rtt_us)
+            return result
+
+
+class RtuServer(Server):
+    """This class implements a simple and mono-threaded modbus rtu server"""
+
+    def __init__(self, serial, databank=None, serial_prep_cb=None, baudrate=19200):
+        """
+        Constructor: initializes the server settings
+        The baudrate of the UART gives the 3.5 character silent interval which
+        separates the frames
+        """
+        super(RtuServer, self).__init__(databank)
+        self._serial = serial
+        self._serial_prep = serial_prep_cb
+        self._rx_buffer = bytearray(MAX_ADU_SIZE)
+        self._rx_view = memoryview(self._rx_buffer)
+        self._tx_buffer = bytearray(MAX_ADU_SIZE)
+        self._tx_view = memoryview(self._tx_buffer)
+        self._decoder = RtuRequestDecoder()
+        self._char_us = int(1000000 * 11 / baudrate)
+        self._t35_us = int(3.5 * utils.calculate_rtu_inter_char(baudrate) * 1000000)
+        self._last_frame_us = utils.ticks_us()
+        self._running = False
+
+    def _read_frame(self):
+        """
+        Read a request from the UART. Returns its size, 0 if there is none
+        The frame ends when its length, known from the header, is reached or
+        after a silent interval of 3.5 characters
+        """
+        serial = self._serial
+        buf = self._rx_buffer
+        view = self._rx_view
+        if not serial.any():
+            return 0
+        size = 0
+        last_rx_us = utils.ticks_us()
+        while size < MAX_ADU_SIZE:
+            to_read = self._decoder.remaining(buf, size)
+            if to_read == 0:
+                break
+            pending = serial.any()
+            if not pending:
+                silent_us = utils.ticks_diff(utils.ticks_us(), last_rx_us)
+                if silent_us >= self._t35_us:
+                    break
+                # the next character may be on its way
+                utils.sleep_us(min(self._char_us, self._t35_us - silent_us))
+                continue
+            if to_read < 0 or to_read > pending:
+                to_read = pending
+            to_read = min(to_read, MAX_ADU_SIZE - size)
+            if size:
+                read_count = serial.readinto(view[size:], to_read)
+            else:
+                read_count = serial.readinto(buf, to_read)
+            if read_count:
+                size += read_count
+                last_rx_us = utils.ticks_us()
+        self._last_frame_us = last_rx_us
+        return size
+
+    def handle_frame(self, size):
+        """
+        Handle a request of the given size in the receive buffer
+        Returns the response to write, None if there is no response
+        """
+        request = self._rx_view[:size]
+        if _SERVER_AFTER_READ:
+            retval = call_hooks("modbus_rtu.RtuServer.after_read", (self, request))
+            if retval is not None:
+                request = retval
+                size = len(request)
+
+        if size < 4 or not crc.check_crc(request):
+            # corrupted frames are silently ignored
+            return None
+
+        tx = self._tx_buffer
+        slave_id = request[0]
+        length = self._handle(slave_id, request[1:size - 2], self._tx_view[1:])
+        if not length:
+            return None
+        tx[0] = slave_id
+        length += 1
+        struct.pack_into("<H", tx, length, crc.crc16(self._tx_view[:length]))
+        return self._tx_view[:length + 2]
+
+    def _write(self, response):
+        """Send a response"""
+        if _SERVER_BEFORE_WRITE:
+            retval = call_hooks("modbus_rtu.RtuServer.before_write", (self, response))
+            if retval is not None:
+                response = retval
+
+        # wait for the silent interval which ends the request
+        wait_us = self._t35_us - utils.ticks_diff(utils.ticks_us(), self._last_frame_us)
+        if wait_us > 0:
+            utils.sleep_us(wait_us)
+
+        if self._serial_prep:
+            self._serial_prep(serial_cb_tx_begin)
+        self._serial.write(response)
+        if self._serial_prep:
+            self._serial_prep(serial_cb_tx_end)
+        if _SERVER_AFTER_WRITE:
+            call_hooks("modbus_rtu.RtuServer.after_write", (self, response))
+
+    def serve_once(self):
+        """
+        Handle the request waiting on the UART, if any
+        Returns True if a request was read
+        """
+        try:
+            size = self._read_frame()
+            if not size:
+                return False
+            response = self.handle_frame(size)
+            if response is not None:
+                self._write(response)
+        except Exception as excpt:
+            call_hooks("modbus_rtu.RtuServer.on_error", (self, excpt))
+        return True
+
+    def serve_forever(self):
+        """
+        Handle the requests until stop is called
+        The line is polled every millisecond while it is idle, so that the
+        other threads can run
+        """
+        call_hooks("modbus_rtu.RtuServer.before_open", (self, ))
+        self._running = True
+        call_hooks("modbus_rtu.RtuServer.after_open", (self, ))
+        while self._running:
+            if not self.serve_once():
+                utils.sleep_ms(1)
+        call_hooks("modbus_rtu.RtuServer.after_close", (self, ))
+
+    def stop(self):
+        """Ask serve_forever to return"""
+        call_hooks("modbus_rtu.RtuServer.before_close", (self, ))
+        self._running = False
@@ -0,0 +1,301 @@
+"""
+micropython-modbus: Implementation of Modbus protocol for MicroPython
+https://gitlab.com/extel-open-source
+
+Based on "Modbus TestKit": https://github.com/ljean/modbus-tk
+
+Copyright (C) 2009, Luc Jean - luc.jean@gmail.com
+Copyright (C) 2009, Apidev - http://www.apidev.fr
+Copyright (C) 2018, Extel Technologies - https://gitlab.com/extel-open-source
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+from modbus.modbus import Master
+from modbus.modbus_rtu import (
+    RtuQuery, RtuFrameDecoder, MAX_ADU_SIZE, DEFAULT_BROADCAST_TURNAROUND_MS,
+    serial_cb_tx_begin, serial_cb_tx_end, serial_cb_rx_begin, serial_cb_rx_end
+)
+from modbus.exceptions import ModbusError
+from modbus.hooks import call_hooks, get_hooks
+from modbus import utils
+
+# Hook lists tested before calling call_hooks, see modbus.modbus
+_MASTER_BEFORE_SEND = get_hooks("modbus_rtu_async.AsyncRtuMaster.before_send")
+_MASTER_AFTER_RECV = get_hooks("modbus_rtu_async.AsyncRtuMaster.after_recv")
+
+
+class AsyncRtuMaster(Master):
+    """
+    Modbus RTU master for asyncio. execute is a coroutine, so the other tasks
+    keep running while a response is in flight
+
+    On MicroPython, wrap the UART in streams:
+        master = AsyncRtuMaster(asyncio.StreamReader(uart), asyncio.StreamWriter(uart, {}))
+    On CPython, any pair of asyncio streams can be used: serial port, pty,
+    socket...
+    """
+
+    def __init__(
+            self, reader, writer, serial_prep_cb=None, timeout_ms=1000, char_timeout_ms=50, baudrate=0, hooks=None):
+        """
+        Constructor
+        timeout_ms is the time allowed for a response, char_timeout_ms the
+        silence which ends a response whose length can't be known from its
+        header. If the baudrate is given, the 3.5 character silent interval is
+        used instead, and waited for before every request
+        hooks are the hooks of this master only, see Master
+        """
+        super(AsyncRtuMaster, self).__init__(hooks)
+        self._reader = reader
+        self._writer = writer
+        self._serial_prep = serial_prep_cb
+        self.timeout_ms = timeout_ms
+        self.char_timeout_ms = char_timeout_ms
+
+        # only one transaction at a time on the bus
+        self._lock = asyncio.Lock()
+
+        self._rx_buffer = bytearray(MAX_ADU_SIZE)
+        self._rx_view = memoryview(self._rx_buffer)
+        # the streams of uasyncio read into a buffer, the ones of CPython don't
+        self._has_readinto = hasattr(reader, "readinto")
+        self._decoder = RtuFrameDecoder()
+        self._request_length = -1
+        # set when a read timed out: the end of the frame may still come, and
+        # must be discarded before the next request
+        self._stale_input = False
+
+        self._char_us = 0
+        self._t35_us = 0
+        self._last_frame_us = utils.ticks_us()
+        if baudrate > 0:
+            self._char_us = int(1000000 * 11 / baudrate)
+            self._t35_us = int(3.5 * utils.calculate_rtu_inter_char(baudrate) * 1000000)
+            self.char_timeout_ms = self._t35_us / 1000
+
+        # Broadcast turnaround, see RtuMaster.set_broadcast_turnaround
+        self._turnaround_us = DEFAULT_BROADCAST_TURNAROUND_MS * 1000
+        self._turnaround_end_us = 0
+        self._turnaround_pending = False
+
+        # For some RS-485 adapters, the sent data(echo data) appears before modbus response.
+        # So read echo data and discard it.
+        self.handle_local_echo = False
+
+    async def _async_send(self, request):
+        """Send request to the slave"""
+        if _MASTER_BEFORE_SEND or self._hooks:
+            retval = call_hooks("modbus_rtu_async.AsyncRtuMaster.before_send", (self, request), self._hooks)
+            if retval is not None:
+                request = retval
+
+        if self._turnaround_pending and request[0] != 0:
+            wait_us = utils.ticks_diff(self._turnaround_end_us, utils.ticks_us())
+            if wait_us > 0:
+                await asyncio.sleep(wait_us / 1000000)
+            self._turnaround_pending = False
+        if self._t35_us:
+            wait_us = self._t35_us - utils.ticks_diff(utils.ticks_us(), self._last_frame_us)
+            if wait_us > 0:
+                await asyncio.sleep(wait_us / 1000000)
+
+        if self._stale_input:
+            await self._flush_input()
+
+        if self._serial_prep:
+            self._serial_prep(serial_cb_tx_begin)
+
+        self._writer.write(request)
+        await self._writer.drain()
+        self._request_length = len(request)
+
+        if self._serial_prep:
+            self._serial_prep(serial_cb_tx_end)
+
+        # Read the echo data, and discard it
+        if self.handle_local_echo:
+            if self._serial_prep:
+                self._serial_prep(serial_cb_rx_begin)
+            echo_length = min(len(request), MAX_ADU_SIZE)
+            deadline = utils.ticks_add(utils.ticks_ms(), self.timeout_ms)
+            if await self._read_until(self._rx_view[:echo_length], deadline) < echo_length:
+                self._stale_input = True
+            if self._serial_prep:
+                self._serial_prep(serial_cb_rx_end)
+
+        self._last_frame_us = utils.ticks_us()
+        if request[0] == 0 and self._turnaround_us:
+            self._turnaround_end_us = utils.ticks_add(self._last_frame_us, self._turnaround_us)
+            self._turnaround_pending = True
+
+    def set_broadcast_turnaround(self, turnaround_ms):
+        """Set the delay between a broadcast and the next unicast request, see RtuMaster"""
+        self._turnaround_us = int(turnaround_ms * 1000)
+        if not self._turnaround_us:
+            self._turnaround_pending = False
+
+    async def _read_chunk(self, view, timeout_ms):
+        """
+        Read the bytes available, up to len(view), into view
+        Returns their number, 0 if the stream ended or nothing came within
+        timeout_ms. A read cancelled by the timeout takes no byte, so none is
+        lost
+        """
+        try:
+            if self._has_readinto:
+                return await asyncio.wait_for(self._reader.readinto(view), timeout_ms / 1000) or 0
+            data = await asyncio.wait_for(self._reader.read(len(view)), timeout_ms / 1000)
+        except asyncio.TimeoutError:
+            return 0
+        view[:len(data)] = data
+        return len(data)
+
+    async def _read_until(self, view, deadline_ms):
+        """Fill view before the ticks_ms deadline_ms, returns the number of bytes read"""
+        size = 0
+        while size < len(view):
+            count = await self._read_chunk(view[size:], utils.ticks_diff(deadline_ms, utils.ticks_ms()))
+            if not count:
+                break
+            size += count
+        return size
+
+    async def _flush_input(self):
+        """Discard the bytes received until the line is silent for char_timeout_ms"""
+        while True:
+            try:
+                data = await asyncio.wait_for(self._reader.read(MAX_ADU_SIZE), self.char_timeout_ms / 1000)
+            except asyncio.TimeoutError:
+                break
+            if not data:
+                break
+        self._stale_input = False
+
+    async def _async_recv(self, expected_length=-1):
+        """
+        Receive the response from the slave
+        Returns a memoryview on the receive buffer of the master: it is only
+        valid until the next request
+        """
+        buf = self._rx_buffer
+        view = self._rx_view
+        size = 0
+
+        if self._serial_prep:
+            self._serial_prep(serial_cb_rx_begin)
+
+        decoder = self._decoder
+        decoder.reset(expected_length, self._request_length)
+        deadline = utils.ticks_add(utils.ticks_ms(), self.timeout_ms)
+        while size < MAX_ADU_SIZE:
+            to_read = decoder.remaining(buf, size)
+            if to_read == 0:
+                break
+            known_length = to_read > 0
+            if not known_length:
+                # Unknown length: the frame ends after char_timeout_ms without a byte
+                to_read = MAX_ADU_SIZE
+                timeout_ms = self.char_timeout_ms
+            else:
+                timeout_ms = max(utils.ticks_diff(deadline, utils.ticks_ms()), 0)
+            to_read = min(to_read, MAX_ADU_SIZE - size)
+            read_count = await self._read_chunk(view[size:size + to_read], timeout_ms)
+            if not read_count:
+                if known_length:
+                    # a late response, or its end, may still arrive
+                    self._stale_input = True
+                break
+            if not size:
+                # the bytes read have been received one character apart
+                self._first_byte_us = utils.ticks_add(utils.ticks_us(), -read_count * self._char_us)
+            size += read_count
+
+        self._last_frame_us = utils.ticks_us()
+        if self._serial_prep:
+            self._serial_prep(serial_cb_rx_end)
+
+        response = view[:size]
+        if _MASTER_AFTER_RECV or self._hooks:
+            retval = call_hooks("modbus_rtu_async.AsyncRtuMaster.after_recv", (self, response), self._hooks)
+            if retval is not None:
+                return retval
+        return response
+
+    def _make_query(self):
+        """Returns an instance of a Query subclass implementing the modbus RTU protocol"""
+        return RtuQuery()
+
+    async def execute(
+            self, slave, function_code, starting_address, quantity_of_x=0, output_value=0, data_format="", expected_length=-1,
+            write_starting_address_fc23=0):
+        """Same as Master.execute, as a coroutine"""
+        async with self._lock:
+            if self._metrics is not None:
+                return await self._async_execute_measured(
+                    slave, function_code, starting_address, quantity_of_x, output_value, data_format,
+                    expected_length, write_starting_address_fc23)
+
+            frame = self._get_frame(
+                slave, function_code, starting_address, quantity_of_x, output_value, data_format, expected_length,
+                write_starting_address_fc23)
+
+            request = self._prepare_request(frame[1])
+            await self._async_send(request)
+
+            self._after_send()
+
+            if slave != 0:
+                response = await self._async_recv(frame[2])
+                return self._parse_response(frame, response)
+
+    async def _async_execute_measured(
+            self, slave, function_code, starting_address, quantity_of_x, output_value, data_format, expected_length,
+            write_starting_address_fc23):
+        """Same as Master._execute_measured, as a coroutine"""
+        metrics = self._metrics
+        start_us = utils.ticks_us()
+        built_us = sent_us = received_us = -1
+        self._first_byte_us = -1
+        try:
+            frame = self._get_frame(
+                slave, function_code, starting_address, quantity_of_x, output_value, data_format, expected_length,
+                write_starting_address_fc23)
+            request = self._prepare_request(frame[1])
+            built_us = utils.ticks_us()
+            await self._async_send(request)
+            self._after_send()
+            sent_us = received_us = utils.ticks_us()
+            result = None
+            if slave != 0:
+                response = await self._async_recv(frame[2])
+                received_us = utils.ticks_us()
+                result = self._parse_response(frame, response)
+        except Exception as excpt:
+            if not isinstance(excpt, ModbusError):
+                # only an exception response is a complete transaction
+                received_us = -1
+            metrics.record(
+                slave, function_code, start_us, built_us, sent_us, self._first_byte_us, received_us,
+                utils.ticks_us(), excpt)
+            raise
+        metrics.record(
+            slave, function_code, start_us, built_us, sent_us, self._first_byte_us, received_us, utils.ticks_us())
+        return result
@@ -0,0 +1,392 @@
+"""
+micropython-modbus: Implementation of Modbus protocol for MicroPython
+https://gitlab.com/extel-open-source
+
+Based on "Modbus TestKit": https://github.com/ljean/modbus-tk
+
+Copyright (C) 2009, Luc Jean - luc.jean@gmail.com
+Copyright (C) 2009, Apidev - http://www.apidev.fr
+Copyright (C) 2018, Extel Technologies - https://gitlab.com/extel-open-source
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+import socket
+import struct
+import _thread
+
+from modbus.modbus import Query, Master
+from modbus.exceptions import (
+    ModbusError, InvalidArgumentError, ModbusInvalidResponseError, ModbusInvalidRequestError
+)
+from modbus.hooks import call_hooks, get_hooks
+
+# Size of the MBAP header: transaction id, protocol id, length, unit id
+MBAP_SIZE = 7
+
+# Maximum size of a Modbus TCP ADU: MBAP header + pdu (253 bytes)
+MAX_ADU_SIZE = 260
+
+# Maximum number of idle connections kept for every endpoint
+DEFAULT_POOL_SIZE = 4
+
+# Hook lists tested before calling call_hooks, see modbus.modbus
+_MASTER_BEFORE_SEND = get_hooks("modbus_tcp.TcpMaster.before_send")
+_MASTER_AFTER_SEND = get_hooks("modbus_tcp.TcpMaster.after_send")
+_MASTER_AFTER_RECV = get_hooks("modbus_tcp.TcpMaster.after_recv")
+
+_transaction_lock = _thread.allocate_lock()
+_last_transaction_id = 0
+
+
+def _next_transaction_id():
+    """Returns a new transaction id"""
+    global _last_transaction_id
+    with _transaction_lock:
+        _last_transaction_id = (_last_transaction_id + 1) & 0xFFFF
+        return _last_transaction_id
+
+
+class TcpQuery(Query):
+    """Subclass of a Query. Adds the Modbus TCP specific part of the protocol"""
+
+    def __init__(self):
+        """Constructor"""
+        super(TcpQuery, self).__init__()
+        self._transaction_id = 0
+        self._unit_id = 0
+
+    def get_transaction_id(self):
+        """Returns the transaction id of the last request built or parsed"""
+        return self._transaction_id
+
+    def build_request(self, pdu, slave):
+        """Add the Modbus TCP part to the request"""
+        if (slave < 0) or (slave > 255):
+            raise InvalidArgumentError("Invalid address {0}".format(slave))
+        self._transaction_id = _next_transaction_id()
+        self._unit_id = slave
+        return struct.pack(">HHHB", self._transaction_id, 0, len(pdu) + 1, slave) + pdu
+
+    def parse_response(self, response):
+        """Extract the pdu from the Modbus TCP response"""
+        if len(response) <= MBAP_SIZE:
+            raise ModbusInvalidResponseError(
+                "Response length is invalid {0}".format(len(response)))
+
+        (transaction_id, protocol_id, length, unit_id) = struct.unpack(">HHHB", response[:MBAP_SIZE])
+
+        if transaction_id != self._transaction_id:
+            raise ModbusInvalidResponseError(
+                "Response transaction id {0} is different from request transaction id {1}".format(
+                    transaction_id, self._transaction_id)
+            )
+        if protocol_id != 0:
+            raise ModbusInvalidResponseError("Invalid protocol id {0}".format(protocol_id))
+        if length != len(response) - MBAP_SIZE + 1:
+            raise ModbusInvalidResponseError(
+                "Response length is {0} while actual length is {1}".format(
+                    length, len(response) - MBAP_SIZE + 1)
+            )
+        if unit_id != self._unit_id:
+            raise ModbusInvalidResponseError(
+                "Response unit id {0} is different from request unit id {1}".format(unit_id, self._unit_id)
+            )
+
+        return response[MBAP_SIZE:]
+
+    def parse_request(self, request):
+        """Extract the pdu from the Modbus TCP request"""
+        if len(request) <= MBAP_SIZE:
+            raise ModbusInvalidRequestError(
+                "Request length is invalid {0}".format(len(request)))
+
+        (self._transaction_id, protocol_id, length, self._unit_id) = struct.unpack(
+            ">HHHB", request[:MBAP_SIZE])
+        if protocol_id != 0 or length != len(request) - MBAP_SIZE + 1:
+            raise ModbusInvalidRequestError("Invalid MBAP header in request")
+
+        return self._unit_id, request[MBAP_SIZE:]
+
+    def build_response(self, response_pdu):
+        """Build the response"""
+        return struct.pack(
+            ">HHHB", self._transaction_id, 0, len(response_pdu) + 1, self._unit_id) + response_pdu
+
+
+def read_adu(sock):
+    """Read a Modbus TCP ADU from the socket. Returns b"" if the connection is closed"""
+    response = b""
+    to_read = MBAP_SIZE
+    while to_read > 0:
+        read_bytes = sock.recv(to_read)
+        if not read_bytes:
+            return b""
+        response += read_bytes
+        to_read -= len(read_bytes)
+        if to_read == 0 and len(response) == MBAP_SIZE:
+            # the header gives the length of the rest of the frame
+            (length, ) = struct.unpack(">H", response[4:6])
+            if length < 1 or length > MAX_ADU_SIZE - MBAP_SIZE + 1:
+                raise ModbusInvalidResponseError("Invalid length {0} in MBAP header".format(length))
+            to_read = length - 1
+    return response
+
+
+class ConnectionPool(object):
+    """
+    Persistent connections to Modbus TCP endpoints. A connection is taken by
+    one transaction or pipeline at a time and given back when it is done
+    """
+
+    def __init__(self, size=DEFAULT_POOL_SIZE):
+        """Constructor: size is the maximum number of idle connections kept per endpoint"""
+        self.size = size
+        self._idle = {}
+        self._lock = _thread.allocate_lock()
+
+    def acquire(self, master):
+        """Returns an idle connection to the endpoint of the master, or a new one"""
+        endpoint = (master.host, master.port)
+        with self._lock:
+            idle = self._idle.get(endpoint)
+            if idle:
+                return idle.pop()
+        return master._connect()
+
+    def release(self, master, sock):
+        """Give back a connection which can be reused"""
+        endpoint = (master.host, master.port)
+        with self._lock:
+            idle = self._idle.setdefault(endpoint, [])
+            if len(idle) < self.size:
+                idle.append(sock)
+                return
+        master._close(sock)
+
+    def discard(self, master, sock):
+        """Close a connection which can't be reused"""
+        master._close(sock)
+
+    def close(self, master=None):
+        """Close the idle connections, of the endpoint of the master or all of them"""
+        with self._lock:
+            if master is None:
+                endpoints = list(self._idle.items())
+                self._idle = {}
+            else:
+                endpoint = (master.host, master.port)
+                endpoints = [(endpoint, self._idle.pop(endpoint, []))]
+        for (endpoint, idle) in endpoints:
+            for sock in idle:
+                sock.close()
+
+
+# Pool shared by the masters which aren't given one
+_DEFAULT_POOL = ConnectionPool()
+
+
+class TcpMaster(Master):
+    """Subclass of Master. Implements the Modbus TCP MAC layer"""
+
+    # the unit id follows the transaction id, protocol id and length
+    _slave_offset = MBAP_SIZE - 1
+
+    # there is no broadcast on Modbus TCP: the servers answer unit id 0 too
+    _has_broadcast = False
+
+    def __init__(self, host="127.0.0.1", port=502, timeout_in_sec=5.0, pool=None, max_outstanding=8, hooks=None):
+        """
+        Constructor
+        The connections are taken from pool, which defaults to a pool shared by
+        all the masters. max_outstanding is the number of requests
+        execute_pipelined sends before waiting for their responses
+        hooks are the hooks of this master only, see Master
+        """
+        super(TcpMaster, self).__init__(hooks)
+        self.host = host
+        self.port = port
+        self._timeout = timeout_in_sec
+        self._pool = pool or _DEFAULT_POOL
+        self.max_outstanding = max_outstanding
+        self._sock = None
+        # transaction id of the request sent, which the response must repeat
+        self._sent_id = b""
+        # the transaction id is part of the frame, so frames can't be reused
+        self.set_frame_cache_size(0)
+
+    def _connect(self):
+        """Open a new connection to the endpoint"""
+        call_hooks("modbus_tcp.TcpMaster.before_connect", (self, ), self._hooks)
+        address = socket.getaddrinfo(self.host, self.port)[0][-1]
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self._timeout)
+            try:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            except (AttributeError, OSError):
+                # not available on every port
+                pass
+            sock.connect(address)
+        except OSError:
+            sock.close()
+            raise
+        call_hooks("modbus_tcp.TcpMaster.after_connect", (self, ), self._hooks)
+        return sock
+
+    def _close(self, sock):
+        """Close a connection"""
+        call_hooks("modbus_tcp.TcpMaster.before_close", (self, ), self._hooks)
+        sock.close()
+        call_hooks("modbus_tcp.TcpMaster.after_close", (self, ), self._hooks)
+
+    def close(self):
+        """Close the idle connections to the endpoint of the master"""
+        if self._sock is not None:
+            self._pool.discard(self, self._sock)
+            self._sock = None
+        self._pool.close(self)
+
+    def _write(self, sock, request):
+        """Send a request on the connection"""
+        if _MASTER_BEFORE_SEND or self._hooks:
+            retval = call_hooks("modbus_tcp.TcpMaster.before_send", (self, request), self._hooks)
+            if retval is not None:
+                request = retval
+        sock.sendall(request)
+        if _MASTER_AFTER_SEND or self._hooks:
+            call_hooks("modbus_tcp.TcpMaster.after_send", (self, request), self._hooks)
+
+    def _read(self, sock):
+        """Read a response from the connection"""
+        response = read_adu(sock)
+        if _MASTER_AFTER_RECV or self._hooks:
+            retval = call_hooks("modbus_tcp.TcpMaster.after_recv", (self, response), self._hooks)
+            if retval is not None:
+                return retval
+        return response
+
+    def _send(self, request):
+        """Send request to the slave"""
+        self._sock = self._pool.acquire(self)
+        self._sent_id = request[:2]
+        try:
+            self._write(self._sock, request)
+        except Exception:
+            # the request may be partly written
+            self._pool.discard(self, self._sock)
+            self._sock = None
+            raise
+
+    def _recv(self, expected_length=-1):
+        """Receive the response from the slave"""
+        sock = self._sock
+        if sock is None:
+            # no request was sent
+            return b""
+        self._sock = None
+        try:
+            response = self._read(sock)
+        except OSError:
+            # a timeout or a broken connection, the stream can't be trusted anymore
+            self._pool.discard(self, sock)
+            return b""
+        except Exception:
+            # an invalid MBAP header: the stream is out of sync
+            self._pool.discard(self, sock)
+            raise
+        if response and response[:2] == self._sent_id:
+            self._pool.release(self, sock)
+        else:
+            # closed by the server, or the response of another request: the
+            # stream is out of sync. parse_response reports the mismatch
+            self._pool.discard(self, sock)
+        return response
+
+    def execute(
+            self, slave, function_code, starting_address, quantity_of_x=0, output_value=0, data_format="", expected_length=-1,
+            write_starting_address_fc23=0):
+        """See Master.execute"""
+        try:
+            return super(TcpMaster, self).execute(
+                slave, function_code, starting_address, quantity_of_x, output_value, data_format, expected_length,
+                write_starting_address_fc23)
+        finally:
+            if self._sock is not None:
+                # an error before reading the response, which may still come
+                self._pool.discard(self, self._sock)
+                self._sock = None
+
+    def _make_query(self):
+        """Returns an instance of a Query subclass implementing the modbus TCP protocol"""
+        return TcpQuery()
+
+    def _make_frame(
+            self, slave, function_code, starting_address, quantity_of_x=0, output_value=0, data_format="",
+            expected_length=-1, write_starting_address_fc23=0):
+        """_get_frame with the defaults of execute"""
+        return self._get_frame(
+            slave, function_code, starting_address, quantity_of_x, output_value, data_format, expected_length,
+            write_starting_address_fc23)
+
+    def execute_pipelined(self, requests):
+        """
+        Execute several queries on one connection without waiting for each
+        response before sending the next request: up to max_outstanding
+        requests are in flight, and responses are matched by transaction id.
+        requests is a list of tuples of the arguments of execute
+        Returns the list of the results, in the order of the requests. The
+        result of a failed query is the exception it raised
+        """
+        results = [None] * len(requests)
+        frames = [self._make_frame(*args) for args in requests]
+        pending = {}
+        sock = self._pool.acquire(self)
+        try:
+            next_index = 0
+            while next_index < len(frames) or pending:
+                while next_index < len(frames) and len(pending) < self.max_outstanding:
+                    frame = frames[next_index]
+                    request = self._prepare_request(frame[1])
+                    self._write(sock, request)
+                    self._after_send()
+                    pending[frame[0].get_transaction_id()] = next_index
+                    next_index += 1
+                if not pending:
+                    continue
+
+                response = self._read(sock)
+                if not response:
+                    raise ModbusInvalidResponseError("Connection closed by the server")
+                (transaction_id, ) = struct.unpack(">H", response[:2])
+                try:
+                    index = pending.pop(transaction_id)
+                except KeyError:
+                    raise ModbusInvalidResponseError("Unexpected transaction id {0}".format(transaction_id))
+                try:
+                    results[index] = self._parse_response(frames[index], response)
+                except (ModbusError, ModbusInvalidResponseError) as excpt:
+                    results[index] = excpt
+        except (OSError, ModbusInvalidResponseError) as excpt:
+            # the connection is lost or out of sync: fail what is left
+            self._pool.discard(self, sock)
+            for index in list(pending.values()) + list(range(next_index, len(frames))):
+                results[index] = excpt
+            return results
+        except Exception:
+            self._pool.discard(self, sock)
+            raise
+        self._pool.release(self, sock)
+        return results
@@ -0,0 +1,146 @@
+"""
+micropython-modbus: Implementation of Modbus protocol for MicroPython
+https://gitlab.com/extel-open-source
+
+Based on "Modbus TestKit": https://github.com/ljean/modbus-tk
+
+Copyright (C) 2009, Luc Jean - luc.jean@gmail.com
+Copyright (C) 2009, Apidev - http://www.apidev.fr
+Copyright (C) 2018, Extel Technologies - https://gitlab.com/extel-open-source
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+import _thread
+
+from modbus import utils
+
+
+class MultiBusExecutor(object):
+    """
+    Runs the requests of several buses in parallel, with one master per
+    bus (one UART or serial port each) and one thread per bus, so a cycle
+    takes as long as the slowest bus rather than the sum of all of them.
+    The threads are started by the first run and wait for the next one,
+    call close to stop them
+    """
+
+    def __init__(self, masters):
+        """Constructor: masters is the list of the masters, one per bus"""
+        self._masters = list(masters)
+        count = len(self._masters)
+        # requests of every bus: (index in the results, execute args, execute kwargs)
+        self._requests = [[] for _ in range(count)]
+        self._count = 0
+        self._results = []
+        # time spent by every bus during the last run
+        self.bus_time_us = [0] * count
+
+        self._started = False
+        self._running = False
+        # the worker of a bus waits on its start lock and releases its done lock
+        self._start_locks = []
+        self._done_locks = []
+
+    def add_request(self, bus, slave, function_code, starting_address, quantity_of_x=0, output_value=0,
+                    data_format="", expected_length=-1, write_starting_address_fc23=0):
+        """
+        Add a request to the given bus, executed by every run
+        Returns the index of its result in the list returned by run
+        """
+        index = self._count
+        self._requests[bus].append(
+            (index, (slave, function_code, starting_address, quantity_of_x, output_value, data_format, expected_length,
+                     write_starting_address_fc23)))
+        self._count += 1
+        return index
+
+    def clear(self):
+        """Remove all the requests"""
+        for requests in self._requests:
+            del requests[:]
+        self._count = 0
+
+    def _run_bus(self, bus):
+        """Execute the requests of a bus"""
+        master = self._masters[bus]
+        results = self._results
+        start = utils.ticks_us()
+        for (index, args) in self._requests[bus]:
+            try:
+                results[index] = master.execute(*args)
+            except Exception as excpt:
+                # an exception must not kill the worker of the bus
+                results[index] = excpt
+        self.bus_time_us[bus] = utils.ticks_diff(utils.ticks_us(), start)
+
+    def _worker(self, bus):
+        """Thread of a bus: run its requests every time the executor runs"""
+        start_lock = self._start_locks[bus]
+        done_lock = self._done_locks[bus]
+        while True:
+            start_lock.acquire()
+            if not self._running:
+                done_lock.release()
+                return
+            self._run_bus(bus)
+            done_lock.release()
+
+    def _start(self):
+        """Start the threads of the buses, except the first one which runs in the caller's thread"""
+        self._running = True
+        for bus in range(len(self._masters)):
+            start_lock = _thread.allocate_lock()
+            done_lock = _thread.allocate_lock()
+            start_lock.acquire()
+            done_lock.acquire()
+            self._start_locks.append(start_lock)
+            self._done_locks.append(done_lock)
+            if bus > 0:
+                _thread.start_new_thread(self._worker, (bus, ))
+        self._started = True
+
+    def run(self):
+        """
+        Execute the requests of all the buses
+        Returns the list of the results, in the order the requests were
+        added. The result of a failed request is the exception it raised
+        """
+        self._results = [None] * self._count
+        if not self._started:
+            self._start()
+
+        busy = []
+        for bus in range(1, len(self._masters)):
+            if self._requests[bus]:
+                self._start_locks[bus].release()
+                busy.append(bus)
+        if self._requests and self._requests[0]:
+            self._run_bus(0)
+        for bus in busy:
+            self._done_locks[bus].acquire()
+        return self._results
+
+    def close(self):
+        """Stop the threads of the buses"""
+        if not self._started:
+            return
+        self._running = False
+        for bus in range(1, len(self._masters)):
+            self._start_locks[bus].release()
+            self._done_locks[bus].acquire()
+        self._start_locks = []
+        self._done_locks = []
+        self._started = False
@@ -0,0 +1,191 @@
+"""
+micropython-modbus: Implementation of Modbus protocol for MicroPython
+https://gitlab.com/extel-open-source
+
+Based on "Modbus TestKit": https://github.com/ljean/modbus-tk
+
+Copyright (C) 2009, Luc Jean - luc.jean@gmail.com
+Copyright (C) 2009, Apidev - http://www.apidev.fr
+Copyright (C) 2018, Extel Technologies - https://gitlab.com/extel-open-source
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+from modbus import defines
+from modbus.exceptions import (
+    ModbusError, InvalidArgumentError, ModbusInvalidResponseError
+)
+
+# Cost of an extra request, in bytes on the wire: request (8 bytes), header
+# and crc of the response (5 bytes) and the silent intervals around them
+DEFAULT_REQUEST_COST = 20
+
+# Cost of a byte read but not used, relative to a byte of DEFAULT_REQUEST_COST
+DEFAULT_HOLE_COST = 1
+
+# function used to read each block type
+_READ_FUNCTIONS = {
+    defines.COILS: defines.READ_COILS,
+    defines.DISCRETE_INPUTS: defines.READ_DISCRETE_INPUTS,
+    defines.HOLDING_REGISTERS: defines.READ_HOLDING_REGISTERS,
+    defines.ANALOG_INPUTS: defines.READ_INPUT_REGISTERS,
+}
+
+# limit of a single request of each read function
+_MAX_READ_QUANTITY = {
+    defines.READ_COILS: defines.MAX_READ_BITS,
+    defines.READ_DISCRETE_INPUTS: defines.MAX_READ_BITS,
+    defines.READ_HOLDING_REGISTERS: defines.MAX_READ_REGISTERS,
+    defines.READ_INPUT_REGISTERS: defines.MAX_READ_REGISTERS,
+}
+
+
+class ReadRequest(object):
+    """A read request of the plan and the tags it serves"""
+
+    def __init__(self, slave, function_code, starting_address, quantity_of_x):
+        """Constructor"""
+        self.slave = slave
+        self.function_code = function_code
+        self.starting_address = starting_address
+        self.quantity_of_x = quantity_of_x
+        # (name, offset in the response, count) of every tag
+        self.tags = []
+
+    def execute(self, master, results):
+        """Execute the request with the master and store the value of its tags in results"""
+        values = master.execute(self.slave, self.function_code, self.starting_address, self.quantity_of_x)
+        for (name, offset, count) in self.tags:
+            results[name] = values[offset:offset + count]
+
+    def __repr__(self):
+        return "ReadRequest({0}, {1}, {2}, {3})".format(
+            self.slave, self.function_code, self.starting_address, self.quantity_of_x)
+
+
+class ReadPlanner(object):
+    """
+    Merges the reads of many tags into as few modbus requests as possible.
+    Tags of the same slave and block type are read together when they fit in
+    a single request. A hole between two tags is read too when reading it
+    costs less than an extra request: gap bytes * hole_cost <= request_cost
+    """
+
+    def __init__(self, request_cost=DEFAULT_REQUEST_COST, hole_cost=DEFAULT_HOLE_COST):
+        """Constructor"""
+        self.request_cost = request_cost
+        self.hole_cost = hole_cost
+        self._tags = {}
+        self._requests = None
+        # (request, exception) of the requests which failed during the last execute
+        self.errors = []
+
+    def add_tag(self, slave, block_type, address, count=1, name=None):
+        """
+        Add a tag to read: count items of the given block type (see defines)
+        starting at address. The values are returned under the given name,
+        or under (slave, block_type, address, count) if no name is given
+        """
+        try:
+            function_code = _READ_FUNCTIONS[block_type]
+        except KeyError:
+            raise InvalidArgumentError("Invalid block type {0}".format(block_type))
+        max_quantity = _MAX_READ_QUANTITY[function_code]
+        if count < 1 or count > max_quantity:
+            raise InvalidArgumentError(
+                "Invalid count {0}: must be between 1 and {1}".format(count, max_quantity))
+        if address < 0 or address + count > 0x10000:
+            raise InvalidArgumentError("Invalid address {0}".format(address))
+        if name is None:
+            name = (slave, block_type, address, count)
+        self._tags[name] = (slave, function_code, address, count)
+        self._requests = None
+        return name
+
+    def remove_tag(self, name):
+        """Remove a tag"""
+        del self._tags[name]
+        self._requests = None
+
+    def _merge_cost(self, function_code, gap):
+        """Returns the cost of reading gap unused items"""
+        if function_code in (defines.READ_COILS, defines.READ_DISCRETE_INPUTS):
+            return (gap * self.hole_cost) / 8
+        return 2 * gap * self.hole_cost
+
+    def plan(self):
+        """Returns the list of the requests reading all the tags"""
+        if self._requests is not None:
+            return self._requests
+
+        groups = {}
+        for (name, (slave, function_code, address, count)) in self._tags.items():
+            key = (slave, function_code)
+            try:
+                groups[key].append((address, count, name))
+            except KeyError:
+                groups[key] = [(address, count, name)]
+
+        requests = []
+        for key in sorted(groups):
+            (slave, function_code) = key
+            max_quantity = _MAX_READ_QUANTITY[function_code]
+            tags = groups[key]
+            tags.sort(key=lambda tag: (tag[0], tag[1]))
+
+            members = []
+            start = end = 0
+            for (address, count, name) in tags:
+                tag_end = address + count
+                if members:
+                    gap = address - end
+                    new_end = max(end, tag_end)
+                    if new_end - start <= max_quantity and (
+                            gap <= 0 or self._merge_cost(function_code, gap) <= self.request_cost):
+                        members.append((address, count, name))
+                        end = new_end
+                        continue
+                    requests.append(self._make_request(slave, function_code, start, end, members))
+                members = [(address, count, name)]
+                start = address
+                end = tag_end
+            if members:
+                requests.append(self._make_request(slave, function_code, start, end, members))
+
+        self._requests = requests
+        return requests
+
+    def _make_request(self, slave, function_code, start, end, members):
+        """Returns the request for the given tags"""
+        request = ReadRequest(slave, function_code, start, end - start)
+        for (address, count, name) in members:
+            request.tags.append((name, address - start, count))
+        return request
+
+    def execute(self, master, results=None):
+        """
+        Execute all the requests of the plan with the master
+        Returns a dict of the tag values. The tags of a failed request are not
+        in it, and the error is recorded in self.errors
+        """
+        if results is None:
+            results = {}
+        errors = self.errors = []
+        for request in self.plan():
+            try:
+                request.execute(master, results)
+            except (ModbusError, ModbusInvalidResponseError) as excpt:
+                errors.append((request, excpt))
+        return results
@@ -0,0 +1,293 @@
+"""
+micropython-modbus: Implementation of Modbus protocol for MicroPython
+https://gitlab.com/extel-open-source
+
+Based on "Modbus TestKit": https://github.com/ljean/modbus-tk
+
+Copyright (C) 2009, Luc Jean - luc.jean@gmail.com
+Copyright (C) 2009, Apidev - http://www.apidev.fr
+Copyright (C) 2018, Extel Technologies - https://gitlab.com/extel-open-source
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+import struct
+
+from modbus import defines
+from modbus.codecs import Format
+from modbus.exceptions import (
+    DuplicatedKeyError, MissingKeyError, InvalidArgumentError, ModbusInvalidResponseError
+)
+
+# Types of tags: the struct code of their value, big endian
+UINT16 = "H"
+INT16 = "h"
+UINT32 = "I"
+INT32 = "i"
+FLOAT32 = "f"
+UINT64 = "Q"
+INT64 = "q"
+FLOAT64 = "d"
+# some bits of a register: see the bit and width of Tag
+BITS = "bits"
+
+_TYPES = (UINT16, INT16, UINT32, INT32, FLOAT32, UINT64, INT64, FLOAT64, BITS)
+
+# Order of the registers of the values of more than one register
+WORD_ORDER_BIG = 0      # most significant register first, as in the Modbus specification
+WORD_ORDER_LITTLE = 1   # least significant register first ("word swapped")
+
+
+class Tag(object):
+    """A value of a register map"""
+
+    def __init__(self, name, address, tag_type=UINT16, word_order=WORD_ORDER_BIG, scale=1, offset=0, bit=0, width=1):
+        """
+        Constructor: the value at address is value * scale + offset
+        A BITS tag is (register >> bit) & (2 ** width - 1)
+        """
+        if tag_type not in _TYPES:
+            raise InvalidArgumentError("Invalid tag type {0}".format(tag_type))
+        if tag_type == BITS:
+            if bit < 0 or width <= 0 or bit + width > 16:
+                raise InvalidArgumentError("Invalid bits {0}:{1} of tag {2}".format(bit, width, name))
+            self.count = 1
+        else:
+            self.count = struct.calcsize(tag_type) // 2
+        if word_order not in (WORD_ORDER_BIG, WORD_ORDER_LITTLE):
+            raise InvalidArgumentError("Invalid word order {0}".format(word_order))
+        self.name = name
+        self.address = address
+        self.tag_type = tag_type
+        self.word_order = word_order if self.count > 1 else WORD_ORDER_BIG
+        self.scale = scale
+        self.offset = offset
+        self.bit = bit
+        self.width = width
+
+    def _field_key(self):
+        """Returns the key of the register field holding the tag"""
+        if self.tag_type == BITS:
+            return (self.address, UINT16, WORD_ORDER_BIG)
+        return (self.address, self.tag_type, self.word_order)
+
+
+class RegisterPlan(object):
+    """
+    The plan to read the tags of a contiguous block of registers with one
+    request and to decode them in one pass
+
+    It is the data_format of its request: Master.execute returns the values
+    of the tags, in the order of names, or the output of the register map
+    when it was compiled with one
+    """
+
+    def __init__(self, function_code, starting_address, quantity, tags, out=None):
+        """
+        Constructor: tags is a list of (Tag, index) sorted by address, index
+        being the position of the value in out
+        """
+        self.function_code = function_code
+        self.starting_address = starting_address
+        self.quantity = quantity
+        self.size = 2 * quantity
+        self.tags = tuple(tag for (tag, index) in tags)
+        self.names = tuple(tag.name for tag in self.tags)
+        self._out = out
+
+        # the unused registers are unpacked as ignored fields: the pad byte
+        # isn't supported by every MicroPython version
+        fmt = ">"
+        fields = {}
+        nb_of_fields = 0
+        swaps = []
+        ops = []
+        address = starting_address
+        for (position, (tag, index)) in enumerate(tags):
+            key = tag._field_key()
+            field = fields.get(key)
+            if field is None:
+                if tag.address < address:
+                    raise InvalidArgumentError("The tag {0} overlaps another tag".format(tag.name))
+                if tag.address > address:
+                    fmt += "{0}H".format(tag.address - address)
+                    nb_of_fields += tag.address - address
+                field = fields[key] = nb_of_fields
+                nb_of_fields += 1
+                fmt += key[1]
+                if tag.word_order == WORD_ORDER_LITTLE:
+                    # byte offsets of the registers to exchange before unpacking
+                    first = 2 * (tag.address - starting_address)
+                    for i in range(tag.count // 2):
+                        swaps.append((first + 2 * i, first + 2 * (tag.count - 1 - i)))
+                address = tag.address + tag.count
+            mask = (1 << tag.width) - 1 if tag.tag_type == BITS else 0
+            ops.append((
+                field, tag.bit, mask, tag.scale, tag.offset, tag.scale != 1 or tag.offset != 0,
+                position if out is None else index))
+        if address < starting_address + quantity:
+            fmt += "{0}H".format(starting_address + quantity - address)
+            nb_of_fields += starting_address + quantity - address
+
+        self._format = Format(fmt)
+        self._swaps = tuple(swaps)
+        if swaps:
+            self._scratch = bytearray(self.size)
+            self._scratch_view = memoryview(self._scratch)
+        # the values are the fields when there isn't anything to compute
+        self._direct = out is None and nb_of_fields == len(ops) and not any(
+            op[2] or op[5] for op in ops)
+        self._ops = tuple(ops)
+
+    def unpack(self, data):
+        """Decode the tags from the data of a response"""
+        if len(data) != self.size:
+            raise ModbusInvalidResponseError(
+                "The plan at {0} expects {1} bytes and got {2}".format(self.starting_address, self.size, len(data)))
+        if self._swaps:
+            buf = self._scratch
+            self._scratch_view[:] = data
+            for (first, second) in self._swaps:
+                high = buf[first]
+                low = buf[first + 1]
+                buf[first] = buf[second]
+                buf[first + 1] = buf[second + 1]
+                buf[second] = high
+                buf[second + 1] = low
+            data = buf
+        values = self._format.unpack(data)
+        if self._direct:
+            return values
+
+        out = self._out
+        if out is None:
+            out = [0] * len(self._ops)
+        for (field, shift, mask, scale, offset, scaled, index) in self._ops:
+            value = values[field]
+            if mask:
+                value = (value >> shift) & mask
+            if scaled:
+                value = value * scale + offset
+            out[index] = value
+        if self._out is None:
+            return tuple(out)
+        return out
+
+    def execute(self, master, slave):
+        """Read and decode the tags of the plan"""
+        return master.execute(slave, self.function_code, self.starting_address, self.quantity, data_format=self)
+
+
+class RegisterMap(object):
+    """
+    Schema of the registers of a device: the tags, their type, word order
+    and scaling. compile turns it into RegisterPlan, one per contiguous block
+    """
+
+    def __init__(self, function_code=defines.READ_HOLDING_REGISTERS, max_quantity=defines.MAX_READ_REGISTERS, max_gap=0):
+        """
+        Constructor: the tags are read with function_code. A plan reads at most
+        max_quantity registers and can include max_gap unused registers
+        between two tags
+        """
+        if function_code not in (defines.READ_HOLDING_REGISTERS, defines.READ_INPUT_REGISTERS):
+            raise InvalidArgumentError("Invalid function code {0} for a register map".format(function_code))
+        self.function_code = function_code
+        self.max_quantity = max_quantity
+        self.max_gap = max_gap
+        self._tags = []
+        self._names = {}
+        self._plans = None
+
+    def add_tag(self, name, address, tag_type=UINT16, word_order=WORD_ORDER_BIG, scale=1, offset=0, bit=0, width=1):
+        """Add a tag, see Tag. Returns it"""
+        if name in self._names:
+            raise DuplicatedKeyError("The tag {0} already exists".format(name))
+        tag = Tag(name, address, tag_type, word_order, scale, offset, bit, width)
+        if tag.count > self.max_quantity:
+            raise InvalidArgumentError("The tag {0} is longer than a request".format(name))
+        self._names[name] = len(self._tags)
+        self._tags.append(tag)
+        self._plans = None
+        return tag
+
+    def remove_tag(self, name):
+        """Remove a tag"""
+        if name not in self._names:
+            raise MissingKeyError("The tag {0} doesn't exist".format(name))
+        del self._tags[self._names[name]]
+        self._names = dict((tag.name, index) for (index, tag) in enumerate(self._tags))
+        self._plans = None
+
+    def index(self, name):
+        """Returns the position of the value of a tag in the output of the map"""
+        try:
+            return self._names[name]
+        except KeyError:
+            raise MissingKeyError("The tag {0} doesn't exist".format(name))
+
+    def __len__(self):
+        return len(self._tags)
+
+    def compile(self, out=None):
+        """
+        Returns the list of RegisterPlan reading all the tags. If out is given
+        (a list or an array of len(self) items), the plans write the value of
+        every tag to out at its index, see index
+        """
+        self._plans = self._make_plans(out)
+        return self._plans
+
+    def _make_plans(self, out=None):
+        """Returns the plans reading all the tags, see compile"""
+        if out is not None and len(out) < len(self._tags):
+            raise InvalidArgumentError("The output can't hold {0} tags".format(len(self._tags)))
+        order = sorted(range(len(self._tags)), key=lambda i: (self._tags[i].address, i))
+        plans = []
+        tags = []
+        start = end = 0
+        for index in order:
+            tag = self._tags[index]
+            tag_end = tag.address + tag.count
+            if tags and (tag.address > end + self.max_gap or max(end, tag_end) - start > self.max_quantity):
+                plans.append(RegisterPlan(self.function_code, start, end - start, tags, out))
+                tags = []
+            if not tags:
+                start = tag.address
+                end = tag_end
+            tags.append((tag, index))
+            end = max(end, tag_end)
+        if tags:
+            plans.append(RegisterPlan(self.function_code, start, end - start, tags, out))
+        return plans
+
+    def read(self, master, slave):
+        """
+        Read all the tags of slave. Returns a dictionary {name: value}, or the
+        output of the map if it has been compiled with one
+        """
+        if self._plans is None:
+            self.compile()
+        values = None
+        for plan in self._plans:
+            result = plan.execute(master, slave)
+            if plan._out is not None:
+                values = result
+            else:
+                if values is None:
+                    values = {}
+                for (name, value) in zip(plan.names, result):
+                    values[name] = value
+        return values
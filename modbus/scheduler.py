@@ -0,0 +1,234 @@
+"""
+micropython-modbus: Implementation of Modbus protocol for MicroPython
+https://gitlab.com/extel-open-source
+
+Based on "Modbus TestKit": https://github.com/ljean/modbus-tk
+
+Copyright (C) 2009, Luc Jean - luc.jean@gmail.com
+Copyright (C) 2009, Apidev - http://www.apidev.fr
+Copyright (C) 2018, Extel Technologies - https://gitlab.com/extel-open-source
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+from modbus.exceptions import ModbusError, ModbusInvalidResponseError, InvalidArgumentError
+from modbus import utils
+
+# Weight of the last request in the average duration of the requests of a group
+_DURATION_SMOOTHING = 8
+
+
+class PollGroup(object):
+    """
+    A list of requests polled together every period
+    The requests are (slave, function_code, starting_address, quantity_of_x)
+    tuples, passed as is to Master.execute
+    """
+
+    def __init__(self, name, period_ms, requests, callback=None, deadline_ms=0, priority=0):
+        """
+        Constructor
+        The requests of the group must all be done deadline_ms after the start
+        of the period, which defaults to the period itself. A group whose
+        period is 0 is background work, polled when no periodic group is due:
+        the one with the highest priority goes first.
+        callback(group) is called once all the requests are done, the values
+        returned by execute or the exceptions it raised are in group.results
+        """
+        self.name = name
+        self.period_us = period_ms * 1000
+        self.deadline_us = (deadline_ms or period_ms) * 1000
+        self.requests = list(requests)
+        if not self.requests:
+            raise InvalidArgumentError("Poll group {0} has no request".format(name))
+        self.results = [None] * len(self.requests)
+        self.callback = callback
+        self.priority = priority
+
+        # current job: time of its release, absolute deadline, next request
+        self._release_us = 0
+        self._deadline_us = 0
+        self._next = len(self.requests)
+        # smoothed duration of a request, used to fit background work
+        self._request_us = 0
+
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Reset the statistics"""
+        self.runs = 0
+        self.overruns = 0
+        self.errors = 0
+        self.max_jitter_us = 0
+        self._total_jitter_us = 0
+        self.max_latency_us = 0
+
+    def stats(self):
+        """Returns the statistics of the group as a dict"""
+        return {
+            "runs": self.runs,
+            "overruns": self.overruns,
+            "errors": self.errors,
+            "max_jitter_us": self.max_jitter_us,
+            "avg_jitter_us": self._total_jitter_us // self.runs if self.runs else 0,
+            "max_latency_us": self.max_latency_us,
+        }
+
+    def is_busy(self):
+        """Returns True if some requests of the current period are not done yet"""
+        return self._next < len(self.requests)
+
+    def _release(self, now_us):
+        """Start a new job"""
+        self._release_us = now_us
+        self._deadline_us = utils.ticks_add(now_us, self.deadline_us)
+        self._next = 0
+
+
+class Scheduler(object):
+    """
+    Polls groups of requests at their own rate on a single master
+    Requests are sent earliest deadline first, one at a time, so a long group
+    doesn't hold the bus when a shorter deadline comes up. The bus time left
+    is filled with the background groups
+    """
+
+    def __init__(self, master):
+        """Constructor"""
+        self._master = master
+        self._periodic = []
+        self._background = []
+        # time until the next periodic release when run_once had nothing to do
+        self._idle_us = 0
+
+    def add_group(self, group):
+        """Add a group, its first period starts now"""
+        group._release(utils.ticks_us())
+        if group.period_us > 0:
+            self._periodic.append(group)
+        else:
+            self._background.append(group)
+
+    def remove_group(self, group):
+        """Remove a group"""
+        if group in self._periodic:
+            self._periodic.remove(group)
+        else:
+            self._background.remove(group)
+
+    def groups(self):
+        """Returns all the groups"""
+        return self._periodic + self._background
+
+    def run_once(self):
+        """
+        Send the most urgent request
+        Returns False if there was nothing to do
+        """
+        now = utils.ticks_us()
+        best = None
+        idle_us = -1
+        for group in self._periodic:
+            if not group.is_busy():
+                next_release = utils.ticks_add(group._release_us, group.period_us)
+                wait_us = utils.ticks_diff(next_release, now)
+                if wait_us > 0:
+                    if idle_us < 0 or wait_us < idle_us:
+                        idle_us = wait_us
+                    continue
+                # periods which went by entirely without a poll are overruns
+                missed = -wait_us // group.period_us
+                if missed:
+                    group.overruns += missed
+                    next_release = utils.ticks_add(next_release, missed * group.period_us)
+                group._release(next_release)
+            if best is None or utils.ticks_diff(group._deadline_us, best._deadline_us) < 0:
+                best = group
+
+        if best is None:
+            best = self._pick_background(idle_us)
+            if best is None:
+                self._idle_us = idle_us
+                return False
+
+        self._run_request(best, now)
+        return True
+
+    def _pick_background(self, idle_us):
+        """Returns the background group to poll if its next request fits in idle_us"""
+        best = None
+        for group in self._background:
+            if best is None or group.priority > best.priority:
+                best = group
+        if best is not None and idle_us >= 0 and best._request_us > idle_us:
+            # it would delay the next periodic group
+            return None
+        return best
+
+    def _run_request(self, group, now):
+        """Send the next request of the group"""
+        index = group._next
+        if index == 0:
+            jitter_us = utils.ticks_diff(now, group._release_us)
+            group.max_jitter_us = max(group.max_jitter_us, jitter_us)
+            group._total_jitter_us += jitter_us
+
+        try:
+            group.results[index] = self._master.execute(*group.requests[index])
+        except (ModbusError, ModbusInvalidResponseError) as excpt:
+            group.results[index] = excpt
+            group.errors += 1
+        group._next = index + 1
+
+        done = utils.ticks_us()
+        duration_us = utils.ticks_diff(done, now)
+        group._request_us += (duration_us - group._request_us) // _DURATION_SMOOTHING
+
+        if group._next >= len(group.requests):
+            group.runs += 1
+            group.max_latency_us = max(group.max_latency_us, utils.ticks_diff(done, group._release_us))
+            if group.period_us > 0:
+                if utils.ticks_diff(done, group._deadline_us) > 0:
+                    group.overruns += 1
+            else:
+                # background: start again, after the other groups of the same priority
+                self._background.remove(group)
+                self._background.append(group)
+                group._release(done)
+            if group.callback:
+                group.callback(group)
+
+    def run(self, duration_ms=0):
+        """
+        Run the scheduler for duration_ms, or forever if it is 0
+        Returns at once if there is no group
+        """
+        start = utils.ticks_ms()
+        while True:
+            left_us = -1
+            if duration_ms:
+                left_us = (duration_ms - utils.ticks_diff(utils.ticks_ms(), start)) * 1000
+                if left_us <= 0:
+                    return
+            if self.run_once():
+                continue
+            idle_us = self._idle_us
+            if idle_us < 0:
+                # no group: nothing will ever be due
+                return
+            if left_us >= 0 and idle_us > left_us:
+                idle_us = left_us
+            if idle_us > 0:
+                utils.sleep_us(idle_us)
@@ -0,0 +1,300 @@
+"""
+micropython-modbus: Implementation of Modbus protocol for MicroPython
+https://gitlab.com/extel-open-source
+
+Based on "Modbus TestKit": https://github.com/ljean/modbus-tk
+
+Copyright (C) 2009, Luc Jean - luc.jean@gmail.com
+Copyright (C) 2009, Apidev - http://www.apidev.fr
+Copyright (C) 2018, Extel Technologies - https://gitlab.com/extel-open-source
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+import random
+import struct
+
+try:
+    from micropython import const
+except ImportError:
+    def const(value):
+        return value
+
+from modbus import crc
+from modbus import utils
+from modbus.modbus import Databank
+from modbus.modbus_rtu import MAX_ADU_SIZE
+
+# Time a slave takes to start answering after the end of a request, or to
+# process a broadcast, in milliseconds. Never less than 3.5 characters
+DEFAULT_LATENCY_MS = const(1)
+
+# Probabilities are compared to 16 bits random numbers
+_RANDOM_RANGE = const(65536)
+
+
+class SimulatedBus(object):
+    """
+    An RS-485 line with simulated slaves, used in place of the machine.UART
+    of an RtuMaster to test or benchmark it off-device, in real time
+
+    write puts a request on the line like a buffered UART: every byte takes
+    11 bits at the baudrate. The slaves, backed by a Databank, answer after
+    their latency and the response bytes can be read as they arrive, any,
+    read and readinto behaving like the ones of machine.UART with its
+    timeout and timeout_char. With echo, the request is also received, like
+    with the adapters needing RtuMaster.handle_local_echo.
+
+    Faults can be injected, see set_faults. A request sent while a response
+    is on the line, or less than 3.5 characters after the previous request,
+    is lost, as well as a unicast request reaching the slaves while they
+    process a broadcast
+    """
+
+    def __init__(self, baudrate=19200, databank=None, echo=False, timeout_ms=1000, timeout_char_ms=10, seed=None):
+        """Constructor. seed makes the faults reproducible"""
+        self._databank = databank if databank is not None else Databank()
+        self.echo = echo
+        self.timeout_ms = timeout_ms
+        self.timeout_char_ms = timeout_char_ms
+        if seed is not None:
+            random.seed(seed)
+
+        self._latency_us = {}
+        self._default_latency_us = DEFAULT_LATENCY_MS * 1000
+        self._muted = {}
+        self._out = bytearray(MAX_ADU_SIZE)
+        self._out_view = memoryview(self._out)
+
+        # bytes sent to the master and their arrival time, read from _rx_pos
+        self._rx = bytearray()
+        self._rx_us = []
+        self._rx_pos = 0
+
+        # end of the last frame on the line, and whether the master sent it
+        self._line_free_us = utils.ticks_us()
+        self._master_last = False
+        self._broadcast_end_us = self._line_free_us
+
+        self.set_baudrate(baudrate)
+        self.set_faults()
+        self.reset_stats()
+
+    def set_baudrate(self, baudrate):
+        """Set the baudrate of the line"""
+        self.baudrate = baudrate
+        self._char_us = int(1000000 * 11 / baudrate)
+        self._t35_us = int(3.5 * utils.calculate_rtu_inter_char(baudrate) * 1000000)
+
+    def set_faults(self, noise_rate=0, drop_rate=0, corrupt_rate=0):
+        """
+        Inject faults in the frames received by the slaves and by the master
+        noise_rate is the probability that a bit of a byte is flipped,
+        drop_rate the probability that a byte is lost and corrupt_rate the
+        probability that the crc of a frame is wrong
+        """
+        self._noise = int(noise_rate * _RANDOM_RANGE)
+        self._drop = int(drop_rate * _RANDOM_RANGE)
+        self._corrupt = int(corrupt_rate * _RANDOM_RANGE)
+
+    def reset_stats(self):
+        """Reset the counters"""
+        self.requests = 0
+        self.responses = 0
+        # time the line has been busy
+        self.busy_us = 0
+        # requests lost: sent over a response, too close to the previous
+        # request, or while the slaves process a broadcast
+        self.collisions = 0
+        self.framing_errors = 0
+        self.missed = 0
+        # faults injected, and frames ignored by the slaves because of them
+        self.noisy_bytes = 0
+        self.dropped_bytes = 0
+        self.corrupted_frames = 0
+        self.crc_errors = 0
+
+    def get_db(self):
+        """Returns the databank of the slaves"""
+        return self._databank
+
+    def add_slave(self, slave_id, latency_ms=DEFAULT_LATENCY_MS):
+        """Add a slave, see Databank.add_slave"""
+        slave = self._databank.add_slave(slave_id)
+        self.set_latency(slave_id, latency_ms)
+        return slave
+
+    def get_slave(self, slave_id):
+        """Get the slave with the given id"""
+        return self._databank.get_slave(slave_id)
+
+    def set_latency(self, slave_id, latency_ms):
+        """Set the time the slave takes to answer"""
+        self._latency_us[slave_id] = int(latency_ms * 1000)
+
+    def set_responding(self, slave_id, responding):
+        """A slave which isn't responding ignores the requests addressed to it"""
+        if responding:
+            self._muted.pop(slave_id, None)
+        else:
+            self._muted[slave_id] = True
+
+    def _inject(self, frame):
+        """Returns the frame as received, with the faults"""
+        if not (self._noise or self._drop or self._corrupt):
+            return frame
+        getrandbits = random.getrandbits
+        received = bytearray()
+        for byte in frame:
+            if self._drop and getrandbits(16) < self._drop:
+                self.dropped_bytes += 1
+                continue
+            if self._noise and getrandbits(16) < self._noise:
+                byte ^= 1 << getrandbits(3)
+                self.noisy_bytes += 1
+            received.append(byte)
+        if self._corrupt and len(received) > 2 and getrandbits(16) < self._corrupt:
+            received[-1] ^= 1 << getrandbits(3)
+            self.corrupted_frames += 1
+        return received
+
+    def _schedule(self, frame, start_us):
+        """Make the bytes of frame arrive at the master one character apart from start_us"""
+        if self._rx_pos == len(self._rx):
+            self._rx = bytearray()
+            self._rx_us = []
+            self._rx_pos = 0
+        char_us = self._char_us
+        for index in range(len(frame)):
+            self._rx_us.append(utils.ticks_add(start_us, (index + 1) * char_us))
+        self._rx.extend(frame)
+
+    def _handle(self, frame, end_us):
+        """Let the slaves handle a request. Returns the response, None if there is none"""
+        size = len(frame)
+        if size < 4 or not crc.check_crc(frame):
+            self.crc_errors += 1
+            return None
+        slave_id = frame[0]
+        if slave_id == 0:
+            latency_us = self._default_latency_us
+            for value in self._latency_us.values():
+                latency_us = max(latency_us, value)
+            self._broadcast_end_us = utils.ticks_add(end_us, latency_us)
+        elif utils.ticks_diff(end_us, self._broadcast_end_us) < 0:
+            self.missed += 1
+            return None
+        elif slave_id in self._muted:
+            return None
+
+        out = self._out
+        length = self._databank.handle_request(slave_id, memoryview(frame)[1:size - 2], self._out_view[1:])
+        if not length:
+            return None
+        out[0] = slave_id
+        length += 1
+        struct.pack_into("<H", out, length, crc.crc16(self._out_view[:length]))
+        return bytes(out[:length + 2])
+
+    def write(self, data):
+        """Send a request on the line, returns its size"""
+        data = bytes(data)
+        size = len(data)
+        now = utils.ticks_us()
+        gap_us = utils.ticks_diff(now, self._line_free_us)
+        lost = False
+        if self._master_last:
+            if gap_us < 0:
+                # queued in the UART after the previous request
+                now = self._line_free_us
+                gap_us = 0
+            if gap_us < self._t35_us:
+                # the slaves see a single frame
+                self.framing_errors += 1
+                lost = True
+        elif gap_us < 0:
+            self.collisions += 1
+            lost = True
+
+        end_us = utils.ticks_add(now, size * self._char_us)
+        self.requests += 1
+        self.busy_us += size * self._char_us
+        self._line_free_us = end_us
+        self._master_last = True
+        if self.echo:
+            self._schedule(data, now)
+        if lost:
+            return size
+
+        response = self._handle(self._inject(data), end_us)
+        if response is not None:
+            latency_us = max(self._latency_us.get(data[0], self._default_latency_us), self._t35_us)
+            start_us = utils.ticks_add(end_us, latency_us)
+            self._schedule(self._inject(response), start_us)
+            self.responses += 1
+            self.busy_us += len(response) * self._char_us
+            self._line_free_us = utils.ticks_add(start_us, len(response) * self._char_us)
+            self._master_last = False
+        return size
+
+    def any(self):
+        """Returns the number of bytes received and not read yet"""
+        now = utils.ticks_us()
+        index = self._rx_pos
+        rx_us = self._rx_us
+        while index < len(rx_us) and utils.ticks_diff(now, rx_us[index]) >= 0:
+            index += 1
+        return index - self._rx_pos
+
+    def _wait_until(self, ticks):
+        """Wait until ticks_us reaches ticks"""
+        delay_us = utils.ticks_diff(ticks, utils.ticks_us())
+        if delay_us > 2000:
+            # sleep most of it, and spin for accuracy
+            utils.sleep_us(delay_us - 1000)
+        while utils.ticks_diff(ticks, utils.ticks_us()) > 0:
+            pass
+
+    def readinto(self, buf, nbytes=None):
+        """
+        Read up to nbytes bytes into buf, waiting for them no longer than
+        timeout_ms for the first one and timeout_char_ms for the next ones
+        Returns the number of bytes read, None if there is none
+        """
+        if nbytes is None:
+            nbytes = len(buf)
+        count = 0
+        deadline = utils.ticks_add(utils.ticks_us(), self.timeout_ms * 1000)
+        rx_us = self._rx_us
+        while count < nbytes:
+            pos = self._rx_pos
+            if pos == len(rx_us) or utils.ticks_diff(rx_us[pos], deadline) > 0:
+                self._wait_until(deadline)
+                break
+            self._wait_until(rx_us[pos])
+            buf[count] = self._rx[pos]
+            self._rx_pos = pos + 1
+            count += 1
+            deadline = utils.ticks_add(rx_us[pos], self.timeout_char_ms * 1000)
+        return count if count else None
+
+    def read(self, nbytes=None):
+        """Returns up to nbytes bytes, the bytes already received if None. None if there is none"""
+        if nbytes is None:
+            nbytes = self.any()
+            if not nbytes:
+                return None
+        buf = bytearray(nbytes)
+        count = self.readinto(buf, nbytes)
+        return bytes(buf[:count]) if count else None
@@ -0,0 +1,142 @@
+"""
+micropython-modbus: Implementation of Modbus protocol for MicroPython
+https://gitlab.com/extel-open-source
+
+Based on "Modbus TestKit": https://github.com/ljean/modbus-tk
+
+Copyright (C) 2009, Luc Jean - luc.jean@gmail.com
+Copyright (C) 2009, Apidev - http://www.apidev.fr
+Copyright (C) 2018, Extel Technologies - https://gitlab.com/extel-open-source
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+import struct
+from array import array
+
+try:
+    import binascii
+except ImportError:
+    import ubinascii as binascii
+
+try:
+    from micropython import const
+except ImportError:
+    def const(value):
+        return value
+
+from modbus.exceptions import InvalidArgumentError
+from modbus import utils
+
+# Direction of a traced frame
+TRACE_TX = const(0)
+TRACE_RX = const(1)
+
+# Default number of bytes kept for every frame: enough for a read of 30
+# registers, longer frames are truncated
+DEFAULT_FRAME_SIZE = 72
+
+
+class TraceBuffer(object):
+    """
+    Ring buffer of the last frames sent and received by a master
+
+    Everything is allocated by the constructor: recording a frame copies its
+    bytes in a preallocated slot and doesn't format anything. The frames are
+    only formatted by dump. Install it with Master.set_trace
+    """
+
+    def __init__(self, size=32, frame_size=DEFAULT_FRAME_SIZE):
+        """Constructor: keep the last size frames, truncated to frame_size bytes"""
+        if size <= 0 or frame_size <= 0:
+            raise InvalidArgumentError("Invalid trace buffer size {0}x{1}".format(size, frame_size))
+        self.size = size
+        self.frame_size = frame_size
+        self._frames = bytearray(size * frame_size)
+        self._view = memoryview(self._frames)
+        self._timestamps = array("L", [0] * size)
+        self._lengths = array("H", [0] * size)
+        # direction, slave and function of every frame
+        self._headers = bytearray(3 * size)
+        self._next = 0
+        self._count = 0
+
+    def clear(self):
+        """Forget the recorded frames"""
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def record(self, direction, frame, slave_offset=0):
+        """
+        Record a frame. slave_offset is the position of the slave id in the
+        frame, which is followed by the function code
+        """
+        slot = self._next
+        length = len(frame)
+        kept = min(length, self.frame_size)
+        start = slot * self.frame_size
+        self._view[start:start + kept] = frame[:kept]
+        self._timestamps[slot] = utils.ticks_us()
+        self._lengths[slot] = length
+        headers = self._headers
+        headers[3 * slot] = direction
+        if length > slave_offset + 1:
+            headers[3 * slot + 1] = frame[slave_offset]
+            headers[3 * slot + 2] = frame[slave_offset + 1]
+        else:
+            # nothing was received
+            headers[3 * slot + 1] = 0
+            headers[3 * slot + 2] = 0
+        slot += 1
+        self._next = 0 if slot == self.size else slot
+        if self._count < self.size:
+            self._count += 1
+
+    def entries(self):
+        """
+        Yields the recorded frames, from the oldest to the newest, as tuples
+        (timestamp in us, direction, slave, function, frame bytes, frame length)
+        The frame bytes are truncated to frame_size
+        """
+        slot = self._next - self._count
+        if slot < 0:
+            slot += self.size
+        for _ in range(self._count):
+            length = self._lengths[slot]
+            start = slot * self.frame_size
+            (direction, slave, function_code) = struct.unpack_from("BBB", self._headers, 3 * slot)
+            yield (
+                self._timestamps[slot], direction, slave, function_code,
+                bytes(self._view[start:start + min(length, self.frame_size)]), length
+            )
+            slot += 1
+            if slot == self.size:
+                slot = 0
+
+    def dump(self, write=print):
+        """Format the recorded frames, one line per frame passed to write"""
+        first = None
+        for (timestamp, direction, slave, function_code, data, length) in self.entries():
+            if first is None:
+                first = timestamp
+            line = "{0:>10} {1} slave={2} fc={3} {4}".format(
+                utils.ticks_diff(timestamp, first), "->" if direction == TRACE_TX else "<-",
+                slave, function_code, binascii.hexlify(data, " ").decode())
+            if length > len(data):
+                line += " ... ({0} bytes)".format(length)
+            write(line)
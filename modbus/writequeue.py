@@ -0,0 +1,213 @@
+"""
+micropython-modbus: Implementation of Modbus protocol for MicroPython
+https://gitlab.com/extel-open-source
+
+Based on "Modbus TestKit": https://github.com/ljean/modbus-tk
+
+Copyright (C) 2009, Luc Jean - luc.jean@gmail.com
+Copyright (C) 2009, Apidev - http://www.apidev.fr
+Copyright (C) 2018, Extel Technologies - https://gitlab.com/extel-open-source
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+import _thread
+
+try:
+    from micropython import const
+except ImportError:
+    def const(value):
+        return value
+
+from modbus import defines
+from modbus import utils
+from modbus.exceptions import InvalidArgumentError, ModbusInvalidResponseError
+
+# Status of a write
+WRITE_PENDING = const(0)
+WRITE_DONE = const(1)
+WRITE_FAILED = const(2)
+# every value of the write has been replaced by a later write before being sent
+WRITE_SUPERSEDED = const(3)
+
+# function used to write one and several values of each block type, and
+# limit of a single request
+_WRITE_FUNCTIONS = {
+    defines.COILS: (defines.WRITE_SINGLE_COIL, defines.WRITE_MULTIPLE_COILS, defines.MAX_WRITE_BITS),
+    defines.HOLDING_REGISTERS: (
+        defines.WRITE_SINGLE_REGISTER, defines.WRITE_MULTIPLE_REGISTERS, defines.MAX_WRITE_REGISTERS),
+}
+
+
+class PendingWrite(object):
+    """Completion status of a write queued in a WriteQueue"""
+
+    def __init__(self, slave, block_type, address, count):
+        """Constructor"""
+        self.slave = slave
+        self.block_type = block_type
+        self.address = address
+        self.count = count
+        self.status = WRITE_PENDING
+        # the exception of a failed write
+        self.error = None
+        self._remaining = count
+        self._written = False
+
+    def done(self):
+        """Returns True when the write isn't pending anymore"""
+        return self.status != WRITE_PENDING
+
+    def _complete(self, error=None, superseded=False):
+        """One of the values of the write has been written, has failed or has been replaced"""
+        self._remaining -= 1
+        if error is not None:
+            self.status = WRITE_FAILED
+            self.error = error
+        elif not superseded:
+            self._written = True
+        if self._remaining == 0 and self.status == WRITE_PENDING:
+            self.status = WRITE_DONE if self._written else WRITE_SUPERSEDED
+
+    def __repr__(self):
+        return "PendingWrite({0}, {1}, {2}, {3}, status={4})".format(
+            self.slave, self.block_type, self.address, self.count, self.status)
+
+
+class WriteQueue(object):
+    """
+    Buffers the writes of coils and holding registers and sends them with
+    as few requests as possible
+
+    The writes to the same slave and block type are merged by flush into
+    WRITE_MULTIPLE_COILS or WRITE_MULTIPLE_REGISTERS requests covering
+    contiguous addresses, within the limits of a request. When an address is
+    written again before the flush, the last value wins. Every write returns
+    a PendingWrite giving its outcome
+    """
+
+    def __init__(self, master, max_delay_ms=0):
+        """
+        Constructor
+        poll flushes the queue once its oldest write is max_delay_ms old
+        """
+        self.master = master
+        self.max_delay_ms = max_delay_ms
+        # (slave, block type) -> {address: (value, PendingWrite)}
+        self._pending = {}
+        self._first_write_ms = 0
+        self._lock = _thread.allocate_lock()
+        self.requests_sent = 0
+        self.writes_sent = 0
+
+    def _queue(self, slave, block_type, address, values):
+        """Queue the values written from address"""
+        if block_type not in _WRITE_FUNCTIONS:
+            raise InvalidArgumentError("The block type {0} can't be written".format(block_type))
+        if not len(values):
+            raise InvalidArgumentError("No value to write")
+        handle = PendingWrite(slave, block_type, address, len(values))
+        with self._lock:
+            if not self._pending:
+                self._first_write_ms = utils.ticks_ms()
+            writes = self._pending.setdefault((slave, block_type), {})
+            for value in values:
+                previous = writes.get(address)
+                if previous is not None:
+                    previous[1]._complete(superseded=True)
+                writes[address] = (value, handle)
+                address += 1
+        return handle
+
+    def write_register(self, slave, address, value):
+        """Queue the write of a holding register. Returns its PendingWrite"""
+        return self._queue(slave, defines.HOLDING_REGISTERS, address, (value, ))
+
+    def write_registers(self, slave, address, values):
+        """Queue the write of holding registers from address. Returns a PendingWrite"""
+        return self._queue(slave, defines.HOLDING_REGISTERS, address, values)
+
+    def write_coil(self, slave, address, value):
+        """Queue the write of a coil. Returns its PendingWrite"""
+        return self._queue(slave, defines.COILS, address, (value, ))
+
+    def write_coils(self, slave, address, values):
+        """Queue the write of coils from address. Returns a PendingWrite"""
+        return self._queue(slave, defines.COILS, address, values)
+
+    def __len__(self):
+        """Returns the number of addresses waiting to be written"""
+        with self._lock:
+            return sum(len(writes) for writes in self._pending.values())
+
+    def poll(self):
+        """
+        Flush the queue if its oldest write has waited for max_delay_ms
+        Returns the number of requests sent
+        """
+        if not self._pending:
+            return 0
+        if utils.ticks_diff(utils.ticks_ms(), self._first_write_ms) < self.max_delay_ms:
+            return 0
+        return self.flush()
+
+    def flush(self):
+        """
+        Send all the queued writes. Returns the number of requests sent
+        The writes queued meanwhile wait for the next flush
+        """
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+        sent = 0
+        for ((slave, block_type), writes) in pending.items():
+            (single_function, multiple_function, max_count) = _WRITE_FUNCTIONS[block_type]
+            addresses = sorted(writes)
+            start = 0
+            while start < len(addresses):
+                # the longest run of contiguous addresses from start
+                end = start + 1
+                while (end < len(addresses) and end - start < max_count
+                       and addresses[end] == addresses[end - 1] + 1):
+                    end += 1
+                self._send(slave, single_function, multiple_function, addresses[start], [
+                    writes[address] for address in addresses[start:end]])
+                sent += 1
+                start = end
+        return sent
+
+    def _send(self, slave, single_function, multiple_function, address, writes):
+        """Write a run of values from address and complete their writes"""
+        values = [value for (value, handle) in writes]
+        error = None
+        try:
+            if len(values) == 1:
+                response = self.master.execute(slave, single_function, address, output_value=values[0])
+                expected = None
+            else:
+                response = self.master.execute(slave, multiple_function, address, output_value=values)
+                expected = (address, len(values))
+            if slave != 0 and expected is not None and tuple(response) != expected:
+                raise ModbusInvalidResponseError(
+                    "Write response {0} doesn't match the request {1}".format(response, expected))
+            if slave != 0 and expected is None and response[0] != address:
+                raise ModbusInvalidResponseError(
+                    "Write response {0} doesn't match the address {1}".format(response, address))
+        except Exception as excpt:
+            error = excpt
+        self.requests_sent += 1
+        self.writes_sent += len(values)
+        for (value, handle) in writes:
+            handle._complete(error)
@@ -0,0 +1,128 @@
+"""Tests of modbus.broadcast"""
+
+import asyncio
+import unittest
+
+from modbus import defines
+from modbus import modbus_rtu
+from modbus.broadcast import BroadcastQueue
+from modbus.exceptions import InvalidArgumentError, ModbusTimeoutError
+from modbus.simulator import SimulatedBus
+
+
+class StubMaster(object):
+    """Master keeping the requests, failing the ones of the addresses in fail"""
+
+    def __init__(self, fail=(), response=None):
+        self.requests = []
+        self.fail = set(fail)
+        self.response = response
+        self.on_execute = None
+
+    def execute(self, slave, function_code, starting_address, output_value=0):
+        if starting_address in self.fail:
+            raise ModbusTimeoutError("No response from slave")
+        self.requests.append((slave, function_code, starting_address, output_value))
+        if self.on_execute:
+            on_execute = self.on_execute
+            self.on_execute = None
+            on_execute()
+        return self.response
+
+
+class AsyncStubMaster(StubMaster):
+    """StubMaster with execute as a coroutine"""
+
+    async def execute(self, slave, function_code, starting_address, output_value=0):
+        return StubMaster.execute(self, slave, function_code, starting_address, output_value)
+
+
+class TestBroadcastQueue(unittest.TestCase):
+
+    def test_send(self):
+        bus = SimulatedBus(115200, timeout_ms=50)
+        slaves = [bus.add_slave(slave_id) for slave_id in (1, 2)]
+        for slave in slaves:
+            slave.add_block("hr", defines.HOLDING_REGISTERS, 0, 20)
+            slave.add_block("coils", defines.COILS, 0, 16)
+        master = modbus_rtu.RtuMaster(bus, baudrate=115200)
+        queue = BroadcastQueue(master)
+        queue.write_register(5, 1)
+        queue.write_registers(10, (7, 8))
+        queue.write_coil(3, True)
+        queue.write_coils(8, (1, 0, 1))
+        self.assertEqual(len(queue), 4)
+        self.assertEqual(queue.send(), 4)
+        self.assertEqual(len(queue), 0)
+        self.assertEqual(queue.frames_sent, 4)
+        self.assertEqual(bus.requests, 4)
+        # spaced by the silent interval: no request lost
+        self.assertEqual(bus.framing_errors, 0)
+        for slave in slaves:
+            self.assertEqual(slave.get_values("hr", 5, 1), (1, ))
+            self.assertEqual(slave.get_values("hr", 10, 2), (7, 8))
+            self.assertEqual(slave.get_values("coils", 3, 1), (1, ))
+            self.assertEqual(slave.get_values("coils", 8, 3), (1, 0, 1))
+
+    def test_order_and_failure(self):
+        master = StubMaster(fail=(2, ))
+        queue = BroadcastQueue(master)
+        for address in range(4):
+            queue.write_register(address, address)
+        with self.assertRaises(ModbusTimeoutError):
+            queue.send()
+        self.assertEqual([request[2] for request in master.requests], [0, 1])
+        # the failed write and the next ones stay queued, in order
+        self.assertEqual(len(queue), 2)
+        master.fail.clear()
+        self.assertEqual(queue.send(), 2)
+        self.assertEqual([request[2] for request in master.requests], [0, 1, 2, 3])
+        self.assertEqual(master.requests[0][:2], (0, defines.WRITE_SINGLE_REGISTER))
+        self.assertEqual(queue.frames_sent, 4)
+
+    def test_clear_while_sending(self):
+        master = StubMaster()
+        queue = BroadcastQueue(master)
+
+        def requeue():
+            # an equal write, queued again after a clear, must be sent too
+            queue.clear()
+            queue.write_register(1, 5)
+
+        master.on_execute = requeue
+        queue.write_register(1, 5)
+        self.assertEqual(queue.send(), 2)
+        self.assertEqual(len(master.requests), 2)
+        self.assertEqual(len(queue), 0)
+
+    def test_master_answering_unit_id_zero(self):
+        master = StubMaster(response=(5, 1))
+        queue = BroadcastQueue(master)
+        queue.write_register(5, 1)
+        self.assertEqual(queue.send(), 1)
+
+    def test_async(self):
+        master = AsyncStubMaster()
+        queue = BroadcastQueue(master, inter_frame_ms=1)
+        queue.write_register(5, 1)
+        queue.write_coil(6, 0)
+        with self.assertRaises(InvalidArgumentError):
+            queue.send()
+        self.assertEqual(len(queue), 2)
+        self.assertEqual(asyncio.run(queue.async_send()), 2)
+        self.assertEqual(
+            master.requests, [(0, defines.WRITE_SINGLE_REGISTER, 5, 1), (0, defines.WRITE_SINGLE_COIL, 6, 0)])
+
+    def test_invalid_writes(self):
+        queue = BroadcastQueue(StubMaster())
+        with self.assertRaises(InvalidArgumentError):
+            queue.add(defines.READ_HOLDING_REGISTERS, 0, 1)
+        with self.assertRaises(InvalidArgumentError):
+            queue.write_registers(0, ())
+        with self.assertRaises(InvalidArgumentError):
+            queue.write_registers(0, [0] * (defines.MAX_WRITE_REGISTERS + 1))
+        self.assertEqual(len(queue), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
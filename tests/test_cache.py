@@ -0,0 +1,82 @@
+"""Tests of modbus.cache"""
+
+import unittest
+
+from modbus import defines
+from modbus import modbus_rtu
+from modbus.cache import CachingMaster
+from modbus.coils import CoilBits
+from modbus.simulator import SimulatedBus
+
+
+class StubMaster(object):
+    """Master answering the register reads with zeros"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def get_coil_bits(self):
+        return False
+
+    def execute(self, slave, function_code, starting_address, quantity_of_x=0, output_value=0, data_format=""):
+        self.calls += 1
+        return data_format.unpack(bytes(2 * quantity_of_x))
+
+
+class TestCachingMaster(unittest.TestCase):
+
+    def cached(self, cache):
+        return sum(len(entries) for entries in cache._entries.values())
+
+    def test_max_entries_under_one_key(self):
+        cache = CachingMaster(StubMaster(), default_ttl_ms=60000, max_entries=4)
+        for address in range(0, 300, 10):
+            cache.execute(1, defines.READ_HOLDING_REGISTERS, address, 2)
+            self.assertLessEqual(self.cached(cache), 4)
+            self.assertEqual(cache._nb_of_entries, self.cached(cache))
+        self.assertEqual(self.cached(cache), 4)
+
+    def test_max_entries_over_several_keys(self):
+        cache = CachingMaster(StubMaster(), default_ttl_ms=60000, max_entries=3)
+        for slave in range(1, 10):
+            cache.execute(slave, defines.READ_HOLDING_REGISTERS, 0, 2)
+        self.assertEqual(self.cached(cache), 3)
+        self.assertEqual(len(cache._entries), 3)
+
+    def test_hit(self):
+        master = StubMaster()
+        cache = CachingMaster(master, default_ttl_ms=60000)
+        cache.execute(1, defines.READ_HOLDING_REGISTERS, 0, 10)
+        self.assertEqual(cache.execute(1, defines.READ_HOLDING_REGISTERS, 2, 3), (0, 0, 0))
+        self.assertEqual(master.calls, 1)
+
+    def test_invalidate_removes_empty_keys(self):
+        cache = CachingMaster(StubMaster(), default_ttl_ms=60000)
+        cache.execute(1, defines.READ_HOLDING_REGISTERS, 0, 10)
+        cache.execute(1, defines.READ_HOLDING_REGISTERS, 100, 10)
+        cache.execute(2, defines.READ_HOLDING_REGISTERS, 0, 10)
+        cache.invalidate(1, defines.READ_HOLDING_REGISTERS, 5, 1)
+        self.assertEqual(self.cached(cache), 2)
+        cache.invalidate(1)
+        self.assertEqual(list(cache._entries.keys()), [(2, defines.READ_HOLDING_REGISTERS)])
+        cache.clear()
+        self.assertEqual(cache._entries, {})
+        self.assertEqual(cache._nb_of_entries, 0)
+
+    def test_coil_bits(self):
+        bus = SimulatedBus(115200, timeout_ms=50)
+        slave = bus.add_slave(1)
+        slave.add_block("coils", defines.COILS, 0, 32)
+        slave.set_values("coils", 3, (1, 0, 1))
+        master = modbus_rtu.RtuMaster(bus, baudrate=115200)
+        master.set_coil_bits(True)
+        cache = CachingMaster(master, default_ttl_ms=60000)
+        cache.execute(1, defines.READ_COILS, 0, 16)
+        bits = cache.execute(1, defines.READ_COILS, 2, 5)
+        self.assertIsInstance(bits, CoilBits)
+        self.assertEqual(list(bits), [0, 1, 0, 1, 0])
+        self.assertEqual(bus.requests, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+"""Tests of modbus.changes"""
+
+import struct
+import unittest
+
+from modbus import defines
+from modbus import modbus_rtu
+from modbus import regmap
+from modbus.changes import ChangeDetector, _BlockImage
+from modbus.exceptions import MissingKeyError
+from modbus.simulator import SimulatedBus
+
+
+class TestChangeDetector(unittest.TestCase):
+
+    def setUp(self):
+        self.bus = SimulatedBus(115200, timeout_ms=50)
+        self.slave = self.bus.add_slave(1)
+        self.slave.add_block("hr", defines.HOLDING_REGISTERS, 0, 300)
+        self.master = modbus_rtu.RtuMaster(self.bus, baudrate=115200)
+        registers = regmap.RegisterMap(max_gap=4)
+        registers.add_tag("speed", 0)
+        registers.add_tag("power", 2, regmap.UINT32)
+        registers.add_tag("temperature", 10, regmap.INT16, scale=0.1)
+        registers.add_tag("counter", 200)
+        self.detector = ChangeDetector(registers)
+
+    def poll(self):
+        return dict(self.detector.poll(self.master, 1))
+
+    def test_first_poll_reports_all(self):
+        self.slave.set_values("hr", 0, (5, ))
+        self.assertEqual(self.poll(), {"speed": 5, "power": 0, "temperature": 0, "counter": 0})
+        self.assertEqual(self.poll(), {})
+        self.assertEqual(self.detector.get_value(1, "speed"), 5)
+
+    def test_changes_only(self):
+        self.poll()
+        self.slave.set_values("hr", 2, (1, 2))
+        self.slave.set_values("hr", 200, (7, ))
+        self.assertEqual(self.poll(), {"power": 0x10002, "counter": 7})
+        self.assertEqual(self.poll(), {})
+
+    def test_change_back_in_same_bytes(self):
+        self.poll()
+        self.slave.set_values("hr", 3, (1, ))
+        self.assertEqual(self.poll(), {"power": 1})
+        self.slave.set_values("hr", 3, (0, ))
+        self.assertEqual(self.poll(), {"power": 0})
+
+    def test_deadband(self):
+        self.detector.set_deadband("temperature", 1)
+        self.poll()
+        self.slave.set_values("hr", 10, (5, ))
+        self.assertEqual(self.poll(), {})
+        self.slave.set_values("hr", 10, (15, ))
+        self.assertEqual(self.poll(), {"temperature": 1.5})
+        self.slave.set_values("hr", 10, (struct.unpack(">H", struct.pack(">h", -30))[0], ))
+        self.assertEqual(self.poll(), {"temperature": -3.0})
+        with self.assertRaises(MissingKeyError):
+            self.detector.set_deadband("unknown", 1)
+
+    def test_reset(self):
+        self.poll()
+        self.detector.reset(1)
+        self.assertEqual(len(self.poll()), 4)
+        with self.assertRaises(MissingKeyError):
+            self.detector.get_value(2, "speed")
+
+    def test_image_compares_memoryview(self):
+        plan = self.detector._plans[0]
+        image = _BlockImage(plan)
+        data = bytearray(plan.size)
+        self.assertTrue(image.unpack(memoryview(data)))
+        self.assertFalse(image.unpack(memoryview(data)))
+        data[1] = 1
+        self.assertTrue(image.unpack(memoryview(data)))
+        self.assertEqual(image.changed[0], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
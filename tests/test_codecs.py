@@ -0,0 +1,36 @@
+"""Tests of modbus.codecs"""
+
+import struct
+import unittest
+
+from modbus import defines
+from modbus import modbus_rtu
+from modbus.codecs import get_codec
+from modbus.simulator import SimulatedBus
+
+
+class TestReadWriteMultipleRegisters(unittest.TestCase):
+
+    def test_request_write_address(self):
+        pdu = get_codec(defines.READ_WRITE_MULTIPLE_REGISTERS).build_request(10, 2, [7, 8], "", 300)
+        self.assertEqual(
+            struct.unpack(">BHHHHBHH", pdu), (defines.READ_WRITE_MULTIPLE_REGISTERS, 10, 2, 300, 2, 4, 7, 8))
+
+    def test_write_then_read_back(self):
+        bus = SimulatedBus(115200, timeout_ms=100)
+        slave = bus.add_slave(1)
+        slave.add_block("hr", defines.HOLDING_REGISTERS, 0, 200)
+        master = modbus_rtu.RtuMaster(bus, baudrate=115200)
+
+        result = master.execute(
+            1, defines.READ_WRITE_MULTIPLE_REGISTERS, 150, 3, output_value=[11, 12, 13],
+            write_starting_address_fc23=150)
+        self.assertEqual(result, (11, 12, 13))
+        self.assertEqual(slave.get_values("hr", 150, 3), (11, 12, 13))
+        # nothing written at the address of the function code
+        self.assertEqual(slave.get_values("hr", 23, 3), (0, 0, 0))
+        self.assertEqual(master.execute(1, defines.READ_HOLDING_REGISTERS, 149, 5), (0, 11, 12, 13, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+"""Tests of modbus.crc"""
+
+import struct
+import unittest
+
+from modbus import crc
+from modbus import defines
+from modbus import modbus_rtu
+from modbus.exceptions import ModbusInvalidResponseError
+
+DATA = bytes(bytearray((i * 7) & 0xFF for i in range(37)))
+
+
+class StubSerial(object):
+    """UART answering a request with a response, every read returning its next chunk"""
+
+    def __init__(self, chunks):
+        self._response = list(chunks)
+        self._chunks = []
+
+    def any(self):
+        return len(self._chunks[0]) if self._chunks else 0
+
+    def write(self, data):
+        self._chunks = self._response
+        return len(data)
+
+    def readinto(self, buf, nbytes=None):
+        if not self._chunks:
+            return 0
+        chunk = self._chunks.pop(0)
+        buf[:len(chunk)] = chunk
+        return len(chunk)
+
+
+class TestCrc16(unittest.TestCase):
+
+    def test_variants(self):
+        self.assertEqual(crc.crc16_pairs(DATA), crc.crc16_bytewise(DATA))
+        self.assertEqual(crc.crc16_pairs(DATA[:-1]), crc.crc16_bytewise(DATA[:-1]))
+        # the check value of the Modbus CRC16
+        self.assertEqual(crc.crc16(b"123456789"), 0x4B37)
+
+    def test_incremental(self):
+        rx_crc = crc.Crc16()
+        for index in range(0, len(DATA), 5):
+            rx_crc.update(DATA[index:index + 5])
+        self.assertEqual(rx_crc.value(), crc.calculate_crc(DATA))
+        self.assertFalse(rx_crc.is_valid())
+        rx_crc.update(struct.pack("<H", crc.crc16(DATA)))
+        self.assertTrue(rx_crc.is_valid())
+        rx_crc.reset()
+        self.assertEqual(rx_crc.crc, crc.CRC16_INIT)
+
+    def test_check_crc(self):
+        frame = DATA + struct.pack("<H", crc.crc16(DATA))
+        self.assertTrue(crc.check_crc(frame))
+        self.assertFalse(crc.check_crc(frame[:-1] + b"\x00"))
+
+
+class TestRtuMasterCrc(unittest.TestCase):
+
+    def _execute(self, response, chunk_size):
+        chunks = [response[index:index + chunk_size] for index in range(0, len(response), chunk_size)]
+        master = modbus_rtu.RtuMaster(StubSerial(chunks))
+        return master.execute(1, defines.READ_HOLDING_REGISTERS, 0, 2)
+
+    def test_response_in_chunks(self):
+        data = struct.pack(">BBBHH", 1, defines.READ_HOLDING_REGISTERS, 4, 10, 20)
+        response = data + struct.pack("<H", crc.crc16(data))
+        for chunk_size in (1, 3, len(response)):
+            self.assertEqual(self._execute(response, chunk_size), (10, 20))
+
+    def test_invalid_crc(self):
+        data = struct.pack(">BBBHH", 1, defines.READ_HOLDING_REGISTERS, 4, 10, 20)
+        response = data + struct.pack("<H", crc.crc16(data) ^ 1)
+        with self.assertRaises(ModbusInvalidResponseError):
+            self._execute(response, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+"""Tests of modbus.health"""
+
+import time
+import unittest
+
+from modbus import defines
+from modbus import hooks
+from modbus import modbus_rtu
+from modbus.exceptions import (
+    InvalidArgumentError, ModbusError, ModbusTimeoutError, ModbusSlaveOfflineError
+)
+from modbus.health import SlaveHealth, SLAVE_ONLINE, SLAVE_OFFLINE
+from modbus.simulator import SimulatedBus
+
+
+class TestSlaveHealth(unittest.TestCase):
+
+    def test_timeout_estimate(self):
+        health = SlaveHealth(min_timeout_ms=1, max_timeout_ms=100)
+        self.assertEqual(health.get_timeout_ms(1), 100)
+        self.assertEqual(health.get_srtt_ms(1), -1)
+        health.on_response(1, 4000)
+        # srtt + 4 * rttvar, with rttvar half the first response time
+        self.assertEqual(health.get_timeout_ms(1), 12)
+        self.assertEqual(health.get_srtt_ms(1), 4)
+        for unused in range(50):
+            health.on_response(1, 4000)
+        self.assertEqual(health.get_timeout_ms(1), 4)
+        self.assertTrue(health.on_timeout(1))
+        self.assertEqual(health.get_timeout_ms(1), 8)
+        health.reset(1)
+        self.assertEqual(health.get_timeout_ms(1), 100)
+
+    def test_retry_delays(self):
+        health = SlaveHealth()
+        self.assertEqual(
+            [health.get_retry_delay_ms(defines.SLAVE_DEVICE_BUSY, attempt) for attempt in range(4)], [50, 100, 200, -1])
+        self.assertEqual(health.get_retry_delay_ms(defines.ILLEGAL_DATA_ADDRESS, 0), -1)
+        health.set_retries(defines.SLAVE_DEVICE_BUSY, 0)
+        self.assertEqual(health.get_retry_delay_ms(defines.SLAVE_DEVICE_BUSY, 0), -1)
+
+    def test_invalid_settings(self):
+        with self.assertRaises(InvalidArgumentError):
+            SlaveHealth(min_timeout_ms=10, max_timeout_ms=5)
+        with self.assertRaises(InvalidArgumentError):
+            SlaveHealth(offline_after=0)
+
+
+class TestRtuMasterHealth(unittest.TestCase):
+
+    def setUp(self):
+        self.bus = SimulatedBus(115200, timeout_ms=500)
+        for slave_id in (1, 2):
+            slave = self.bus.add_slave(slave_id)
+            slave.add_block("hr", defines.HOLDING_REGISTERS, 0, 10)
+        self.master = modbus_rtu.RtuMaster(self.bus, baudrate=115200)
+        self.health = SlaveHealth(min_timeout_ms=5, max_timeout_ms=20, offline_after=2, probe_interval_ms=50)
+        self.master.set_health(self.health)
+        self.busy_responses = 0
+
+    def read(self, slave):
+        return self.master.execute(slave, defines.READ_HOLDING_REGISTERS, 0, 1)
+
+    def test_adaptive_timeout(self):
+        self.assertEqual(self.master.get_health(), self.health)
+        for unused in range(5):
+            self.assertEqual(self.read(1), (0, ))
+        self.assertEqual(self.health.get_timeout_ms(1), 5)
+        self.assertGreater(self.health.get_srtt_ms(1), 0)
+        # a slave not polled yet gets the longest timeout
+        self.assertEqual(self.health.get_timeout_ms(2), 20)
+
+    def test_offline_and_probe(self):
+        self.read(1)
+        self.bus.set_responding(2, False)
+        for unused in range(2):
+            with self.assertRaises(ModbusTimeoutError):
+                self.read(2)
+        self.assertEqual(self.health.get_state(2), SLAVE_OFFLINE)
+        requests = self.bus.requests
+        start = time.time()
+        with self.assertRaises(ModbusSlaveOfflineError):
+            self.read(2)
+        # not sent, and not waiting for the timeout
+        self.assertEqual(self.bus.requests, requests)
+        self.assertLess(time.time() - start, 0.005)
+        # the other slaves are not affected
+        self.assertEqual(self.read(1), (0, ))
+
+        time.sleep(0.06)
+        with self.assertRaises(ModbusTimeoutError):
+            self.read(2)
+        self.assertEqual(self.bus.requests, requests + 2)
+        self.assertEqual(self.health.get_state(2), SLAVE_OFFLINE)
+
+        self.bus.set_responding(2, True)
+        with self.assertRaises(ModbusSlaveOfflineError):
+            self.read(2)
+        time.sleep(0.06)
+        self.assertEqual(self.read(2), (0, ))
+        self.assertEqual(self.health.get_state(2), SLAVE_ONLINE)
+
+    def test_timeout_retries(self):
+        self.health.timeout_retries = 1
+        self.bus.set_responding(1, False)
+        requests = self.bus.requests
+        with self.assertRaises(ModbusTimeoutError):
+            self.read(1)
+        self.assertEqual(self.bus.requests, requests + 2)
+
+    def _busy_hook(self, args):
+        (slave, request_pdu) = args
+        if self.busy_responses:
+            self.busy_responses -= 1
+            return bytes(bytearray((request_pdu[0] | 0x80, defines.SLAVE_DEVICE_BUSY)))
+        return None
+
+    def test_busy_retries(self):
+        self.health.set_retries(defines.SLAVE_DEVICE_BUSY, 2, 1)
+        self.busy_responses = 2
+        hooks.install_hook("modbus.Slave.handle_request", self._busy_hook)
+        self.addCleanup(hooks.uninstall_hook, "modbus.Slave.handle_request", self._busy_hook)
+        self.assertEqual(self.read(1), (0, ))
+        self.assertEqual(self.bus.requests, 3)
+
+        self.busy_responses = 3
+        with self.assertRaises(ModbusError) as context:
+            self.read(1)
+        self.assertEqual(context.exception.get_exception_code(), defines.SLAVE_DEVICE_BUSY)
+
+
+if __name__ == "__main__":
+    unittest.main()
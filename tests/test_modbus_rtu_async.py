@@ -0,0 +1,107 @@
+"""Tests of modbus.modbus_rtu_async"""
+
+import asyncio
+import struct
+import unittest
+
+from modbus import crc
+from modbus import defines
+from modbus.exceptions import ModbusTimeoutError
+from modbus.metrics import Metrics
+from modbus.modbus_rtu_async import AsyncRtuMaster
+
+
+def make_response(request):
+    """Response to a read of holding registers: the value of a register is its address"""
+    (slave, address, count) = struct.unpack(">BxHH", request[:6])
+    frame = struct.pack(">BBB", slave, defines.READ_HOLDING_REGISTERS, 2 * count)
+    frame += b"".join([struct.pack(">H", address + index) for index in range(count)])
+    return frame + struct.pack("<H", crc.crc16(frame))
+
+
+class DelayedWriter(object):
+    """
+    Writer of a serial line whose slave answers after delays[n] seconds to
+    the n-th request. The response is sent in chunks of chunk_size bytes,
+    gap seconds apart
+    """
+
+    def __init__(self, reader, delays, chunk_size=0, gap=0):
+        self._reader = reader
+        self._delays = list(delays)
+        self._chunk_size = chunk_size
+        self._gap = gap
+
+    def write(self, request):
+        delay = self._delays.pop(0)
+        response = make_response(bytes(request))
+        chunk_size = self._chunk_size or len(response)
+        loop = asyncio.get_event_loop()
+        for (index, offset) in enumerate(range(0, len(response), chunk_size)):
+            loop.call_later(delay + index * self._gap, self._reader.feed_data, response[offset:offset + chunk_size])
+
+    async def drain(self):
+        pass
+
+
+class ReadIntoReader(object):
+    """Stream reader with the readinto method of the uasyncio streams"""
+
+    def __init__(self, reader):
+        self._reader = reader
+
+    async def read(self, count):
+        return await self._reader.read(count)
+
+    async def readinto(self, buf):
+        data = await self._reader.read(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+
+class TestAsyncRtuMaster(unittest.TestCase):
+
+    def test_late_response_discarded(self):
+        async def scenario():
+            reader = asyncio.StreamReader()
+            master = AsyncRtuMaster(reader, DelayedWriter(reader, (0.08, 0.005, 0.005)), timeout_ms=40)
+            with self.assertRaises(ModbusTimeoutError):
+                await master.execute(1, defines.READ_HOLDING_REGISTERS, 0, 2)
+            # the late response to the first request arrives meanwhile
+            await asyncio.sleep(0.1)
+            self.assertEqual(await master.execute(1, defines.READ_HOLDING_REGISTERS, 10, 2), (10, 11))
+            self.assertEqual(await master.execute(1, defines.READ_HOLDING_REGISTERS, 20, 2), (20, 21))
+
+        asyncio.run(scenario())
+
+    def test_response_in_chunks(self):
+        async def scenario(wrap):
+            reader = asyncio.StreamReader()
+            writer = DelayedWriter(reader, (0.005, 0.005), chunk_size=3, gap=0.01)
+            master = AsyncRtuMaster(wrap(reader), writer, timeout_ms=200)
+            self.assertEqual(await master.execute(1, defines.READ_HOLDING_REGISTERS, 0, 4), (0, 1, 2, 3))
+            self.assertEqual(await master.execute(1, defines.READ_HOLDING_REGISTERS, 7, 1), (7, ))
+
+        asyncio.run(scenario(lambda reader: reader))
+        asyncio.run(scenario(ReadIntoReader))
+
+    def test_metrics(self):
+        async def scenario():
+            reader = asyncio.StreamReader()
+            master = AsyncRtuMaster(reader, DelayedWriter(reader, (0.08, 0.01)), timeout_ms=40, baudrate=115200)
+            metrics = Metrics()
+            master.set_metrics(metrics)
+            with self.assertRaises(ModbusTimeoutError):
+                await master.execute(1, defines.READ_HOLDING_REGISTERS, 0, 2)
+            await asyncio.sleep(0.1)
+            self.assertEqual(await master.execute(1, defines.READ_HOLDING_REGISTERS, 10, 2), (10, 11))
+            return metrics.get(1, defines.READ_HOLDING_REGISTERS)
+
+        counters = asyncio.run(scenario())
+        self.assertEqual(counters["requests"], 2)
+        self.assertEqual(counters["timeouts"], 1)
+        self.assertEqual(sum(counters["latency"]["ttfb"]), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+"""Tests of the RTU slave side: Slave, Databank and RtuServer"""
+
+import struct
+import threading
+import time
+import unittest
+
+from modbus import crc
+from modbus import defines
+from modbus.modbus_rtu import RtuServer
+
+
+def make_frame(slave, pdu):
+    data = struct.pack(">B", slave) + pdu
+    return data + struct.pack("<H", crc.crc16(data))
+
+
+class StubSerial(object):
+    """UART of the server: the requests are fed in, the responses written are kept"""
+
+    def __init__(self):
+        self.rx = bytearray()
+        self.written = []
+        self.polls = 0
+
+    def feed(self, frame):
+        self.rx += frame
+
+    def any(self):
+        self.polls += 1
+        return len(self.rx)
+
+    def readinto(self, buf, nbytes=None):
+        count = min(len(self.rx), len(buf) if nbytes is None else nbytes)
+        buf[:count] = self.rx[:count]
+        del self.rx[:count]
+        return count
+
+    def write(self, data):
+        self.written.append(bytes(data))
+        return len(data)
+
+
+class TestRtuServer(unittest.TestCase):
+
+    def setUp(self):
+        self.serial = StubSerial()
+        self.server = RtuServer(self.serial, baudrate=115200)
+        self.slave = self.server.add_slave(1)
+        self.slave.add_block("hr", defines.HOLDING_REGISTERS, 100, 10)
+        self.slave.add_block("coils", defines.COILS, 0, 16)
+        self.other = self.server.add_slave(2)
+        self.other.add_block("hr", defines.HOLDING_REGISTERS, 100, 10)
+
+    def request(self, slave, pdu):
+        """Returns the pdu of the response to a request, None if there is none"""
+        self.serial.feed(make_frame(slave, pdu))
+        self.assertTrue(self.server.serve_once())
+        if not self.serial.written:
+            return None
+        response = self.serial.written.pop()
+        self.assertTrue(crc.check_crc(response))
+        self.assertEqual(response[0], slave)
+        return response[1:-2]
+
+    def test_read_holding_registers(self):
+        self.slave.set_values("hr", 102, (7, 8))
+        self.assertEqual(
+            self.request(1, struct.pack(">BHH", defines.READ_HOLDING_REGISTERS, 101, 3)),
+            struct.pack(">BBHHH", defines.READ_HOLDING_REGISTERS, 6, 0, 7, 8))
+
+    def test_write_multiple_registers(self):
+        pdu = struct.pack(">BHHBHH", defines.WRITE_MULTIPLE_REGISTERS, 105, 2, 4, 1, 2)
+        self.assertEqual(self.request(1, pdu), pdu[:5])
+        self.assertEqual(self.slave.get_values("hr", 105, 2), (1, 2))
+
+    def test_write_coils(self):
+        pdu = struct.pack(">BHHBB", defines.WRITE_MULTIPLE_COILS, 3, 4, 1, 0x0B)
+        self.assertEqual(self.request(1, pdu), pdu[:5])
+        self.assertEqual(self.slave.get_values("coils", 2, 6), (0, 1, 1, 0, 1, 0))
+        self.assertEqual(
+            self.request(1, struct.pack(">BHH", defines.READ_COILS, 3, 4)),
+            struct.pack(">BBB", defines.READ_COILS, 1, 0x0B))
+
+    def test_exceptions(self):
+        self.assertEqual(
+            self.request(1, struct.pack(">BHH", defines.READ_HOLDING_REGISTERS, 108, 3)),
+            struct.pack(">BB", defines.READ_HOLDING_REGISTERS | 0x80, defines.ILLEGAL_DATA_ADDRESS))
+        self.assertEqual(
+            self.request(1, struct.pack(">BHH", defines.READ_INPUT_REGISTERS, 100, 1)),
+            struct.pack(">BB", defines.READ_INPUT_REGISTERS | 0x80, defines.ILLEGAL_DATA_ADDRESS))
+        self.assertEqual(
+            self.request(1, struct.pack(">BHH", 0x41, 0, 1)),
+            struct.pack(">BB", 0x41 | 0x80, defines.ILLEGAL_FUNCTION))
+
+    def test_broadcast(self):
+        self.assertIsNone(self.request(0, struct.pack(">BHH", defines.WRITE_SINGLE_REGISTER, 109, 5)))
+        self.assertEqual(self.slave.get_values("hr", 109, 1), (5, ))
+        self.assertEqual(self.other.get_values("hr", 109, 1), (5, ))
+
+    def test_unknown_slave_and_bad_crc(self):
+        self.assertIsNone(self.request(3, struct.pack(">BHH", defines.READ_HOLDING_REGISTERS, 100, 1)))
+        frame = bytearray(make_frame(1, struct.pack(">BHH", defines.WRITE_SINGLE_REGISTER, 100, 5)))
+        frame[-1] ^= 1
+        self.serial.feed(frame)
+        self.assertTrue(self.server.serve_once())
+        self.assertEqual(self.serial.written, [])
+        self.assertEqual(self.slave.get_values("hr", 100, 1), (0, ))
+
+    def test_serve_forever(self):
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.start()
+        try:
+            time.sleep(0.1)
+            # the idle line is polled about every millisecond, not in a busy loop
+            self.assertLess(self.serial.polls, 200)
+            self.serial.feed(make_frame(1, struct.pack(">BHH", defines.WRITE_SINGLE_REGISTER, 101, 9)))
+            time.sleep(0.05)
+        finally:
+            self.server.stop()
+            thread.join()
+        self.assertEqual(self.slave.get_values("hr", 101, 1), (9, ))
+        self.assertEqual(len(self.serial.written), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
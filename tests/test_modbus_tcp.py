@@ -0,0 +1,102 @@
+"""Tests of modbus.modbus_tcp against a loopback server"""
+
+import socket
+import threading
+import unittest
+
+from modbus import defines
+from modbus.exceptions import ModbusInvalidResponseError
+from modbus.modbus import Slave
+from modbus.modbus_tcp import TcpMaster, TcpQuery, ConnectionPool, read_adu
+
+
+class LoopbackServer(object):
+    """Modbus TCP server whose one slave answers every unit id, 0 included"""
+
+    def __init__(self):
+        self.slave = Slave(1)
+        self.slave.add_block("hr", defines.HOLDING_REGISTERS, 0, 100)
+        self.connections = 0
+        # number of responses sent twice, which desynchronizes the stream
+        self.duplicates = 0
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.listen(4)
+        self.port = self._sock.getsockname()[1]
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                (conn, address) = self._sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            thread = threading.Thread(target=self._serve, args=(conn, ))
+            thread.daemon = True
+            thread.start()
+
+    def _serve(self, conn):
+        query = TcpQuery()
+        out = bytearray(256)
+        with conn:
+            while True:
+                try:
+                    request = read_adu(conn)
+                except OSError:
+                    return
+                if not request:
+                    return
+                (unit_id, request_pdu) = query.parse_request(request)
+                length = self.slave.handle_request(request_pdu, out)
+                response = query.build_response(bytes(out[:length]))
+                if self.duplicates:
+                    self.duplicates -= 1
+                    response += response
+                conn.sendall(response)
+
+    def close(self):
+        self._sock.close()
+
+
+class TestTcpMaster(unittest.TestCase):
+
+    def setUp(self):
+        self.server = LoopbackServer()
+        self.master = TcpMaster(port=self.server.port, timeout_in_sec=1.0, pool=ConnectionPool())
+
+    def tearDown(self):
+        self.master.close()
+        self.server.close()
+
+    def test_unit_id_zero(self):
+        self.assertEqual(self.master.execute(0, defines.WRITE_SINGLE_REGISTER, 5, output_value=42), (5, 42))
+        for unused in range(3):
+            self.assertEqual(self.master.execute(1, defines.READ_HOLDING_REGISTERS, 4, 3), (0, 42, 0))
+        self.assertEqual(self.master.execute(0, defines.READ_HOLDING_REGISTERS, 5, 1), (42, ))
+        # the connection is reused
+        self.assertEqual(self.server.connections, 1)
+
+    def test_stale_response(self):
+        self.server.duplicates = 1
+        self.master.execute(1, defines.READ_HOLDING_REGISTERS, 0, 1)
+        with self.assertRaises(ModbusInvalidResponseError):
+            self.master.execute(1, defines.READ_HOLDING_REGISTERS, 0, 1)
+        # the connection out of sync is not reused
+        self.assertEqual(self.master.execute(1, defines.READ_HOLDING_REGISTERS, 0, 1), (0, ))
+        self.assertEqual(self.server.connections, 2)
+
+    def test_pipelined_unit_id_zero(self):
+        results = self.master.execute_pipelined([
+            (0, defines.WRITE_MULTIPLE_REGISTERS, 10, 0, [1, 2]),
+            (1, defines.READ_HOLDING_REGISTERS, 10, 2),
+            (0, defines.READ_HOLDING_REGISTERS, 11, 1),
+        ])
+        self.assertEqual(results, [(10, 2), (1, 2), (2, )])
+        self.assertEqual(self.master.execute(1, defines.READ_HOLDING_REGISTERS, 10, 1), (1, ))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+"""Tests of modbus.scheduler"""
+
+import time
+import unittest
+
+from modbus import defines
+from modbus import modbus_rtu
+from modbus.exceptions import ModbusError
+from modbus.scheduler import PollGroup, Scheduler
+from modbus.simulator import SimulatedBus
+
+
+class RecordingMaster(modbus_rtu.RtuMaster):
+    """RtuMaster keeping the starting address of every request executed"""
+
+    def __init__(self, serial):
+        super(RecordingMaster, self).__init__(serial, baudrate=115200)
+        self.addresses = []
+
+    def execute(self, slave, function_code, starting_address, *args, **kwargs):
+        self.addresses.append(starting_address)
+        return super(RecordingMaster, self).execute(slave, function_code, starting_address, *args, **kwargs)
+
+
+def read(address, slave=1):
+    return (slave, defines.READ_HOLDING_REGISTERS, address, 1)
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.bus = SimulatedBus(115200, timeout_ms=50)
+        self.slave = self.bus.add_slave(1)
+        self.slave.add_block("hr", defines.HOLDING_REGISTERS, 0, 100)
+        self.master = RecordingMaster(self.bus)
+        self.scheduler = Scheduler(self.master)
+
+    def test_earliest_deadline_first(self):
+        self.scheduler.add_group(PollGroup("slow", 1000, [read(0), read(1), read(2)]))
+        self.assertTrue(self.scheduler.run_once())
+        # released after the slow group, but due much earlier
+        self.scheduler.add_group(PollGroup("fast", 1000, [read(10)], deadline_ms=20))
+        while self.scheduler.run_once():
+            pass
+        self.assertEqual(self.master.addresses, [0, 10, 1, 2])
+
+    def test_results_and_callback(self):
+        done = []
+        self.slave.set_values("hr", 5, (55, ))
+        group = PollGroup("group", 1000, [read(5), read(200)], callback=done.append)
+        self.scheduler.add_group(group)
+        while self.scheduler.run_once():
+            pass
+        self.assertEqual(done, [group])
+        self.assertEqual(group.results[0], (55, ))
+        self.assertIsInstance(group.results[1], ModbusError)
+        self.assertEqual(group.stats()["runs"], 1)
+        self.assertEqual(group.stats()["errors"], 1)
+
+    def test_missed_periods(self):
+        group = PollGroup("group", 100, [read(0)])
+        self.scheduler.add_group(group)
+        self.scheduler.run_once()
+        # the periods released at 100 and 200 ms go by without a poll
+        time.sleep(0.25)
+        self.scheduler.run_once()
+        self.assertEqual(group.overruns, 1)
+        self.assertEqual(group.runs, 2)
+
+    def test_deadline_overrun(self):
+        self.bus.set_latency(1, 10)
+        group = PollGroup("group", 1000, [read(0)], deadline_ms=5)
+        self.scheduler.add_group(group)
+        self.scheduler.run_once()
+        self.assertEqual(group.runs, 1)
+        self.assertEqual(group.overruns, 1)
+        self.assertGreaterEqual(group.max_latency_us, 10000)
+
+    def test_background(self):
+        periodic = PollGroup("periodic", 40, [read(0)])
+        background = PollGroup("background", 0, [read(50), read(51)])
+        self.scheduler.add_group(periodic)
+        self.scheduler.add_group(background)
+        self.scheduler.run(duration_ms=100)
+        self.assertEqual(periodic.runs, 3)
+        self.assertEqual(periodic.overruns, 0)
+        self.assertGreater(background.runs, 3)
+
+    def test_run_without_group(self):
+        start = time.time()
+        self.scheduler.run()
+        self.assertLess(time.time() - start, 0.05)
+
+    def test_run_duration(self):
+        self.scheduler.add_group(PollGroup("group", 1000, [read(0)]))
+        start = time.time()
+        self.scheduler.run(duration_ms=50)
+        self.assertLess(time.time() - start, 0.2)
+        self.assertEqual(self.master.addresses, [0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+"""Tests of modbus.writequeue"""
+
+import time
+import unittest
+
+from modbus import defines
+from modbus import modbus_rtu
+from modbus.exceptions import InvalidArgumentError, ModbusError
+from modbus.simulator import SimulatedBus
+from modbus.writequeue import WriteQueue, WRITE_PENDING, WRITE_DONE, WRITE_FAILED, WRITE_SUPERSEDED
+
+
+class TestWriteQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.bus = SimulatedBus(115200, timeout_ms=50)
+        self.slave = self.bus.add_slave(1)
+        self.slave.add_block("hr", defines.HOLDING_REGISTERS, 0, 300)
+        self.slave.add_block("coils", defines.COILS, 0, 64)
+        self.master = modbus_rtu.RtuMaster(self.bus, baudrate=115200)
+        self.queue = WriteQueue(self.master)
+
+    def test_adjacent_writes_merged(self):
+        handles = [
+            self.queue.write_register(1, 11, 2),
+            self.queue.write_register(1, 10, 1),
+            self.queue.write_registers(1, 12, (3, 4)),
+        ]
+        self.assertEqual(len(self.queue), 4)
+        self.assertEqual(self.queue.flush(), 1)
+        self.assertEqual(self.bus.requests, 1)
+        self.assertEqual(self.slave.get_values("hr", 10, 4), (1, 2, 3, 4))
+        self.assertEqual([handle.status for handle in handles], [WRITE_DONE] * 3)
+        self.assertEqual(len(self.queue), 0)
+        self.assertEqual(self.queue.flush(), 0)
+
+    def test_runs(self):
+        self.queue.write_registers(1, 0, (1, 2))
+        self.queue.write_register(1, 5, 3)
+        self.queue.write_coils(1, 8, (1, 1))
+        self.queue.write_coil(1, 10, 1)
+        self.assertEqual(self.queue.flush(), 3)
+        self.assertEqual(self.slave.get_values("hr", 0, 6), (1, 2, 0, 0, 0, 3))
+        self.assertEqual(self.slave.get_values("coils", 7, 5), (0, 1, 1, 1, 0))
+        self.assertEqual(self.queue.requests_sent, 3)
+        self.assertEqual(self.queue.writes_sent, 6)
+
+    def test_request_limit(self):
+        count = defines.MAX_WRITE_REGISTERS + 7
+        handle = self.queue.write_registers(1, 0, list(range(count)))
+        self.assertEqual(self.queue.flush(), 2)
+        self.assertEqual(self.slave.get_values("hr", 0, count), tuple(range(count)))
+        self.assertEqual(handle.status, WRITE_DONE)
+
+    def test_last_write_wins(self):
+        first = self.queue.write_register(1, 5, 1)
+        second = self.queue.write_register(1, 5, 2)
+        self.assertEqual(first.status, WRITE_SUPERSEDED)
+        self.assertEqual(second.status, WRITE_PENDING)
+        partial = self.queue.write_registers(1, 20, (1, 2))
+        self.queue.write_register(1, 21, 9)
+        self.assertEqual(partial.status, WRITE_PENDING)
+        self.queue.flush()
+        self.assertEqual(self.slave.get_values("hr", 5, 1), (2, ))
+        self.assertEqual(self.slave.get_values("hr", 20, 2), (1, 9))
+        self.assertEqual(first.status, WRITE_SUPERSEDED)
+        self.assertEqual(second.status, WRITE_DONE)
+        self.assertEqual(partial.status, WRITE_DONE)
+
+    def test_failure(self):
+        handle = self.queue.write_registers(1, 299, (1, 2))
+        other = self.queue.write_register(1, 0, 1)
+        self.assertEqual(self.queue.flush(), 2)
+        self.assertEqual(handle.status, WRITE_FAILED)
+        self.assertIsInstance(handle.error, ModbusError)
+        self.assertEqual(other.status, WRITE_DONE)
+
+    def test_poll_delay(self):
+        queue = WriteQueue(self.master, max_delay_ms=30)
+        self.assertEqual(queue.poll(), 0)
+        queue.write_register(1, 0, 1)
+        self.assertEqual(queue.poll(), 0)
+        time.sleep(0.04)
+        self.assertEqual(queue.poll(), 1)
+        self.assertEqual(self.slave.get_values("hr", 0, 1), (1, ))
+
+    def test_invalid_writes(self):
+        with self.assertRaises(InvalidArgumentError):
+            self.queue.write_registers(1, 0, ())
+        with self.assertRaises(InvalidArgumentError):
+            self.queue._queue(1, defines.ANALOG_INPUTS, 0, (1, ))
+
+
+if __name__ == "__main__":
+    unittest.main()